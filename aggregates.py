@@ -0,0 +1,611 @@
+import os
+
+import numpy as np
+
+from completeness import HOUR_MS
+from outputs import npz_bytes, write_file
+from panels import HourlyPanel
+from schema import coin_codes, hour_key
+from timeseries import TimeSeriesStore
+
+
+class RollingWindows:
+    """
+    Running per-coin sums and counts of one column over trailing hour windows.
+
+    Every window ends at `end_hour` (exclusive). The last `max(windows)`
+    hours of values are kept in a ring buffer indexed by `hour % ring_hours`,
+    so when the windows move forward the hours leaving each window can be
+    subtracted without touching the store. Updating with new hours costs
+    O(coins x windows) per hour regardless of how much history exists.
+
+    The state is persisted as a .npz file next to the data it summarizes.
+    """
+
+    # Per-coin arrays (coins on the last axis) saved with the state
+    STATE_ARRAYS = ('ring', 'ring_valid', 'sums', 'counts')
+
+    def __init__(self, path, column, windows):
+        self.path = path
+        self.column = column
+        self.windows = np.asarray(windows, dtype=np.int64)
+        self.ring_hours = int(self.windows.max())
+        self._reset()
+        self.loaded = False
+        if os.path.exists(path):
+            self._load()
+
+    def _reset(self):
+        self.coins = []
+        self._ids = {}
+        self.end_hour = None
+        self.ring = np.zeros((self.ring_hours, 0), dtype=np.float64)
+        self.ring_valid = np.zeros((self.ring_hours, 0), dtype=bool)
+        self.sums = np.zeros((len(self.windows), 0), dtype=np.float64)
+        self.counts = np.zeros((len(self.windows), 0), dtype=np.int64)
+
+    def _load(self):
+        with np.load(self.path, allow_pickle=False) as npz:
+            if str(npz['column']) != self.column or not np.array_equal(npz['windows'], self.windows):
+                # Different windows; the state is rebuilt from the store instead
+                return
+            self.coins = [str(coin) for coin in npz['coins']]
+            self.end_hour = int(npz['end_hour'])
+            for name in self.STATE_ARRAYS:
+                setattr(self, name, npz[name])
+        self._ids = {coin: i for i, coin in enumerate(self.coins)}
+        self.loaded = True
+
+    def save(self):
+        if self.end_hour is None:
+            return
+        # Uncompressed: the ring of float values barely compresses and is rewritten every run
+        write_file(self.path, npz_bytes({
+            'column': np.array(self.column),
+            'windows': self.windows,
+            'coins': np.array(self.coins, dtype='U'),
+            'end_hour': np.int64(self.end_hour),
+            **{name: getattr(self, name) for name in self.STATE_ARRAYS},
+        }, compress=False))
+
+    # ---------------- updates ----------------
+
+    def _coin_ids(self, coins):
+        new_coins = [coin for coin in dict.fromkeys(coins) if coin not in self._ids]
+        if new_coins:
+            for coin in new_coins:
+                self._ids[coin] = len(self.coins)
+                self.coins.append(coin)
+            pad = ((0, 0), (0, len(new_coins)))
+            for name in self.STATE_ARRAYS:
+                setattr(self, name, np.pad(getattr(self, name), pad))
+        return np.array([self._ids[coin] for coin in coins], dtype=np.int64)
+
+    def _advance(self, end_hour):
+        # Move every window forward so it ends at end_hour
+        if self.end_hour is None:
+            self.end_hour = end_hour
+            return
+        shift = end_hour - self.end_hour
+        if shift <= 0:
+            return
+        if shift >= self.ring_hours:
+            for name in self.STATE_ARRAYS:
+                getattr(self, name)[:] = 0
+            self.end_hour = end_hour
+            return
+        # Subtract the hours that leave each window
+        for i, window in enumerate(self.windows):
+            slots = np.arange(self.end_hour - window, self.end_hour - window + shift) % self.ring_hours
+            self.sums[i] -= self.ring[slots].sum(axis=0)
+            self.counts[i] -= self.ring_valid[slots].sum(axis=0)
+        # The slots of the oldest hours are reused for the new ones
+        slots = np.arange(self.end_hour, end_hour) % self.ring_hours
+        self.ring[slots] = 0
+        self.ring_valid[slots] = False
+        self.end_hour = end_hour
+        # Empty windows are exactly zero, whatever rounding accumulated
+        self.sums[self.counts == 0] = 0
+
+    def update(self, df):
+        """
+        Add rows to the state, moving the windows forward to the latest hour.
+
+        Rows for hours already seen replace the earlier value; rows older than
+        the longest window are ignored.
+
+        Args:
+            df: DataFrame with 'coin', 'time' (ms) and the state's column
+
+        Returns:
+            Number of rows applied
+        """
+        if df is None or df.empty:
+            return 0
+        symbols, codes = coin_codes(df['coin'])
+        series = TimeSeriesStore.from_arrays(codes, df['time'].to_numpy(dtype=np.int64), {
+            'value': np.nan_to_num(df[self.column].to_numpy(dtype=np.float64))})
+        # Several rows in one hour (exchange timestamp jitter): the latest one wins
+        series = series.take(series.last_per_hour())
+        hours = series.times // HOUR_MS
+
+        self._advance(int(hours.max()) + 1)
+        inside = hours >= self.end_hour - self.ring_hours
+        if not inside.any():
+            return 0
+
+        used, inverse = np.unique(series.coins[inside], return_inverse=True)
+        ids = self._coin_ids([symbols[i] for i in used])[inverse]
+        self._apply(hours[inside], ids, series.columns['value'][inside])
+        return int(inside.sum())
+
+    def _apply(self, hours, ids, values):
+        # Write one value per (hour, coin) into the ring and the window sums
+        slots = hours % self.ring_hours
+        delta = values - self.ring[slots, ids]
+        added = (~self.ring_valid[slots, ids]).astype(np.int64)
+        self.ring[slots, ids] = values
+        self.ring_valid[slots, ids] = True
+        for i, window in enumerate(self.windows):
+            inside = hours >= self.end_hour - window
+            np.add.at(self.sums[i], ids[inside], delta[inside])
+            np.add.at(self.counts[i], ids[inside], added[inside])
+
+    # ---------------- syncing with a store ----------------
+
+    def pending_from(self, index):
+        """
+        Return the first hour (epoch hours) the completeness index has that the
+        state has not seen yet, or None if the state should be rebuilt instead.
+        """
+        if self.end_hour is None or index is None or not index.loaded:
+            return None
+        start_hour = self.end_hour - self.ring_hours
+        pending = self.end_hour
+        hour_slots = np.arange(start_hour, self.end_hour) % self.ring_hours
+        for coin in index.coins:
+            present = index.present(coin, start_hour, self.end_hour)
+            coin_id = self._ids.get(coin)
+            seen = self.ring_valid[hour_slots, coin_id] if coin_id is not None else np.zeros_like(present)
+            unseen = np.flatnonzero(present & ~seen)
+            if len(unseen):
+                pending = min(pending, start_hour + int(unseen[0]))
+        return pending
+
+    def refresh(self, store):
+        """
+        Bring the state up to date with a store, reading only the hours it has
+        not seen (new hours and repaired holes inside the windows).
+
+        Returns:
+            Number of rows applied
+        """
+        pending = self.pending_from(store.index)
+        if pending is None:
+            return self.rebuild(store)
+        return self.update(store.read(start_ms=pending * HOUR_MS, columns=['coin', 'time', self.column]))
+
+    def rebuild(self, store):
+        """
+        Recompute the state from scratch from the store's latest hours.
+
+        Returns:
+            Number of rows applied
+        """
+        self._reset()
+        latest_ms = store.max_time()
+        if latest_ms is None:
+            return 0
+        start_ms = (latest_ms // HOUR_MS + 1 - self.ring_hours) * HOUR_MS
+        return self.update(store.read(start_ms=start_ms, columns=['coin', 'time', self.column]))
+
+    def verify(self, store):
+        """
+        Compare the running sums and counts with a full recomputation from the store.
+
+        Returns:
+            Tuple of (number of differing sums, number of differing counts)
+        """
+        if self.end_hour is None:
+            return 0, 0
+        df = store.read(start_ms=(self.end_hour - self.ring_hours) * HOUR_MS, end_ms=self.end_hour * HOUR_MS,
+                        columns=['coin', 'time', self.column])
+        panel = HourlyPanel.from_frame(df, [self.column])
+        ids = self._coin_ids(panel.coins.tolist())
+        sums = panel.window_sums(self.column, self.end_hour, self.windows)
+        counts = panel.window_counts(self.end_hour, self.windows)
+
+        expected_counts = np.zeros_like(self.counts)
+        expected_counts[:, ids] = counts
+        expected_sums = np.zeros_like(self.sums)
+        expected_sums[:, ids] = sums
+        differing_sums = ~np.isclose(self.sums, expected_sums, rtol=1e-9, atol=1e-12)
+        return int(differing_sums.sum()), int((self.counts != expected_counts).sum())
+
+    # ---------------- results ----------------
+
+    def latest(self):
+        """
+        Return (values, valid) for every coin at the last hour of the windows.
+        """
+        slot = (self.end_hour - 1) % self.ring_hours
+        return self.ring[slot], self.ring_valid[slot]
+
+
+class WindowIndex:
+    """
+    Per-coin running totals of one column on the hour grid.
+
+    Row i of `sums` holds every coin's total over the hours [start_hour,
+    start_hour + i) and row i of `counts` the number of those hours that have
+    a row, so the sum and completeness of any window [h0, h1) inside the
+    index, for one coin or all of them, is two lookups and a subtraction.
+    Unlike RollingWindows the windows are not fixed in advance.
+
+    The totals cover the last `max_hours` hours. New hours and repaired holes
+    are folded in by recomputing the totals from the first changed hour on.
+    The index is persisted as a .npz file next to the data it summarizes.
+    """
+
+    def __init__(self, path, column, max_hours):
+        self.path = path
+        self.column = column
+        self.max_hours = int(max_hours)
+        self._reset()
+        self.loaded = False
+        if os.path.exists(path):
+            self._load()
+
+    def _reset(self):
+        self.coins = []
+        self._ids = {}
+        self.start_hour = None
+        self.sums = np.zeros((1, 0), dtype=np.float64)
+        self.counts = np.zeros((1, 0), dtype=np.int32)
+
+    def _load(self):
+        with np.load(self.path, allow_pickle=False) as npz:
+            if str(npz['column']) != self.column or int(npz['max_hours']) != self.max_hours:
+                # Different span; the index is rebuilt from the store instead
+                return
+            self.coins = [str(coin) for coin in npz['coins']]
+            self.start_hour = int(npz['start_hour'])
+            self.sums = npz['sums']
+            self.counts = npz['counts']
+        self._ids = {coin: i for i, coin in enumerate(self.coins)}
+        self.loaded = True
+
+    def save(self):
+        if self.start_hour is None:
+            return
+        # Uncompressed: running totals barely compress and are rewritten every run
+        write_file(self.path, npz_bytes({
+            'column': np.array(self.column),
+            'max_hours': np.int64(self.max_hours),
+            'coins': np.array(self.coins, dtype='U'),
+            'start_hour': np.int64(self.start_hour),
+            'sums': self.sums,
+            'counts': self.counts,
+        }, compress=False))
+
+    @property
+    def end_hour(self):
+        # Exclusive end of the hours covered, in epoch hours
+        return None if self.start_hour is None else self.start_hour + self.sums.shape[0] - 1
+
+    # ---------------- updates ----------------
+
+    def _coin_ids(self, coins):
+        new_coins = [coin for coin in dict.fromkeys(coins) if coin not in self._ids]
+        if new_coins:
+            for coin in new_coins:
+                self._ids[coin] = len(self.coins)
+                self.coins.append(coin)
+            pad = ((0, 0), (0, len(new_coins)))
+            self.sums = np.pad(self.sums, pad)
+            self.counts = np.pad(self.counts, pad)
+        return np.array([self._ids[coin] for coin in coins], dtype=np.int64)
+
+    def update(self, df, from_hour):
+        """
+        Replace the totals from `from_hour` on with the rows of df, which must
+        hold every stored row from that hour on.
+
+        Args:
+            df: DataFrame with 'coin', 'time' (ms) and the index's column
+            from_hour: First hour (epoch hours) df covers
+
+        Returns:
+            Number of rows applied
+        """
+        if self.start_hour is None:
+            self.start_hour = from_hour
+        from_hour = min(max(from_hour, self.start_hour), self.end_hour)
+        if df is not None and not df.empty:
+            df = df[hour_key(df['time']) >= from_hour]
+        if df is None or df.empty:
+            return 0
+
+        panel = HourlyPanel.from_frame(df.sort_values('time', kind='stable'), [self.column])
+        ids = self._coin_ids(panel.coins.tolist())
+        end_hour = max(self.end_hour, panel.end_hour)
+
+        # Totals up to from_hour stay; everything after is recomputed from the rows
+        row = from_hour - self.start_hour
+        values = np.zeros((end_hour - from_hour, len(self.coins)), dtype=np.float64)
+        valid = np.zeros((end_hour - from_hour, len(self.coins)), dtype=np.int32)
+        offset = panel.start_hour - from_hour
+        values[offset:offset + panel.valid.shape[0], ids] = panel.values[self.column]
+        valid[offset:offset + panel.valid.shape[0], ids] = panel.valid
+        sums = np.empty((row + 1 + len(values), len(self.coins)), dtype=np.float64)
+        counts = np.empty((row + 1 + len(values), len(self.coins)), dtype=np.int32)
+        sums[:row + 1] = self.sums[:row + 1]
+        counts[:row + 1] = self.counts[:row + 1]
+        np.cumsum(values, axis=0, out=sums[row + 1:])
+        np.cumsum(valid, axis=0, out=counts[row + 1:])
+        sums[row + 1:] += sums[row]
+        counts[row + 1:] += counts[row]
+
+        # Drop the hours that fell out of the span; windows only use differences
+        drop = max(0, sums.shape[0] - 1 - self.max_hours)
+        self.sums = sums[drop:]
+        self.counts = counts[drop:]
+        self.start_hour += drop
+        return int(panel.valid.sum())
+
+    # ---------------- syncing with a store ----------------
+
+    def pending_from(self, index):
+        """
+        Return the first hour (epoch hours) the completeness index has that the
+        totals have not seen yet, or None if the index should be rebuilt instead.
+        """
+        if self.start_hour is None or index is None or not index.loaded:
+            return None
+        pending = self.end_hour
+        seen = np.diff(self.counts, axis=0).astype(bool)
+        for coin in index.coins:
+            present = index.present(coin, self.start_hour, self.end_hour)
+            coin_id = self._ids.get(coin)
+            coin_seen = seen[:, coin_id] if coin_id is not None else np.zeros_like(present)
+            unseen = np.flatnonzero(present & ~coin_seen)
+            if len(unseen):
+                pending = min(pending, self.start_hour + int(unseen[0]))
+        return pending
+
+    def refresh(self, store):
+        """
+        Bring the totals up to date with a store, reading only from the first
+        hour they have not seen (new hours or a repaired hole).
+
+        Returns:
+            Number of rows applied
+        """
+        pending = self.pending_from(store.index)
+        if pending is None:
+            return self.rebuild(store)
+        return self.update(store.read(start_ms=pending * HOUR_MS, columns=['coin', 'time', self.column]), pending)
+
+    def rebuild(self, store):
+        """
+        Recompute the totals from scratch from the store's latest hours.
+
+        Returns:
+            Number of rows applied
+        """
+        self._reset()
+        latest_ms = store.max_time()
+        if latest_ms is None:
+            return 0
+        start_hour = latest_ms // HOUR_MS + 1 - self.max_hours
+        return self.update(store.read(start_ms=start_hour * HOUR_MS, columns=['coin', 'time', self.column]),
+                           start_hour)
+
+    def verify(self, store):
+        """
+        Compare the totals of every hour with a recomputation from the store.
+
+        Returns:
+            Tuple of (number of differing sums, number of differing counts)
+        """
+        if self.start_hour is None:
+            return 0, 0
+        df = store.read(start_ms=self.start_hour * HOUR_MS, end_ms=self.end_hour * HOUR_MS,
+                        columns=['coin', 'time', self.column])
+        expected = WindowIndex('', self.column, self.max_hours)
+        expected.update(df, self.start_hour)
+        ids = self._coin_ids(expected.coins)
+        # Trailing hours without rows leave the recomputed totals shorter
+        rows = np.minimum(np.arange(self.sums.shape[0]), expected.sums.shape[0] - 1)
+        expected_sums = np.zeros_like(self.sums)
+        expected_counts = np.zeros_like(self.counts)
+        expected_sums[:, ids] = expected.sums[rows]
+        expected_counts[:, ids] = expected.counts[rows]
+        differing_sums = ~np.isclose(self.sums, expected_sums, rtol=1e-9, atol=1e-12)
+        return int(differing_sums.sum()), int((self.counts != expected_counts).sum())
+
+    # ---------------- results ----------------
+
+    def window(self, start_hour, end_hour, coins=None):
+        """
+        Sum and count the column over the hours [start_hour, end_hour).
+        Hours outside the index count as missing.
+
+        Args:
+            coins: Coin symbols to return (all coins if not given; unknown coins get zeros)
+
+        Returns:
+            Tuple of (sums, counts) arrays, one value per coin
+        """
+        hours = self.sums.shape[0] - 1
+        lo = int(np.clip(start_hour - self.start_hour, 0, hours))
+        hi = int(np.clip(end_hour - self.start_hour, lo, hours))
+        sums = self.sums[hi] - self.sums[lo]
+        counts = self.counts[hi] - self.counts[lo]
+        if coins is None:
+            return sums, counts
+        cols = np.array([self._ids.get(coin, -1) for coin in coins], dtype=np.int64)
+        known = cols >= 0
+        return np.where(known, sums[cols], 0.0), np.where(known, counts[cols], 0)
+
+    def windows(self, end_hour, lengths):
+        """
+        Sum and count the column over the windows [end_hour - length, end_hour)
+        for each length.
+
+        Returns:
+            Tuple of (sums, counts) arrays of shape (len(lengths), len(coins))
+        """
+        lengths = np.atleast_1d(np.asarray(lengths, dtype=np.int64))
+        hours = self.sums.shape[0] - 1
+        hi = np.clip(end_hour - self.start_hour, 0, hours)
+        lo = np.clip(end_hour - lengths - self.start_hour, 0, hours)
+        return self.sums[hi] - self.sums[lo], (self.counts[hi] - self.counts[lo]).astype(np.int64)
+
+    def latest(self):
+        """
+        Return (values, valid) for every coin at the last hour of the index.
+        """
+        return self.sums[-1] - self.sums[-2], (self.counts[-1] - self.counts[-2]).astype(bool)
+
+
+def _batch_moments(ids, values, size):
+    # Count, mean and sum of squared deviations of the values of each coin (two passes)
+    n = np.bincount(ids, minlength=size)
+    totals = np.bincount(ids, weights=values, minlength=size)
+    mean = np.divide(totals, n, out=np.zeros(size), where=n > 0)
+    m2 = np.bincount(ids, weights=(values - mean[ids]) ** 2, minlength=size)
+    return n, mean, m2
+
+
+def _merge_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    # Moments of the union of two sets of values (Chan et al.'s pairwise form of Welford's update)
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    weight = np.divide(n_b, n, out=np.zeros(len(n)), where=n > 0)
+    return n, mean_a + delta * weight, m2_a + m2_b + delta ** 2 * n_a * weight
+
+
+def _remove_moments(n, mean, m2, n_b, mean_b, m2_b):
+    # Moments left after taking a subset of values out (the inverse of _merge_moments)
+    n_a = n - n_b
+    mean_a = np.divide(n * mean - n_b * mean_b, n_a, out=np.zeros(len(n)), where=n_a > 0)
+    mean_a = np.where(n_b > 0, mean_a, mean)
+    delta = mean_b - mean_a
+    weight = np.divide(n_b, n, out=np.zeros(len(n)), where=n > 0)
+    m2_a = np.maximum(m2 - m2_b - delta ** 2 * n_a * weight, 0)
+    # A coin left without values is exactly empty, whatever rounding accumulated
+    return n_a, np.where(n_a > 0, mean_a, 0), np.where(n_a > 0, m2_a, 0)
+
+
+class CarryStats(RollingWindows):
+    """
+    Per-coin distribution statistics of one column over a trailing window.
+
+    The mean and sum of squared deviations of every coin's values are kept
+    with online updates (Welford's algorithm, applied a batch of hours at a
+    time): values entering the window are merged in and values leaving it
+    are taken out again, so moving forward an hour costs O(coins). The
+    values themselves sit in the RollingWindows ring buffer, which the
+    quantiles and sign streaks are read from.
+
+    Args:
+        path: .npz file the state is persisted in
+        column: Column the statistics describe
+        window_hours: Length of the trailing window in hours
+    """
+
+    STATE_ARRAYS = RollingWindows.STATE_ARRAYS + ('means', 'm2')
+
+    # Standard deviations at or below this are treated as zero (a constant rate
+    # leaves only rounding noise), so ratios against them are left empty
+    STD_FLOOR = 1e-12
+
+    def __init__(self, path, column, window_hours):
+        super().__init__(path, column, [window_hours])
+
+    def _reset(self):
+        super()._reset()
+        self.means = np.zeros((1, 0), dtype=np.float64)
+        self.m2 = np.zeros((1, 0), dtype=np.float64)
+
+    def _take_out(self, ids, values):
+        n_b, mean_b, m2_b = _batch_moments(ids, values, len(self.coins))
+        _, self.means[0], self.m2[0] = _remove_moments(self.counts[0], self.means[0], self.m2[0], n_b, mean_b, m2_b)
+        return n_b
+
+    def _advance(self, end_hour):
+        if self.end_hour is not None and 0 < end_hour - self.end_hour < self.ring_hours:
+            # The hours leaving the window are the ring slots about to be reused
+            slots = np.arange(self.end_hour, end_hour) % self.ring_hours
+            hours, ids = np.nonzero(self.ring_valid[slots])
+            self._take_out(ids, self.ring[slots[hours], ids])
+        super()._advance(end_hour)
+
+    def _apply(self, hours, ids, values):
+        slots = hours % self.ring_hours
+        # A value for an hour already in the window replaces the earlier one
+        replaced = self.ring_valid[slots, ids]
+        n = self.counts[0] - self._take_out(ids[replaced], self.ring[slots[replaced], ids[replaced]])
+        _, self.means[0], self.m2[0] = _merge_moments(n, self.means[0], self.m2[0],
+                                                      *_batch_moments(ids, values, len(self.coins)))
+        super()._apply(hours, ids, values)
+
+    def verify(self, store):
+        """
+        Compare the window sums and counts with a full recomputation from the
+        store, and the running moments with a direct computation from the window.
+
+        Returns:
+            Tuple of (number of differing sums and moments, number of differing counts)
+        """
+        differing_sums, differing_counts = super().verify(store)
+        counts = self.ring_valid.sum(axis=0)
+        values = np.where(self.ring_valid, self.ring, 0)
+        means = np.divide(values.sum(axis=0), counts, out=np.zeros(len(self.coins)), where=counts > 0)
+        m2 = (np.where(self.ring_valid, self.ring - means, 0) ** 2).sum(axis=0)
+        differing = (~np.isclose(self.means[0], means, rtol=1e-9, atol=1e-15)
+                     | ~np.isclose(self.m2[0], m2, rtol=1e-6, atol=1e-18))
+        return differing_sums + int(differing.sum()), differing_counts
+
+    # ---------------- results ----------------
+
+    def stats(self, min_points, quantiles=(0.1, 0.5, 0.9)):
+        """
+        Summarize every coin's window.
+
+        Args:
+            min_points: Values a coin needs in the window for the mean, std,
+                z-score, carry/vol ratio and quantiles (NaN otherwise)
+            quantiles: Quantile levels to compute
+
+        Returns:
+            Dict of arrays aligned with `coins`: 'mean', 'std' (sample standard
+            deviation), 'zscore' (latest value against the window), 'carry_vol'
+            (mean / std), 'streak' (consecutive latest hours with the sign of the
+            latest value, negative for a run of negative values) and
+            'quantiles' (shape (len(quantiles), coins))
+        """
+        counts = self.counts[0]
+        enough = counts >= max(min_points, 2)
+        mean = np.where(enough, self.means[0], np.nan)
+        std = np.full(len(self.coins), np.nan)
+        std[enough] = np.sqrt(self.m2[0, enough] / (counts[enough] - 1))
+        latest, has_latest = self.latest()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            spread = np.where(std > self.STD_FLOOR, std, np.nan)
+            zscore = np.where(has_latest, (latest - mean) / spread, np.nan)
+            carry_vol = mean / spread
+
+        # Walk back from the latest hour while the sign stays the same; a missing hour ends the run
+        slots = (self.end_hour - 1 - np.arange(self.ring_hours)) % self.ring_hours
+        signs = np.sign(self.ring[slots]) * self.ring_valid[slots]
+        run = np.cumprod(signs == signs[0], axis=0).sum(axis=0)
+        streak = np.where(signs[0] != 0, run * signs[0], 0).astype(np.int64)
+
+        levels = np.full((len(quantiles), len(self.coins)), np.nan)
+        if enough.any():
+            values = np.where(self.ring_valid[:, enough], self.ring[:, enough], np.nan)
+            levels[:, enough] = np.nanquantile(values, quantiles, axis=0)
+        return {'mean': mean, 'std': std, 'zscore': zscore, 'carry_vol': carry_vol,
+                'streak': streak, 'quantiles': levels}
@@ -0,0 +1,142 @@
+import json
+import os
+
+import pandas as pd
+
+from completeness import HOUR_MS
+from fetch_engine import fetch_all
+from outputs import write_file
+
+CHECKPOINT_PATH = os.path.join('data', 'backfill_checkpoint.json')
+
+# Chunks fetched between two journal appends / checkpoint saves
+BATCH_SIZE = 50
+
+
+def chunk_range(start_ms, end_ms, chunk_hours):
+    """
+    Split [start_ms, end_ms) into consecutive chunks of at most chunk_hours.
+
+    Returns:
+        List of (start_ms, end_ms) tuples
+    """
+    step = chunk_hours * HOUR_MS
+    return [(chunk_start, min(chunk_start + step, end_ms)) for chunk_start in range(start_ms, end_ms, step)]
+
+
+class BackfillCheckpoint:
+    """
+    On-disk record of the chunks a backfill job has completed.
+
+    A job is identified by its --since value as given, coin selection and
+    datasets. Its start and end times are fixed when the job is first
+    created, so a resumed run walks the same chunk grid (even for a relative
+    --since like '90d') and skips everything already done.
+    """
+
+    def __init__(self, path, since, coins, datasets, start_ms, end_ms):
+        self.path = path
+        self.job = {
+            'since': since,
+            'coins': sorted(coins) if coins else 'all',
+            'datasets': sorted(datasets),
+        }
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.done = set()
+        self.resumed = False
+
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get('job') == self.job:
+                self.start_ms = state['start']
+                self.end_ms = state['end']
+                self.done = {tuple(item) for item in state['done']}
+                self.resumed = True
+
+    def is_done(self, dataset, coin, start_ms, end_ms):
+        return (dataset, coin, start_ms, end_ms) in self.done
+
+    def mark_done(self, dataset, chunks):
+        for coin, start_ms, end_ms in chunks:
+            self.done.add((dataset, coin, start_ms, end_ms))
+
+    def save(self):
+        write_file(self.path, json.dumps(
+            {'job': self.job, 'start': self.start_ms, 'end': self.end_ms, 'done': sorted(self.done)}))
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def plan_chunks(index, coins, start_ms, end_ms, chunk_hours):
+    """
+    Split each coin's [start_ms, end_ms) into page-sized chunks and keep only
+    the chunks the completeness index still reports holes in.
+
+    Returns:
+        List of (coin, start_ms, end_ms) tuples
+    """
+    chunks = []
+    for coin in coins:
+        for chunk_start, chunk_end in chunk_range(start_ms, end_ms, chunk_hours):
+            if index is None or index.missing_ranges(coin, chunk_start, chunk_end):
+                chunks.append((coin, chunk_start, chunk_end))
+    return chunks
+
+
+def run_backfill(store, dataset, coins, start_ms, end_ms, fetch_fn, chunk_hours, checkpoint):
+    """
+    Backfill one dataset for the given coins over [start_ms, end_ms).
+
+    Chunks run concurrently under the shared rate limiter, in batches. After
+    each batch the fetched rows are appended to the store and the completed
+    chunks are checkpointed, so an interrupted run loses at most one batch.
+
+    Args:
+        store: PartitionedStore to write into
+        dataset: Dataset name ('funding' or 'volume'), used in the checkpoint
+        coins: List of coin symbols
+        start_ms: Start of the backfill in milliseconds (inclusive)
+        end_ms: End of the backfill in milliseconds (exclusive)
+        fetch_fn: Range fetcher taking (coin, start_ms, end_ms)
+        chunk_hours: Hours covered by one chunk (one response page)
+        checkpoint: BackfillCheckpoint for the job
+
+    Returns:
+        Dict with the number of chunks planned, completed and failed, and rows written
+    """
+    chunks = [chunk for chunk in plan_chunks(store.index, coins, start_ms, end_ms, chunk_hours)
+              if not checkpoint.is_done(dataset, *chunk)]
+    print(f"Backfilling {dataset}: {len(chunks)} chunks of up to {chunk_hours}h across {len(coins)} coins.")
+
+    summary = {'planned': len(chunks), 'completed': 0, 'failed': 0, 'rows': 0}
+    for batch_start in range(0, len(chunks), BATCH_SIZE):
+        batch = chunks[batch_start:batch_start + BATCH_SIZE]
+        rows = []
+        completed = []
+        for result in fetch_all(batch, lambda chunk: fetch_fn(*chunk)):
+            coin, chunk_start, chunk_end = result.key
+            if not result.ok:
+                summary['failed'] += 1
+                print(f"Failed to backfill {dataset} for {coin}: {result.error}")
+                continue
+            if store.index is not None:
+                store.index.note_range_fetched(coin, chunk_start, chunk_end, [entry['time'] for entry in result.value])
+            rows.extend(result.value)
+            completed.append(result.key)
+
+        # Store the rows before recording the chunks as done
+        if rows:
+            store.append(pd.DataFrame(rows))
+        elif store.index is not None:
+            store.index.save()
+        checkpoint.mark_done(dataset, completed)
+        checkpoint.save()
+
+        summary['completed'] += len(completed)
+        summary['rows'] += len(rows)
+        print(f"Backfill {dataset}: {summary['completed'] + summary['failed']}/{len(chunks)} chunks, {summary['rows']} rows.")
+    return summary
@@ -0,0 +1,377 @@
+"""
+End-to-end benchmarks of the collector and the website generator on synthetic data.
+
+For every scenario (coins x days of history) a temporary working directory
+is seeded with the scenario's history up to a few hours ago, a stand-in
+/info server is started for the same synthetic market, and the pipeline
+runs against it in a fresh child process: collect_data (funding and
+volume under one scheduler), waiting for compaction, then generate_website twice
+(the first run builds the rolling state and history files from scratch, the
+second finds nothing new). Wall time is recorded per stage, per telemetry
+span and for the functions inside them, along with the child's peak RSS
+and request counts.
+
+Each invocation appends one JSON line to the results file, so runs on
+different commits can be compared:
+
+    python benchmarks/run_benchmarks.py --scenarios 200x90,500x90,1000x90
+    python benchmarks/run_benchmarks.py --compare
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_PATH = os.path.join(BENCH_DIR, 'results.jsonl')
+DEFAULT_SCENARIOS = '200x90,500x90,1000x90'
+
+# Functions timed inside the stages: collector and generator module functions, scheduler and store methods
+COLLECTOR_FUNCTIONS = ['open_store', 'get_market_snapshot', 'get_all_coins']
+SCHEDULER_METHODS = ['plan', 'run']
+GENERATOR_FUNCTIONS = ['load_rollups', 'load_window_index', 'load_carry_stats', 'update_history_shards',
+                       'build_payload', 'write_payload']
+STORE_METHODS = ['read', 'append', 'write', 'drop_before', 'compact']
+
+
+def parse_scenario(value):
+    coins, days = value.lower().split('x')
+    return {'name': value, 'coins': int(coins), 'days': int(days)}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class StageTimer:
+    """
+    Accumulates wall time for pipeline stages and for wrapped functions.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.calls = {}
+
+    def stage(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.stages[name] = round(time.perf_counter() - start, 4)
+
+    def wrap(self, owner, attribute, label):
+        original = getattr(owner, attribute)
+        calls = self.calls.setdefault(label, {'calls': 0, 'seconds': 0.0})
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                calls['calls'] += 1
+                calls['seconds'] += time.perf_counter() - start
+
+        setattr(owner, attribute, timed)
+
+
+# ---------------- child processes ----------------
+
+def seed_workdir(scenario, options):
+    """
+    Seed the stores in the current directory. Runs in its own process so the
+    pipeline's peak RSS does not include the generator.
+    """
+    from synthetic import SyntheticMarket, seed_stores
+
+    market = SyntheticMarket(scenario['coins'], scenario['days'], options['end_hour'], seed=options['seed'])
+    start = time.perf_counter()
+    rows = seed_stores(market, options['end_hour'] - options['lag_hours'], gap_rate=options['gap_rate'])
+    return {'seed_seconds': round(time.perf_counter() - start, 2), 'seed_rows': rows}
+
+
+def run_pipeline(scenario, options):
+    """
+    Run the collector and the generator against the stand-in server from the
+    current directory and return the measurements.
+    """
+    import generate_website
+    import market_data_collector
+    import scheduler
+    import storage
+    import telemetry
+    from fetch_engine import hyperliquid_limiter
+    from hyperliquid_client import HyperliquidInfoClient, set_client
+
+    limiter = hyperliquid_limiter(options['weight_per_minute']) if options['weight_per_minute'] else None
+    client = HyperliquidInfoClient(base_url=options['url'], limiter=limiter, backoff_base=options['backoff_base'])
+    set_client(client)
+
+    run = telemetry.start_run('benchmark')
+    timer = StageTimer()
+    for name in COLLECTOR_FUNCTIONS:
+        timer.wrap(market_data_collector, name, name)
+    for name in GENERATOR_FUNCTIONS:
+        timer.wrap(generate_website, name, name)
+    for name in SCHEDULER_METHODS:
+        timer.wrap(scheduler.FetchScheduler, name, f"scheduler.{name}")
+    for name in STORE_METHODS:
+        timer.wrap(storage.PartitionedStore, name, f"store.{name}")
+
+    timer.stage('collect_data', market_data_collector.collect_data)
+    timer.stage('wait_for_compaction', market_data_collector.wait_for_compaction)
+    timer.stage('generate_website', generate_website.generate_website)
+    timer.stage('generate_website_rerun', generate_website.generate_website)
+
+    rows = {}
+    for name, store in (('funding', storage.funding_store()), ('ohlcv', storage.ohlcv_store())):
+        rows[name] = int(store.index.bits.sum()) if store.index.end_hour is not None else 0
+
+    outputs = {}
+    for name in ('funding_data.json', 'funding_data.json.gz', 'funding_data.json.br'):
+        path = os.path.join('docs', name)
+        if os.path.exists(path):
+            outputs[name] = os.path.getsize(path)
+    history_dir = os.path.join('docs', 'history')
+    if os.path.isdir(history_dir):
+        files = os.listdir(history_dir)
+        outputs['history_files'] = len(files)
+        outputs['history_bytes'] = sum(os.path.getsize(os.path.join(history_dir, f)) for f in files)
+
+    report = run.report()
+    run.write()
+    return {
+        'stages': timer.stages,
+        'spans': report['spans'],
+        'coin_outcomes': report['coin_outcomes'],
+        'total_seconds': round(sum(timer.stages.values()), 4),
+        'calls': {label: {'calls': c['calls'], 'seconds': round(c['seconds'], 4)}
+                  for label, c in timer.calls.items() if c['calls']},
+        'peak_rss_mb': peak_rss_mb(),
+        'requests': {key: client.stats[key] for key in ('requests', 'retries', 'failures', 'bytes_received')},
+        'status_codes': {str(code): count for code, count in client.stats['status_codes'].items()},
+        'rows': rows,
+        'outputs': outputs,
+    }
+
+
+def child_main(args):
+    sys.path[:0] = [REPO_DIR, BENCH_DIR]
+    with open(args.child_config) as f:
+        config = json.load(f)
+    os.chdir(config['workdir'])
+    if args.child == 'seed':
+        result = seed_workdir(config['scenario'], config['options'])
+    else:
+        result = run_pipeline(config['scenario'], config['options'])
+    with open(args.child_result, 'w') as f:
+        json.dump(result, f)
+
+
+def run_child(kind, workdir, scenario, options):
+    config_path = os.path.join(workdir, f"{kind}_config.json")
+    result_path = os.path.join(workdir, f"{kind}_result.json")
+    with open(config_path, 'w') as f:
+        json.dump({'workdir': workdir, 'scenario': scenario, 'options': options}, f)
+    with open(os.path.join(workdir, f"{kind}.log"), 'w') as log:
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', kind,
+                        '--child-config', config_path, '--child-result', result_path],
+                       stdout=log, stderr=subprocess.STDOUT, check=True)
+    with open(result_path) as f:
+        return json.load(f)
+
+
+# ---------------- orchestration ----------------
+
+def start_standin(scenario, options):
+    command = [
+        sys.executable, os.path.join(BENCH_DIR, 'standin.py'),
+        '--coins', str(scenario['coins']), '--days', str(scenario['days']),
+        '--seed', str(options['seed']), '--end-hour', str(options['end_hour']),
+        '--latency-ms', str(options['latency_ms']), '--jitter-ms', str(options['jitter_ms']),
+        '--rate-limit', str(options['rate_limit']),
+    ]
+    if options['retry_after'] is not None:
+        command += ['--retry-after', str(options['retry_after'])]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        raise RuntimeError(f"Stand-in server failed to start: {process.stderr.read()}")
+    return process, url
+
+
+def stop_standin(process):
+    # SIGINT lets the server print its request counts before exiting
+    process.send_signal(signal.SIGINT)
+    try:
+        _, stderr = process.communicate(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        return {}
+    lines = stderr.strip().splitlines()
+    try:
+        return json.loads(lines[-1]) if lines else {}
+    except ValueError:
+        return {}
+
+
+def run_scenario(scenario, options, keep=False):
+    workdir = tempfile.mkdtemp(prefix=f"carry-bench-{scenario['name']}-")
+    os.makedirs(os.path.join(workdir, 'docs'))
+    print(f"Scenario {scenario['name']}: seeding {scenario['coins']} coins x {scenario['days']} days in {workdir}")
+    try:
+        result = dict(scenario)
+        result.update(run_child('seed', workdir, scenario, options))
+        process, url = start_standin(scenario, options)
+        try:
+            result.update(run_child('run', workdir, scenario, dict(options, url=url)))
+        finally:
+            result['server_requests'] = stop_standin(process)
+        return result
+    finally:
+        if keep:
+            print(f"Kept working directory {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def print_result(result):
+    print(f"  {'stage':<28}{'seconds':>10}")
+    for stage, seconds in result['stages'].items():
+        print(f"  {stage:<28}{seconds:>10.3f}")
+    print(f"  {'total':<28}{result['total_seconds']:>10.3f}")
+    print(f"  peak RSS {result['peak_rss_mb']} MB, {result['requests']['requests']} requests "
+          f"({result['requests']['retries']} retries)")
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(path):
+    """
+    Print the stage times of the last two runs in the results file side by side.
+    """
+    runs = load_results(path)
+    if len(runs) < 2:
+        print(f"Need at least two runs in {path} to compare.")
+        return
+    old, new = runs[-2], runs[-1]
+    print(f"old: {(old.get('commit') or '?')[:10]} {old['timestamp']}")
+    print(f"new: {(new.get('commit') or '?')[:10]} {new['timestamp']}")
+    old_scenarios = {s['name']: s for s in old['scenarios']}
+    if not any(scenario['name'] in old_scenarios for scenario in new['scenarios']):
+        print("The two runs have no scenarios in common.")
+    for scenario in new['scenarios']:
+        previous = old_scenarios.get(scenario['name'])
+        if previous is None:
+            continue
+        print(f"\nScenario {scenario['name']}")
+        print(f"  {'':<28}{'old':>10}{'new':>10}{'ratio':>8}")
+        rows = [(stage, previous['stages'].get(stage), seconds) for stage, seconds in scenario['stages'].items()]
+        rows.append(('total', previous['total_seconds'], scenario['total_seconds']))
+        rows.append(('peak RSS (MB)', previous['peak_rss_mb'], scenario['peak_rss_mb']))
+        for label, before, after in rows:
+            if before is None:
+                print(f"  {label:<28}{'-':>10}{after:>10.3f}")
+                continue
+            ratio = f"{after / before:.2f}" if before else '-'
+            print(f"  {label:<28}{before:>10.3f}{after:>10.3f}{ratio:>8}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the collector and website generator on synthetic data.")
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS,
+                        help=f"Comma-separated COINSxDAYS scenarios (default: {DEFAULT_SCENARIOS})")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--lag-hours', type=int, default=3,
+                        help="Hours before now the seeded history ends, for the collector to fetch")
+    parser.add_argument('--gap-rate', type=float, default=0.002,
+                        help="Fraction of seeded hours left out, for the collector to repair")
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--jitter-ms', type=float, default=5.0)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="Probability of a 429 response")
+    parser.add_argument('--retry-after', type=float, default=None)
+    parser.add_argument('--backoff-base', type=float, default=0.05)
+    parser.add_argument('--weight-per-minute', type=int, default=0,
+                        help="Client rate limit budget (default: unlimited)")
+    parser.add_argument('--output', default=RESULTS_PATH, help="Results file (JSON lines)")
+    parser.add_argument('--keep', action='store_true', help="Keep the working directories")
+    parser.add_argument('--compare', action='store_true', help="Compare the last two runs in the results file")
+    parser.add_argument('--child', choices=['seed', 'run'], help=argparse.SUPPRESS)
+    parser.add_argument('--child-config', help=argparse.SUPPRESS)
+    parser.add_argument('--child-result', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        child_main(args)
+        return
+    if args.compare:
+        compare(args.output)
+        return
+
+    now_ms = int(time.time() * 1000)
+    options = {
+        'seed': args.seed,
+        # The synthetic span ends at the current hour; the stand-in serves hours after it too
+        'end_hour': now_ms // (60 * 60 * 1000),
+        'lag_hours': args.lag_hours,
+        'gap_rate': args.gap_rate,
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'rate_limit': args.rate_limit,
+        'retry_after': args.retry_after,
+        'backoff_base': args.backoff_base,
+        'weight_per_minute': args.weight_per_minute,
+    }
+
+    results = []
+    for value in args.scenarios.split(','):
+        result = run_scenario(parse_scenario(value.strip()), options, keep=args.keep)
+        print_result(result)
+        results.append(result)
+
+    commit, dirty = git_revision()
+    record = {
+        'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+        'commit': commit,
+        'dirty': dirty,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {key: value for key, value in options.items() if key != 'end_hour'},
+        'scenarios': results,
+    }
+    with open(args.output, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    print(f"Results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Local stand-in for Hyperliquid's /info endpoint, serving a SyntheticMarket.
+
+Supports the request types the collector uses (meta, metaAndAssetCtxs,
+fundingHistory, candleSnapshot at 1h and 1d) with the exchange's page caps and
+candle history limit, and can add latency and inject 429 responses to
+exercise the client's retry path.
+
+Run on its own it prints the URL it listens on, e.g.:
+
+    python benchmarks/standin.py --coins 200 --days 90 --latency-ms 20 --rate-limit 0.02
+"""
+import argparse
+import gzip
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic import SyntheticMarket, HOUR_MS
+
+FUNDING_PAGE_CAP = 500
+CANDLE_PAGE_CAP = 5000
+# candleSnapshot serves only this many of the latest candles of each interval
+CANDLE_HISTORY = 5000
+CANDLE_INTERVALS = {'1h': HOUR_MS, '1d': 24 * HOUR_MS}
+
+
+class StandinConfig:
+    """
+    Behaviour of the stand-in server.
+
+    Args:
+        latency_ms: Added delay per request
+        jitter_ms: Uniform random extra delay per request
+        rate_limit: Probability of answering a request with 429
+        retry_after: Retry-After seconds sent with 429 responses (None to omit)
+        funding_page_cap: Maximum records per fundingHistory response
+        candle_page_cap: Maximum candles per candleSnapshot response
+        compress: Gzip responses when the client accepts it
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, rate_limit=0.0, retry_after=None,
+                 funding_page_cap=FUNDING_PAGE_CAP, candle_page_cap=CANDLE_PAGE_CAP, compress=True):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.funding_page_cap = funding_page_cap
+        self.candle_page_cap = candle_page_cap
+        self.compress = compress
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, market, config):
+        super().__init__(address, StandinHandler)
+        self.market = market
+        self.config = config
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body, separators=(',', ':')).encode()
+        headers = dict(headers or {})
+        if self.server.config.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            data = gzip.compress(data, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        config = server.config
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        request_type = payload.get('type')
+        server.count(request_type)
+
+        delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if config.rate_limit and random.random() < config.rate_limit:
+            server.count('429')
+            headers = {} if config.retry_after is None else {'Retry-After': str(config.retry_after)}
+            self._send(429, {'error': 'rate limited'}, headers)
+            return
+
+        now_ms = int(time.time() * 1000)
+        market = server.market
+        if request_type == 'meta':
+            body = market.meta(now_ms)
+        elif request_type == 'metaAndAssetCtxs':
+            body = market.meta_and_asset_ctxs(now_ms)
+        elif request_type == 'fundingHistory':
+            # Only settled funding exists: nothing after the last whole hour
+            end_ms = min(int(payload.get('endTime') or now_ms), now_ms)
+            body = market.funding_records(payload['coin'], int(payload['startTime']), end_ms,
+                                          config.funding_page_cap)
+        elif request_type == 'candleSnapshot':
+            req = payload['req']
+            interval_ms = CANDLE_INTERVALS.get(req.get('interval'))
+            if interval_ms is None:
+                self._send(400, {'error': f"unsupported interval {req.get('interval')}"})
+                return
+            # Like the exchange, only the latest CANDLE_HISTORY candles of an
+            # interval are served, and the current one is returned while still
+            # open (here with its final synthetic values)
+            start_ms = max(int(req['startTime']), (now_ms // interval_ms - CANDLE_HISTORY + 1) * interval_ms)
+            end_ms = min(int(req['endTime']), now_ms)
+            records = market.candle_records if req['interval'] == '1h' else market.daily_candle_records
+            body = records(req['coin'], start_ms, end_ms, config.candle_page_cap)
+        else:
+            self._send(400, {'error': f"unsupported type {request_type}"})
+            return
+        self._send(200, body)
+
+
+def serve(market, config, host='127.0.0.1', port=0):
+    """
+    Start a stand-in server on a background thread.
+
+    Returns:
+        StandinServer; call shutdown() to stop it
+    """
+    server = StandinServer((host, port), market, config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve synthetic market data on a local /info endpoint.")
+    parser.add_argument('--coins', type=int, default=200)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--end-hour', type=int, default=None,
+                        help="Exclusive end of the synthetic span in epoch hours (default: the current hour)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="Probability of a 429 response")
+    parser.add_argument('--retry-after', type=float, default=None)
+    parser.add_argument('--funding-page-cap', type=int, default=FUNDING_PAGE_CAP)
+    parser.add_argument('--candle-page-cap', type=int, default=CANDLE_PAGE_CAP)
+    parser.add_argument('--no-gzip', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    end_hour = args.end_hour if args.end_hour is not None else int(time.time() * 1000) // HOUR_MS
+    market = SyntheticMarket(args.coins, args.days, end_hour, seed=args.seed)
+    config = StandinConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after,
+        funding_page_cap=args.funding_page_cap,
+        candle_page_cap=args.candle_page_cap,
+        compress=not args.no_gzip,
+    )
+    server = StandinServer((args.host, args.port), market, config)
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.counts), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
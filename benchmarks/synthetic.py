@@ -0,0 +1,268 @@
+"""
+Synthetic Hyperliquid market histories for the benchmarks.
+
+Every value is a pure function of (seed, coin, hour), so the stores seeded
+by the harness and the stand-in /info server agree on every record without
+sharing any state, and any hour can be generated on demand.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from completeness import HOUR_MS  # noqa: E402
+
+DAY_MS = 24 * HOUR_MS
+
+MAJOR_COINS = ['BTC', 'ETH', 'SOL', 'XRP', 'DOGE', 'AVAX', 'LINK', 'ARB', 'OP', 'SUI']
+
+# Exchange funding timestamps land a few milliseconds after the hour
+FUNDING_TIME_JITTER_MS = 100
+
+# Fraction of coins listed during the generated span rather than before it
+LISTED_DURING_SPAN = 0.1
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _splitmix64(x):
+    # Counter-based hash: uniform 64-bit output for every input
+    with np.errstate(over='ignore'):
+        x = (x + np.uint64(0x9E3779B97F4A7C15)) & _MASK64
+        x = ((x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)) & _MASK64
+        x = ((x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)) & _MASK64
+        return x ^ (x >> np.uint64(31))
+
+
+class SyntheticMarket:
+    """
+    A universe of perpetuals with deterministic hourly funding and candles.
+
+    Funding rates oscillate around a per-coin mean with a multi-day cycle
+    plus noise; prices follow slow cycles around a per-coin level; hourly
+    volume is heavy-tailed across coins (a few majors trade most of it) with
+    an intraday pattern. Some coins are listed part-way through the span and
+    have no data before their listing hour.
+
+    Args:
+        n_coins: Universe size
+        days: Length of the span in days
+        end_hour: Exclusive end of the span in epoch hours
+        seed: Seed for the per-coin parameters and the noise
+    """
+
+    def __init__(self, n_coins, days, end_hour, seed=0):
+        self.seed = seed
+        self.days = days
+        self.end_hour = end_hour
+        self.start_hour = end_hour - days * 24
+        self.coins = (MAJOR_COINS + [f"SYN{i}" for i in range(max(0, n_coins - len(MAJOR_COINS)))])[:n_coins]
+        self.ids = {coin: i for i, coin in enumerate(self.coins)}
+        n = len(self.coins)
+
+        rng = np.random.default_rng(seed)
+        listed_late = rng.random(n) < LISTED_DURING_SPAN
+        listed_late[:min(n, len(MAJOR_COINS))] = False
+        self.listed_hour = np.where(
+            listed_late, rng.integers(self.start_hour, end_hour, n), self.start_hour - 365 * 24)
+
+        self.funding_mean = rng.normal(1.25e-5, 2e-5, n)
+        self.funding_amplitude = rng.uniform(0.5e-5, 5e-5, n)
+        self.funding_period = rng.uniform(24, 24 * 14, n)
+        self.phase = rng.uniform(0, 2 * np.pi, n)
+        self.price_level = 10 ** rng.uniform(-4, 4.5, n)
+        self.price_period = rng.uniform(24 * 7, 24 * 60, n)
+        # Hourly USD volume falls off with rank like a power law
+        self.hourly_volume = 4e7 * (np.arange(n) + 1.0) ** -1.2 * rng.lognormal(0, 0.5, n)
+
+    # ---------------- generators ----------------
+
+    def _uniform(self, coin_ids, hours, stream):
+        key = (np.uint64(self.seed) << np.uint64(56)) ^ (np.asarray(coin_ids, dtype=np.uint64) << np.uint64(40))
+        key = key ^ (np.asarray(hours, dtype=np.uint64) << np.uint64(4)) ^ np.uint64(stream)
+        return (_splitmix64(key) >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+    def _normal(self, coin_ids, hours, stream):
+        u1 = np.maximum(self._uniform(coin_ids, hours, stream), 1e-300)
+        u2 = self._uniform(coin_ids, hours, stream + 1)
+        return np.sqrt(-2 * np.log(u1)) * np.cos(2 * np.pi * u2)
+
+    def listed(self, coin_ids, hours):
+        return np.asarray(hours) >= self.listed_hour[coin_ids]
+
+    def funding(self, coin_ids, hours):
+        """
+        Return (fundingRate, premium, time_ms) arrays for (coin, settle hour) pairs.
+        """
+        coin_ids = np.asarray(coin_ids)
+        hours = np.asarray(hours, dtype=np.int64)
+        cycle = np.sin(2 * np.pi * hours / self.funding_period[coin_ids] + self.phase[coin_ids])
+        rate = (self.funding_mean[coin_ids] + self.funding_amplitude[coin_ids] * cycle
+                + 1e-5 * self._normal(coin_ids, hours, 0))
+        premium = rate * 8 + 2e-4 * self._normal(coin_ids, hours, 2)
+        jitter = (self._uniform(coin_ids, hours, 4) * FUNDING_TIME_JITTER_MS).astype(np.int64)
+        return np.round(rate, 10), np.round(premium, 8), hours * HOUR_MS + jitter
+
+    def candles(self, coin_ids, hours):
+        """
+        Return (open, high, low, close, volume, trades) arrays for (coin, start hour) pairs.
+        Volume is in coin units, like the exchange's candles.
+        """
+        coin_ids = np.asarray(coin_ids)
+        hours = np.asarray(hours, dtype=np.int64)
+
+        def close_at(h):
+            drift = 0.3 * np.sin(2 * np.pi * h / self.price_period[coin_ids] + self.phase[coin_ids])
+            return self.price_level[coin_ids] * np.exp(drift + 0.01 * self._normal(coin_ids, h, 6))
+
+        close = close_at(hours)
+        open_ = close_at(hours - 1)
+        wick = 1 + 0.004 * np.abs(self._normal(coin_ids, hours, 8))
+        high = np.maximum(open_, close) * wick
+        low = np.minimum(open_, close) / wick
+        intraday = 1 + 0.5 * np.sin(2 * np.pi * (hours % 24) / 24)
+        volume_usd = self.hourly_volume[coin_ids] * intraday * np.exp(0.6 * self._normal(coin_ids, hours, 10))
+        trades = np.maximum(1, (volume_usd / 2000).astype(np.int64))
+        return open_, high, low, close, volume_usd / close, trades
+
+    # ---------------- store frames ----------------
+
+    def _grid(self, start_hour, end_hour, coin_ids=None, gap_rate=0.0, stream=20):
+        coin_ids = np.arange(len(self.coins)) if coin_ids is None else np.asarray(coin_ids)
+        hours = np.arange(start_hour, end_hour, dtype=np.int64)
+        ids = np.repeat(coin_ids, len(hours))
+        hours = np.tile(hours, len(coin_ids))
+        keep = self.listed(ids, hours)
+        if gap_rate:
+            keep &= self._uniform(ids, hours, stream) >= gap_rate
+        return ids[keep], hours[keep]
+
+    def funding_frame(self, start_hour, end_hour, gap_rate=0.0):
+        """
+        Funding rows (storage.FUNDING_SCHEMA) settled in [start_hour, end_hour).
+        """
+        ids, hours = self._grid(start_hour, end_hour, gap_rate=gap_rate, stream=20)
+        rate, premium, time_ms = self.funding(ids, hours)
+        return pd.DataFrame({
+            'coin': np.array(self.coins)[ids],
+            'fundingRate': rate,
+            'premium': premium,
+            'time': time_ms,
+        })
+
+    def ohlcv_frame(self, start_hour, end_hour, gap_rate=0.0):
+        """
+        OHLCV rows (storage.OHLCV_SCHEMA) for candles starting in [start_hour, end_hour).
+        """
+        ids, hours = self._grid(start_hour, end_hour, gap_rate=gap_rate, stream=22)
+        open_, high, low, close, volume, trades = self.candles(ids, hours)
+        return pd.DataFrame({
+            'coin': np.array(self.coins)[ids],
+            'open_price': open_,
+            'high_price': high,
+            'low_price': low,
+            'close_price': close,
+            'volume_usd': volume * close,
+            'trade_count': trades,
+            'time': hours * HOUR_MS,
+        })
+
+    # ---------------- API records ----------------
+
+    def funding_records(self, coin, start_ms, end_ms, limit):
+        """
+        fundingHistory response: records with start_ms <= time <= end_ms, oldest first.
+        """
+        coin_id = self.ids.get(coin)
+        if coin_id is None:
+            return []
+        first_hour = max(start_ms // HOUR_MS, int(self.listed_hour[coin_id]))
+        hours = np.arange(first_hour, end_ms // HOUR_MS + 1, dtype=np.int64)[:limit + 1]
+        ids = np.full(len(hours), coin_id)
+        rate, premium, time_ms = self.funding(ids, hours)
+        in_range = (time_ms >= start_ms) & (time_ms <= end_ms)
+        return [{'coin': coin, 'fundingRate': repr(float(r)), 'premium': repr(float(p)), 'time': int(t)}
+                for r, p, t in zip(rate[in_range], premium[in_range], time_ms[in_range])][:limit]
+
+    def candle_records(self, coin, start_ms, end_ms, limit):
+        """
+        candleSnapshot response: hourly candles starting in [start_ms, end_ms], oldest first.
+        """
+        coin_id = self.ids.get(coin)
+        if coin_id is None:
+            return []
+        first_hour = max(-(-start_ms // HOUR_MS), int(self.listed_hour[coin_id]))
+        hours = np.arange(first_hour, end_ms // HOUR_MS + 1, dtype=np.int64)[:limit]
+        ids = np.full(len(hours), coin_id)
+        open_, high, low, close, volume, trades = self.candles(ids, hours)
+        return [{'t': int(h) * HOUR_MS, 'T': (int(h) + 1) * HOUR_MS - 1, 's': coin, 'i': '1h',
+                 'o': f"{o:.6g}", 'c': f"{c:.6g}", 'h': f"{hi:.6g}", 'l': f"{lo:.6g}",
+                 'v': f"{v:.6g}", 'n': int(n)}
+                for h, o, hi, lo, c, v, n in zip(hours, open_, high, low, close, volume, trades)]
+
+    def daily_candle_records(self, coin, start_ms, end_ms, limit):
+        """
+        candleSnapshot response for the 1d interval: each UTC day starting in
+        [start_ms, end_ms] as one candle merged from its hourly candles, oldest first.
+        """
+        coin_id = self.ids.get(coin)
+        if coin_id is None:
+            return []
+        listed_hour = int(self.listed_hour[coin_id])
+        first_day = max(-(-start_ms // DAY_MS), listed_hour // 24)
+        records = []
+        for day in range(first_day, end_ms // DAY_MS + 1)[:limit]:
+            hours = np.arange(max(day * 24, listed_hour), (day + 1) * 24, dtype=np.int64)
+            open_, high, low, close, volume, trades = self.candles(np.full(len(hours), coin_id), hours)
+            records.append({'t': day * DAY_MS, 'T': (day + 1) * DAY_MS - 1, 's': coin, 'i': '1d',
+                            'o': f"{open_[0]:.6g}", 'c': f"{close[-1]:.6g}", 'h': f"{high.max():.6g}",
+                            'l': f"{low.min():.6g}", 'v': f"{volume.sum():.6g}", 'n': int(trades.sum())})
+        return records
+
+    def meta(self, now_ms):
+        """
+        meta universe of the coins listed at now_ms.
+        """
+        hour = now_ms // HOUR_MS
+        return {'universe': [{'name': coin, 'szDecimals': 2, 'maxLeverage': 20}
+                             for i, coin in enumerate(self.coins) if self.listed_hour[i] <= hour]}
+
+    def meta_and_asset_ctxs(self, now_ms):
+        """
+        metaAndAssetCtxs response; the funding field is the rate settling at the next hour.
+        """
+        meta = self.meta(now_ms)
+        ids = np.array([self.ids[entry['name']] for entry in meta['universe']], dtype=np.int64)
+        next_hour = np.full(len(ids), now_ms // HOUR_MS + 1)
+        rate, premium, _ = self.funding(ids, next_hour)
+        _, _, _, close, volume, _ = self.candles(ids, next_hour - 1)
+        ctxs = [{'funding': repr(float(r)), 'premium': repr(float(p)), 'markPx': f"{c:.6g}",
+                 'openInterest': f"{v * 50:.2f}", 'dayNtlVlm': f"{v * c * 24:.2f}"}
+                for r, p, c, v in zip(rate, premium, close, volume)]
+        return [meta, ctxs]
+
+
+def seed_stores(market, end_hour, gap_rate=0.0):
+    """
+    Write the market's history up to end_hour into the funding and OHLCV
+    stores under the current directory, one day at a time.
+
+    Returns:
+        Dict of dataset -> rows written
+    """
+    from storage import funding_store, ohlcv_store, FUNDING_RETENTION_DAYS, OHLCV_RETENTION_DAYS
+
+    rows = {}
+    for name, store, retention_days, frame in (
+            ('funding', funding_store(), FUNDING_RETENTION_DAYS, market.funding_frame),
+            ('ohlcv', ohlcv_store(), OHLCV_RETENTION_DAYS, market.ohlcv_frame)):
+        start_hour = max(market.start_hour, end_hour - retention_days * 24)
+        rows[name] = 0
+        for day_start in range(start_hour, end_hour, 24):
+            df = frame(day_start, min(day_start + 24, end_hour), gap_rate=gap_rate)
+            store.write(df)
+            rows[name] += len(df)
+    return rows
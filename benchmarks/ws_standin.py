@@ -0,0 +1,152 @@
+"""
+Local stand-in for Hyperliquid's WebSocket feed, serving a SyntheticMarket.
+
+Answers the subscribe and ping messages the streaming collector sends and
+pushes every subscribed coin's current hourly candle and asset context once
+per interval, as the exchange does when they change. The clock can be
+shifted, so a test reaches an hour boundary within seconds.
+
+Run on its own it prints the URL it listens on, e.g.:
+
+    python benchmarks/ws_standin.py --coins 200 --days 90 --interval 1
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+
+from websockets.asyncio.server import serve as serve_websocket
+from websockets.exceptions import ConnectionClosed
+
+from synthetic import SyntheticMarket, HOUR_MS
+
+
+class WsStandinServer:
+    """
+    WebSocket stand-in running its own event loop on a background thread.
+
+    Args:
+        market: SyntheticMarket to serve
+        interval: Seconds between pushes to each connection
+        clock: Function returning the current Unix time
+    """
+
+    def __init__(self, market, interval=1.0, clock=time.time, host='127.0.0.1', port=0):
+        self.market = market
+        self.interval = interval
+        self.clock = clock
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.counts = {}
+        self._loop = None
+        self._stopped = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(),), daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def shutdown(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+            self._thread.join()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        async with serve_websocket(self._handle, self.host, self.port, max_size=None) as server:
+            self.port = next(iter(server.sockets)).getsockname()[1]
+            self._ready.set()
+            await self._stopped.wait()
+
+    async def _handle(self, ws):
+        self.count('connections')
+        subscriptions = {}
+        pusher = asyncio.create_task(self._push(ws, subscriptions))
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                method = message.get('method')
+                self.count(method)
+                if method == 'ping':
+                    await ws.send(json.dumps({'channel': 'pong'}))
+                elif method == 'subscribe':
+                    subscription = message['subscription']
+                    subscriptions[(subscription['type'], subscription['coin'])] = subscription
+                    await ws.send(json.dumps({'channel': 'subscriptionResponse', 'data': message}))
+        except ConnectionClosed:
+            # Clients that are killed do not close cleanly
+            pass
+        finally:
+            pusher.cancel()
+
+    async def _push(self, ws, subscriptions):
+        while True:
+            now_ms = int(self.clock() * 1000)
+            hour_ms = now_ms // HOUR_MS * HOUR_MS
+            meta, ctxs = self.market.meta_and_asset_ctxs(now_ms)
+            contexts = {asset['name']: ctx for asset, ctx in zip(meta['universe'], ctxs)}
+            for channel, coin in list(subscriptions):
+                if channel == 'candle':
+                    # The open candle, here with its final synthetic values
+                    data = next(iter(self.market.candle_records(coin, hour_ms, hour_ms, 1)), None)
+                else:
+                    data = {'coin': coin, 'ctx': contexts[coin]} if coin in contexts else None
+                if data is not None:
+                    await ws.send(json.dumps({'channel': channel, 'data': data}))
+                    self.count(channel)
+            await asyncio.sleep(self.interval)
+
+
+def serve(market, interval=1.0, clock=time.time, host='127.0.0.1', port=0):
+    """
+    Start a WebSocket stand-in on a background thread.
+
+    Returns:
+        WsStandinServer; call shutdown() to stop it
+    """
+    return WsStandinServer(market, interval=interval, clock=clock, host=host, port=port).start()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stream synthetic market data on a local WebSocket endpoint.")
+    parser.add_argument('--coins', type=int, default=200)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--interval', type=float, default=1.0, help="Seconds between pushes of each subscription")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    end_hour = int(time.time() * 1000) // HOUR_MS + 1
+    market = SyntheticMarket(args.coins, args.days, end_hour, seed=args.seed)
+    server = serve(market, interval=args.interval, host=args.host, port=args.port)
+    print(server.url, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(json.dumps(server.counts), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
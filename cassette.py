@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+import clock
+from fetch_engine import DEFAULT_REQUEST_WEIGHT
+from hyperliquid_client import CircuitOpenError, HyperliquidAPIError, HyperliquidInfoClient
+from telemetry import current_run
+
+CASSETTE_VERSION = 1
+META_NAME = 'cassette.json'
+INDEX_NAME = 'index.jsonl'
+DATA_NAME = 'responses.bin'
+
+
+def request_key(payload):
+    """
+    Canonical form of an /info request body, used to look its response up.
+    """
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'))
+
+
+class Cassette:
+    """
+    On-disk record of /info requests and their responses.
+
+    A cassette is a directory holding:
+        cassette.json  - version, Unix time the recording started, and the
+                         collector arguments it was recorded with
+        index.jsonl    - one line per response: the request body, the offset
+                         and length of its response in responses.bin, the
+                         HTTP status and the error message of a failed request
+        responses.bin  - the zlib-compressed JSON responses back to back
+
+    The index is appended to as responses arrive, so a run that is cut off
+    still leaves a usable cassette. For replay the whole data file is read
+    into memory once and responses are decompressed on request. A request
+    recorded several times is replayed in the order it was recorded, the
+    last response repeating once they are used up.
+    """
+
+    def __init__(self, path, meta, entries=None, data=b''):
+        self.path = path
+        self.meta = meta
+        self.entries = entries or {}  # request key -> list of (offset, length, status, error)
+        self.data = data
+        self.misses = 0
+        self._cursors = {}
+        self._lock = threading.Lock()
+        self._index_file = None
+        self._data_file = None
+        self._offset = len(data)
+
+    @property
+    def recorded_at(self):
+        return self.meta['recorded_at']
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+    @classmethod
+    def create(cls, path, argv=None):
+        """
+        Start a new cassette in `path`, replacing any cassette already there.
+        """
+        os.makedirs(path, exist_ok=True)
+        meta = {'version': CASSETTE_VERSION, 'recorded_at': clock.now(), 'argv': list(argv or [])}
+        with open(os.path.join(path, META_NAME), 'w') as f:
+            json.dump(meta, f, indent=1)
+        cassette = cls(path, meta)
+        cassette._index_file = open(os.path.join(path, INDEX_NAME), 'w')
+        cassette._data_file = open(os.path.join(path, DATA_NAME), 'wb')
+        return cassette
+
+    @classmethod
+    def open(cls, path):
+        """
+        Load a recorded cassette for replay.
+
+        Raises:
+            ValueError: if `path` holds no cassette of this version
+        """
+        meta_path = os.path.join(path, META_NAME)
+        if not os.path.exists(meta_path):
+            raise ValueError(f"No cassette found in {path}")
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version {meta.get('version')} in {path}")
+        entries = {}
+        with open(os.path.join(path, INDEX_NAME)) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut off when the recording stopped
+                    break
+                entries.setdefault(request_key(entry['request']), []).append(
+                    (entry['offset'], entry['length'], entry['status'], entry['error']))
+        with open(os.path.join(path, DATA_NAME), 'rb') as f:
+            data = f.read()
+        return cls(path, meta, entries, data)
+
+    def record(self, payload, response=None, status=200, error=None):
+        """
+        Append one response (or the error a request failed with) to the cassette.
+        """
+        blob = b'' if error is not None else zlib.compress(
+            json.dumps(response, separators=(',', ':')).encode('utf-8'), 6)
+        with self._lock:
+            offset = self._offset
+            self._data_file.write(blob)
+            self._data_file.flush()
+            self._index_file.write(json.dumps({
+                'request': payload, 'offset': offset, 'length': len(blob), 'status': status, 'error': error,
+            }, separators=(',', ':')) + '\n')
+            self._index_file.flush()
+            self._offset += len(blob)
+            self.entries.setdefault(request_key(payload), []).append((offset, len(blob), status, error))
+
+    def replay(self, payload):
+        """
+        Return the next recorded (response, status, error, length) for a request.
+
+        Raises:
+            KeyError: if the request was never recorded
+        """
+        key = request_key(payload)
+        with self._lock:
+            entries = self.entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise KeyError(key)
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+        offset, length, status, error = entries[min(cursor, len(entries) - 1)]
+        if error is not None:
+            return None, status, error, length
+        return json.loads(zlib.decompress(self.data[offset:offset + length])), status, None, length
+
+    def close(self):
+        for f in (self._index_file, self._data_file):
+            if f is not None:
+                f.close()
+        self._index_file = self._data_file = None
+
+
+class RecordingClient(HyperliquidInfoClient):
+    """
+    Info client that also writes every response (and every request that
+    failed after its retries) to a cassette.
+    """
+
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def post(self, payload, weight=DEFAULT_REQUEST_WEIGHT):
+        try:
+            data = super().post(payload, weight)
+        except CircuitOpenError:
+            # Nothing was sent, so there is nothing to record
+            raise
+        except HyperliquidAPIError as e:
+            self.cassette.record(payload, status=e.status_code, error=str(e))
+            raise
+        self.cassette.record(payload, data)
+        return data
+
+
+class ReplayClient(HyperliquidInfoClient):
+    """
+    Info client that serves every request from a cassette: no network, no
+    rate limiting and no retry sleeps. Requests missing from the cassette
+    fail like a request the exchange did not answer.
+    """
+
+    def __init__(self, cassette):
+        super().__init__(limiter=None, max_retries=0)
+        self.cassette = cassette
+
+    def post(self, payload, weight=DEFAULT_REQUEST_WEIGHT):
+        started = time.perf_counter()
+        self._count('requests')
+        try:
+            data, status, error, length = self.cassette.replay(payload)
+        except KeyError:
+            self._count('failures')
+            current_run().record_request(payload.get('type'), 'NotRecorded', time.perf_counter() - started)
+            raise HyperliquidAPIError(f"No recorded response for {request_key(payload)}")
+        current_run().record_request(payload.get('type'), status or 'Error', time.perf_counter() - started, length)
+        if error is not None:
+            self._count('failures')
+            raise HyperliquidAPIError(error, status_code=status)
+        self._count('bytes_received', length)
+        return data
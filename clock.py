@@ -0,0 +1,28 @@
+import time
+from datetime import datetime, timezone
+
+# Unix time the clock is frozen at, or None to follow the system clock
+_frozen_at = None
+
+
+def now():
+    """
+    Return the current Unix time, or the frozen time while replaying a recorded run.
+    """
+    return time.time() if _frozen_at is None else _frozen_at
+
+
+def utcnow():
+    """
+    Return now() as a timezone-aware UTC datetime.
+    """
+    return datetime.fromtimestamp(now(), tz=timezone.utc)
+
+
+def freeze(timestamp):
+    """
+    Stop the clock at a Unix time (None lets it run again). A replayed run
+    sees the time its recording started, so it plans the same requests.
+    """
+    global _frozen_at
+    _frozen_at = timestamp
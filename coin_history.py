@@ -0,0 +1,292 @@
+import json
+import os
+import re
+
+import numpy as np
+
+import clock
+from completeness import HOUR_MS
+from outputs import write_json
+from schema import coin_codes, widen
+from timeseries import TimeSeriesStore
+
+HISTORY_DIR = os.path.join('docs', 'history')
+MANIFEST_NAME = 'manifest.json'
+HISTORY_VERSION = 1
+
+DAY_HOURS = 24
+DAY_MS = DAY_HOURS * HOUR_MS
+
+# Shard series: name -> (dataset, column, hours added to the store time).
+# Every series uses the funding convention of stamping an hour with its end,
+# so candle (start of hour) times move forward one hour.
+SERIES = {
+    'funding': ('funding', 'fundingRate', 0),
+    'volume': ('ohlcv', 'volume_usd', 1),
+    'close': ('ohlcv', 'close_price', 1),
+}
+
+# Daily series from the OHLCV rollups, for chart ranges longer than the hourly
+# window: name -> column. Days are stamped with their end, like the hours above.
+DAILY_SERIES = {
+    'volume_1d': 'volume_usd',
+    'close_1d': 'close_price',
+}
+
+# Decimal places kept per series (None keeps the full value)
+SERIES_DECIMALS = {
+    'funding': None,
+    'volume': 0,
+    'close': None,
+    'volume_1d': 0,
+    'close_1d': None,
+}
+
+
+def shard_filename(coin):
+    """
+    File name of a coin's shard; characters unsafe in a URL path are replaced.
+    """
+    return re.sub(r'[^A-Za-z0-9_.-]', lambda m: f"_{ord(m.group()):x}_", coin) + '.json'
+
+
+def window_start_hour(index):
+    """
+    First hour a shard covers: the first whole UTC day in the index window,
+    so the window (and every shard) only moves once a day.
+    """
+    return -(-index.start_hour // DAY_HOURS) * DAY_HOURS
+
+
+def coin_signature(index, coin, start_hour):
+    """
+    Summarize a coin's presence in the index as [first hour, last hour, hours present].
+    Returns None if the coin has no data from start_hour on.
+    """
+    present = np.flatnonzero(index.present(coin, start_hour, index.end_hour))
+    if not len(present):
+        return None
+    return [start_hour + int(present[0]), start_hour + int(present[-1]), int(len(present))]
+
+
+def load_manifest(out_dir=HISTORY_DIR):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get('version') == HISTORY_VERSION:
+            return manifest
+    return {'version': HISTORY_VERSION, 'step': HOUR_MS, 'coins': {}}
+
+
+def _load_shard(out_dir, entry):
+    path = os.path.join(out_dir, entry['file'])
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _rows_by_coin(df, columns):
+    # coin -> {column: {hour: value}}; several rows in one hour keep the latest
+    symbols, codes = coin_codes(df['coin'])
+    series = TimeSeriesStore.from_arrays(codes, df['time'].to_numpy(dtype=np.int64),
+                                         {col: widen(df[col]) for col in columns})
+    series = series.take(series.last_per_hour())
+    by_coin = {}
+    for code in series.coin_ids():
+        rows = series.coin_slice(code)
+        hours = (series.times[rows] // HOUR_MS).tolist()
+        by_coin[symbols[code]] = {col: dict(zip(hours, series.columns[col][rows].tolist())) for col in columns}
+    return by_coin
+
+
+def _round_value(value, decimals):
+    if value is None or np.isnan(value):
+        return None
+    if decimals == 0:
+        return int(round(value))
+    if decimals is not None:
+        return round(value, decimals)
+    return value
+
+
+def _daily_rows_by_coin(df):
+    # coin -> (epoch days, {column: values}, hours rolled up)
+    symbols, codes = coin_codes(df['coin'])
+    columns = list(DAILY_SERIES.values())
+    series = TimeSeriesStore.from_arrays(codes, df['time'].to_numpy(dtype=np.int64),
+                                         {col: widen(df[col]) for col in columns + ['hours']})
+    by_coin = {}
+    for code in series.coin_ids():
+        rows = series.coin_slice(code)
+        by_coin[symbols[code]] = (series.times[rows] // DAY_MS, {col: series.columns[col][rows] for col in columns},
+                                  int(series.columns['hours'][rows].sum()))
+    return by_coin
+
+
+def _daily_series(days, values, decimals):
+    # Lay daily values onto a daily grid stamped with each day's end
+    grid = [None] * (int(days[-1] - days[0]) + 1)
+    for day, value in zip((days - days[0]).tolist(), values.tolist()):
+        grid[day] = _round_value(value, decimals)
+    return {'start': (int(days[0]) + 1) * DAY_MS, 'step': DAY_MS, 'values': grid}
+
+
+def _merge_series(series, shift, values_by_hour, decimals):
+    # Lay hourly values onto the series grid, extending it as needed
+    if not values_by_hour:
+        return series
+    if series is None:
+        start_ms = (min(values_by_hour) + shift) * HOUR_MS
+        series = {'start': start_ms, 'values': []}
+    start_hour = series['start'] // HOUR_MS - shift
+    values = series['values']
+    needed = max(values_by_hour) - start_hour + 1
+    if needed > len(values):
+        values.extend([None] * (needed - len(values)))
+    for hour, value in values_by_hour.items():
+        if hour < start_hour:
+            continue
+        values[hour - start_hour] = _round_value(value, decimals)
+    return series
+
+
+def update_history_shards(stores, out_dir=HISTORY_DIR, daily=None):
+    """
+    Write one JSON history file per coin for the website's coin detail view,
+    plus a manifest listing them.
+
+    A shard holds hourly funding, volume and close series on one hourly grid
+    for the window the completeness indexes cover, and daily volume and close
+    series (with their own 'step') for every day the daily rollups hold.
+    Only coins whose data changed are rewritten: a coin whose index only
+    gained hours after its last shard hour is extended from the new hours
+    alone, and any other change (repairs, the window moving to a new day)
+    rebuilds that coin's series from the store. The daily series are rebuilt
+    whenever a coin's daily rows change.
+
+    Args:
+        stores: Dict of dataset name ('funding', 'ohlcv') -> PartitionedStore
+        out_dir: Directory for the shards and the manifest
+        daily: Store of daily OHLCV rollups (None for no daily series)
+
+    Returns:
+        Number of shards written
+    """
+    manifest = load_manifest(out_dir)
+    entries = manifest['coins']
+
+    # Compare each coin's index presence with what its shard was built from
+    signatures = {}
+    windows = {}
+    for dataset, store in stores.items():
+        if store.index is None or store.index.end_hour is None:
+            continue
+        start_hour = window_start_hour(store.index)
+        windows[dataset] = start_hour
+        signatures[dataset] = {}
+        for coin in store.index.coins:
+            signature = coin_signature(store.index, coin, start_hour)
+            if signature is not None:
+                signatures[dataset][coin] = signature
+
+    coins = sorted({coin for sigs in signatures.values() for coin in sigs})
+
+    # Daily rollups are small enough to read whole; a coin's signature is
+    # [first day, last day, hours rolled up]
+    daily_rows = {}
+    if daily is not None:
+        daily_rows = _daily_rows_by_coin(daily.read(columns=['coin', 'time', 'hours'] + list(DAILY_SERIES.values())))
+    daily_signatures = {coin: [int(days[0]), int(days[-1]), hours] for coin, (days, _, hours) in daily_rows.items()}
+    appends = {dataset: {} for dataset in signatures}  # coin -> first hour to add
+    rebuilds = {dataset: set() for dataset in signatures}
+    for coin in coins:
+        entry = entries.get(coin)
+        shard_exists = entry is not None and os.path.exists(os.path.join(out_dir, entry['file']))
+        for dataset, sigs in signatures.items():
+            old = entry.get(dataset) if shard_exists else None
+            new = sigs.get(coin)
+            if shard_exists and old == new:
+                continue
+            index = stores[dataset].index
+            if (old is not None and new is not None and old[0] == new[0]
+                    and np.count_nonzero(index.present(coin, old[0], old[1] + 1)) == old[2]):
+                # Only hours after the shard's last hour are new
+                appends[dataset][coin] = old[1] + 1
+            else:
+                rebuilds[dataset].add(coin)
+
+    # One store read per dataset and kind of update
+    updates = {}
+    for dataset in signatures:
+        columns = [column for series_dataset, column, _ in SERIES.values() if series_dataset == dataset]
+        reads = []
+        if appends[dataset]:
+            reads.append((min(appends[dataset].values()), list(appends[dataset])))
+        if rebuilds[dataset]:
+            reads.append((windows[dataset], sorted(rebuilds[dataset])))
+        for start_hour, read_coins in reads:
+            df = stores[dataset].read(start_ms=start_hour * HOUR_MS, coins=read_coins,
+                                      columns=['coin', 'time'] + columns)
+            for coin, by_column in _rows_by_coin(df, columns).items():
+                # Rows before a coin's append point are already in its shard
+                cutoff = appends[dataset].get(coin, start_hour)
+                updates.setdefault(coin, {})[dataset] = {
+                    column: {hour: value for hour, value in by_hour.items() if hour >= cutoff}
+                    for column, by_hour in by_column.items()}
+
+    written = 0
+    now_ms = int(clock.now() * 1000)
+    os.makedirs(out_dir, exist_ok=True)
+    for coin in coins:
+        changed = [dataset for dataset in signatures if coin in appends[dataset] or coin in rebuilds[dataset]]
+        entry = entries.get(coin) or {'file': shard_filename(coin)}
+        daily_changed = daily is not None and entry.get('ohlcv_daily') != daily_signatures.get(coin)
+        if not changed and not daily_changed:
+            continue
+        shard = _load_shard(out_dir, entry)
+        if shard is None:
+            shard = {'version': HISTORY_VERSION, 'coin': coin, 'step': HOUR_MS}
+            daily_changed = daily is not None
+        for name, (dataset, column, shift) in SERIES.items():
+            if dataset not in changed:
+                continue
+            series = None if coin in rebuilds[dataset] else shard.get(name)
+            values = updates.get(coin, {}).get(dataset, {}).get(column, {})
+            series = _merge_series(series, shift, values, SERIES_DECIMALS[name])
+            if series is None:
+                shard.pop(name, None)
+            else:
+                shard[name] = series
+        if daily_changed:
+            days, values, _ = daily_rows.get(coin, (None, {}, 0))
+            for name, column in DAILY_SERIES.items():
+                if days is None:
+                    shard.pop(name, None)
+                else:
+                    shard[name] = _daily_series(days, values[column], SERIES_DECIMALS[name])
+
+        # A shard whose content came out the same (e.g. a repair outside its
+        # series) keeps its file and its cache-busting update time
+        if write_json(os.path.join(out_dir, entry['file']), shard):
+            written += 1
+            entry['updated'] = now_ms
+        entry.setdefault('updated', now_ms)
+        for dataset in changed:
+            entry[dataset] = signatures[dataset].get(coin)
+        if daily_changed:
+            entry['ohlcv_daily'] = daily_signatures.get(coin)
+        entries[coin] = entry
+
+    # Coins no longer in any index lose their shard
+    removed = [coin for coin in entries if coin not in coins]
+    for coin in removed:
+        path = os.path.join(out_dir, entries.pop(coin)['file'])
+        if os.path.exists(path):
+            os.remove(path)
+
+    if written or removed or 'generated_at' not in manifest:
+        manifest['generated_at'] = now_ms
+    write_json(os.path.join(out_dir, MANIFEST_NAME), manifest)
+    return written
@@ -0,0 +1,248 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from outputs import npz_bytes, write_file
+
+HOUR_MS = 60 * 60 * 1000
+
+
+class CompletenessIndex:
+    """
+    One bit per coin per hour recording which hours are present in a store.
+
+    The index covers a sliding window of `retention_hours` ending at the
+    latest hour seen, and is persisted as packed bits in a .npz file next to
+    the data. It is updated on every store write, so gap checks can look up
+    each coin's holes without reading the data itself.
+
+    Each coin may also have a "listed from" hour: hours before it are known to
+    have no data (the coin was not listed yet) and are not reported missing.
+    """
+
+    def __init__(self, path, retention_hours):
+        self.path = path
+        self.retention_hours = int(retention_hours)
+        self.coins = []
+        self._ids = {}
+        self.end_hour = None  # Exclusive end of the window, in epoch hours
+        self.bits = np.zeros((0, self.retention_hours), dtype=bool)
+        self.listed_from = {}
+        self._lock = threading.RLock()
+        self.loaded = False
+        if os.path.exists(path):
+            self._load()
+
+    @property
+    def start_hour(self):
+        return None if self.end_hour is None else self.end_hour - self.retention_hours
+
+    def _load(self):
+        with np.load(self.path, allow_pickle=False) as npz:
+            if int(npz['retention_hours']) != self.retention_hours:
+                # Retention changed; the index is rebuilt from the store instead
+                return
+            self.coins = [str(coin) for coin in npz['coins']]
+            self.end_hour = int(npz['end_hour'])
+            self.bits = np.unpackbits(npz['bits'], axis=1, count=self.retention_hours).astype(bool)
+            self.listed_from = {coin: int(hour) for coin, hour in zip(self.coins, npz['listed_from']) if hour >= 0}
+        self._ids = {coin: i for i, coin in enumerate(self.coins)}
+        self.loaded = True
+
+    def save(self):
+        with self._lock:
+            if self.end_hour is None:
+                return
+            write_file(self.path, npz_bytes({
+                'coins': np.array(self.coins, dtype='U'),
+                'end_hour': np.int64(self.end_hour),
+                'retention_hours': np.int64(self.retention_hours),
+                'bits': np.packbits(self.bits, axis=1),
+                'listed_from': np.array([self.listed_from.get(coin, -1) for coin in self.coins], dtype=np.int64),
+            }))
+
+    def _advance(self, end_hour):
+        # Slide the window forward so it ends at end_hour
+        if self.end_hour is None:
+            self.end_hour = end_hour
+            return
+        shift = end_hour - self.end_hour
+        if shift <= 0:
+            return
+        if shift >= self.retention_hours:
+            self.bits[:] = False
+        else:
+            self.bits[:, :-shift] = self.bits[:, shift:]
+            self.bits[:, -shift:] = False
+        self.end_hour = end_hour
+
+    def _coin_ids(self, coins):
+        new_coins = [coin for coin in dict.fromkeys(coins) if coin not in self._ids]
+        if new_coins:
+            for coin in new_coins:
+                self._ids[coin] = len(self.coins)
+                self.coins.append(coin)
+            self.bits = np.vstack([self.bits, np.zeros((len(new_coins), self.retention_hours), dtype=bool)])
+        return np.array([self._ids[coin] for coin in coins], dtype=np.int64)
+
+    def mark(self, coins, times_ms):
+        """
+        Record that each (coin, time) pair is present.
+
+        Args:
+            coins: Sequence of coin symbols (a categorical is factorized on its codes)
+            times_ms: Sequence of timestamps in milliseconds (floored to the hour)
+        """
+        hours = np.asarray(times_ms, dtype=np.int64) // HOUR_MS
+        if len(hours) == 0:
+            return
+        if isinstance(coins, (list, tuple)):
+            coins = np.asarray(coins, dtype=object)
+        # One id lookup per distinct coin instead of one per row
+        codes, symbols = pd.factorize(coins)
+        with self._lock:
+            self._advance(int(hours.max()) + 1)
+            ids = self._coin_ids([str(coin) for coin in symbols])[codes]
+            cols = hours - self.start_hour
+            valid = cols >= 0
+            self.bits[ids[valid], cols[valid]] = True
+
+    def rebuild(self, store):
+        """
+        Recreate the index from the contents of a store.
+        """
+        df = store.read(columns=['coin', 'time'])
+        with self._lock:
+            self.coins = []
+            self._ids = {}
+            self.end_hour = None
+            self.bits = np.zeros((0, self.retention_hours), dtype=bool)
+            self.listed_from = {}
+            self.mark(df['coin'].array, df['time'].to_numpy())
+        self.save()
+
+    def _present(self, coin, start_hour, end_hour):
+        # Presence flags for [start_hour, end_hour); hours outside the window count as absent
+        present = np.zeros(end_hour - start_hour, dtype=bool)
+        coin_id = self._ids.get(coin)
+        if coin_id is None or self.end_hour is None:
+            return present
+        lo = max(start_hour, self.start_hour)
+        hi = min(end_hour, self.end_hour)
+        if lo < hi:
+            present[lo - start_hour:hi - start_hour] = self.bits[coin_id, lo - self.start_hour:hi - self.start_hour]
+        return present
+
+    def first_hour(self, coin):
+        """
+        Return the first hour (in epoch hours) the coin has data in the window, or None.
+        """
+        with self._lock:
+            coin_id = self._ids.get(coin)
+            if coin_id is None:
+                return None
+            set_cols = np.flatnonzero(self.bits[coin_id])
+            return int(self.start_hour + set_cols[0]) if len(set_cols) else None
+
+    def note_range_fetched(self, coin, start_ms, end_ms, times_ms):
+        """
+        Record the result of a successful range request.
+
+        If the coin has no data before the range and the first returned record
+        is later than the range start, the hours in between predate the coin's
+        listing and stop being reported as missing. An empty response tells
+        nothing (the coin may be delisted or the exchange lagging) and is ignored.
+        """
+        if len(times_ms) == 0:
+            return
+        start_hour = int(start_ms) // HOUR_MS
+        first_returned = int(min(times_ms)) // HOUR_MS
+        if first_returned <= start_hour:
+            return
+        with self._lock:
+            first_hour = self.first_hour(coin)
+            if first_hour is not None and first_hour < start_hour:
+                return
+            self.listed_from[coin] = first_returned
+            self._coin_ids([coin])
+
+    def update_listed_from(self, listed):
+        """
+        Set the "listed from" hour of several coins (coin -> epoch hour), e.g.
+        ones another copy of the index learned from its range requests.
+        """
+        with self._lock:
+            self.listed_from.update(listed)
+            self._coin_ids(list(listed))
+
+    def present(self, coin, start_hour, end_hour):
+        """
+        Return presence flags for the coin's hours [start_hour, end_hour) (epoch hours).
+        """
+        with self._lock:
+            return self._present(coin, start_hour, end_hour)
+
+    def has(self, coin, time_ms):
+        hour = int(time_ms) // HOUR_MS
+        with self._lock:
+            return bool(self._present(coin, hour, hour + 1)[0])
+
+    def missing_ranges(self, coin, start_ms, end_ms, max_span_hours=None):
+        """
+        Find the coin's missing hours in [start_ms, end_ms) as merged ranges.
+
+        Hours before the coin's listing hour are not expected. Adjacent missing
+        hours always form one range; holes separated by present hours are
+        merged into one range as long as the result spans at most
+        `max_span_hours`, so a single request can cover them.
+
+        Returns:
+            List of (start_ms, end_ms) tuples
+        """
+        start_hour = int(start_ms) // HOUR_MS
+        end_hour = -(-int(end_ms) // HOUR_MS)
+        if end_hour <= start_hour:
+            return []
+        with self._lock:
+            listed_from = self.listed_from.get(coin)
+            if listed_from is not None:
+                start_hour = max(start_hour, listed_from)
+                if end_hour <= start_hour:
+                    return []
+            missing = ~self._present(coin, start_hour, end_hour)
+
+        if not missing.any():
+            return []
+        # Run boundaries of consecutive missing hours
+        edges = np.diff(np.concatenate([[0], missing.astype(np.int8), [0]]))
+        run_starts = np.flatnonzero(edges == 1)
+        run_ends = np.flatnonzero(edges == -1)
+
+        ranges = []
+        for run_start, run_end in zip(run_starts, run_ends):
+            if ranges and max_span_hours is not None and run_end - ranges[-1][0] <= max_span_hours:
+                ranges[-1][1] = run_end
+            else:
+                ranges.append([run_start, run_end])
+        return [(int(start_hour + lo) * HOUR_MS, int(start_hour + hi) * HOUR_MS) for lo, hi in ranges]
+
+    def plan_repairs(self, coins, start_ms, end_ms, max_span_hours=None):
+        """
+        Plan the range requests needed to fill every coin's holes in [start_ms, end_ms).
+
+        Returns:
+            List of (coin, start_ms, end_ms) tuples, grouped by coin in input order
+        """
+        plan = []
+        for coin in coins:
+            for range_start, range_end in self.missing_ranges(coin, start_ms, end_ms, max_span_hours):
+                plan.append((coin, range_start, range_end))
+        return plan
+
+    def coins_missing(self, coins, time_ms):
+        """
+        Return the coins that have no data for the hour containing time_ms.
+        """
+        return [coin for coin in coins if not self.has(coin, time_ms)]
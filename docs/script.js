@@ -19,6 +19,9 @@ let chartOrder = ['funding'];
 // Global variable to track ADV range in days
 let advRangeDays = 30; // Default to 30 days
 
+// Global variable to track the window of the last carry column (a key of data.funding without 'avg_')
+let carryWindow = '7d'; // Default to 7 days
+
 // Global variables for chart data and options
 let chartData = null;
 let chartOptions = null;
@@ -85,6 +88,46 @@ function formatRate(rate, mode = displayMode) {
     }
 }
 
+// Format funding volatility (same units as the rates, without the sign colors)
+function formatVol(vol, mode = displayMode) {
+    if (vol === null || vol === undefined) {
+        return '<span class="no-data">Not enough data</span>';
+    }
+    return mode === 'apr' ? vol.toFixed(2) + '%' : (vol / (24 * 365)).toFixed(6) + '%';
+}
+
+// Format a unitless statistic (z-score, carry/vol ratio)
+function formatStat(value, decimals = 2) {
+    if (value === null || value === undefined) {
+        return '<span class="no-data">Not enough data</span>';
+    }
+    return value.toFixed(decimals);
+}
+
+// Format a sign streak in hours, e.g. "+36h" for 36 positive prints in a row
+function formatStreak(hours) {
+    if (hours === null || hours === undefined) {
+        return '<span class="no-data">Not enough data</span>';
+    }
+    if (hours > 0) {
+        return '<span class="positive-rate">+' + hours + 'h</span>';
+    } else if (hours < 0) {
+        return '<span class="negative-rate">' + hours + 'h</span>';
+    }
+    return '0h';
+}
+
+// Format the 30-day median rate, with the 10th-90th percentile range as a tooltip
+function formatMedian(median, row, mode = displayMode) {
+    if (median === null || median === undefined || row.p10 === null || row.p90 === null) {
+        return formatRate(median, mode);
+    }
+    const scale = mode === 'apr' ? 1 : 1 / (24 * 365);
+    const decimals = mode === 'apr' ? 2 : 6;
+    const range = `10th-90th percentile: ${(row.p10 * scale).toFixed(decimals)}% to ${(row.p90 * scale).toFixed(decimals)}%`;
+    return '<span title="' + range + '">' + formatRate(median, mode) + '</span>';
+}
+
 // Format coin name with hyperlink to Hyperliquid trading page
 function formatCoinName(coin, isNew = false, isDelisted = false) {
     const url = `https://app.hyperliquid.xyz/trade/${coin}`;
@@ -105,135 +148,137 @@ function formatCoinName(coin, isNew = false, isDelisted = false) {
             </div>`;
 }
 
-// Combine all data into a single dataset with one row per coin
-function combineData(data) {
-    // Get all unique coins from all datasets
-    const allCoins = new Set();
-    
-    // Add coins from current data
-    if (data.positive_current) {
-        data.positive_current.forEach(item => allCoins.add(item.coin));
+// Load funding_data.json once and share it between the table and the popups
+let fundingDataRequest = null;
+function getFundingData() {
+    if (!fundingDataRequest) {
+        fundingDataRequest = $.getJSON('funding_data.json').then(upgradePayload);
+        fundingDataRequest.fail(function() { fundingDataRequest = null; });
     }
-    if (data.negative_current) {
-        data.negative_current.forEach(item => allCoins.add(item.coin));
-    }
-    
-    // Add coins from average data
-    ['1d', '3d', '5d'].forEach(period => {
-        if (data[`positive_${period}`]) {
-            data[`positive_${period}`].forEach(item => allCoins.add(item.coin));
-        }
-        if (data[`negative_${period}`]) {
-            data[`negative_${period}`].forEach(item => allCoins.add(item.coin));
-        }
-    });
-    
-    // Create a map for quick lookups
-    const currentRates = {};
-    
-    // Combine positive and negative current rates
-    if (data.positive_current) {
-        data.positive_current.forEach(item => {
-            currentRates[item.coin] = item.fundingRate_annualized;
-        });
-    }
-    if (data.negative_current) {
-        data.negative_current.forEach(item => {
-            currentRates[item.coin] = item.fundingRate_annualized;
-        });
+    return fundingDataRequest;
+}
+
+// Convert a version 1 payload (positive_/negative_ record lists per metric and
+// adv_data keyed by coin) to the columnar layout of version 2
+function upgradePayload(data) {
+    if (data.version >= 2) {
+        return data;
     }
-    
-    // Create maps for average rates
-    const avgRates = {
-        '1d': {},
-        '3d': {},
-        '5d': {}
+    const metrics = {
+        current: ['current', 'fundingRate_annualized'],
+        avg_1d: ['1d', 'fundingRate_avg_1d'],
+        avg_3d: ['3d', 'fundingRate_avg_3d'],
+        avg_5d: ['5d', 'fundingRate_avg_5d']
     };
-    
-    // Create a map for ADV data
-    const advValues = {};
-    
-    // If ADV data exists, get the values for the currently selected range
-    if (data.adv_data && data.adv_data[`${advRangeDays}d`]) {
-        advValues.current = data.adv_data[`${advRangeDays}d`];
-    }
-    
-    // Create a map for tracking which coins are new
-    const newCoins = {};
-    
-    // Populate average rate maps
-    ['1d', '3d', '5d'].forEach(period => {
-        if (data[`positive_${period}`]) {
-            data[`positive_${period}`].forEach(item => {
-                avgRates[period][item.coin] = item[`fundingRate_avg_${period}`];
-                // Store the isNew flag if present
-                if (item.isNew !== undefined) {
-                    newCoins[item.coin] = item.isNew;
+    const rows = new Map();
+    const values = {};
+    Object.entries(metrics).forEach(([name, [period, field]]) => {
+        values[name] = {};
+        ['positive', 'negative'].forEach(sign => {
+            (data[`${sign}_${period}`] || []).forEach(item => {
+                if (!rows.has(item.coin)) {
+                    rows.set(item.coin, Boolean(item.isNew));
                 }
+                values[name][item.coin] = item[field];
             });
-        }
-        if (data[`negative_${period}`]) {
-            data[`negative_${period}`].forEach(item => {
-                avgRates[period][item.coin] = item[`fundingRate_avg_${period}`];
-                // Store the isNew flag if present
-                if (item.isNew !== undefined) {
-                    newCoins[item.coin] = item.isNew;
-                }
-            });
-        }
-    });
-    
-    // Also check for isNew flag in current data
-    if (data.positive_current) {
-        data.positive_current.forEach(item => {
-            if (item.isNew !== undefined) {
-                newCoins[item.coin] = item.isNew;
-            }
         });
+    });
+    const coins = Array.from(rows.keys());
+    const column = (byCoin) => coins.map(coin => byCoin[coin] ?? null);
+    const funding = {};
+    Object.keys(metrics).forEach(name => { funding[name] = column(values[name]); });
+    const adv = {};
+    Object.entries(data.adv_data || {}).forEach(([range, byCoin]) => { adv[range] = column(byCoin); });
+    return {
+        version: 2,
+        timestamp: data.timestamp,
+        generated_at: data.generated_at,
+        coins: coins,
+        is_new: coins.map(coin => (rows.get(coin) ? 1 : 0)),
+        funding: funding,
+        adv: adv,
+        stats: {}
+    };
+}
+
+// Return the row index of a coin in the columnar payload (or -1)
+function coinIndex(data, coin) {
+    if (!data.coinIndex) {
+        // Built once, so every lookup is a map access instead of a scan
+        data.coinIndex = new Map(data.coins.map((name, i) => [name, i]));
     }
-    if (data.negative_current) {
-        data.negative_current.forEach(item => {
-            if (item.isNew !== undefined) {
-                newCoins[item.coin] = item.isNew;
+    const index = data.coinIndex.get(coin);
+    return index === undefined ? -1 : index;
+}
+
+// Return a coin's average for the selected carry window (null if the payload has no such window)
+function carryWindowValue(data, index) {
+    const values = data.funding[`avg_${carryWindow}`];
+    return values && index >= 0 ? values[index] || null : null;
+}
+
+// Column title for the selected carry window, e.g. "14-Day Carry"
+function carryWindowTitle() {
+    return `${parseInt(carryWindow, 10)}-Day Carry`;
+}
+
+// Return a coin's 30-day funding statistic (null if the payload has none)
+function statValue(data, name, index) {
+    const values = data.stats ? data.stats[name] : null;
+    return values ? values[index] ?? null : null;
+}
+
+// Table column for a statistic: formatted for display, the raw value for sorting
+function statColumn(field, title, format) {
+    return {
+        data: field,
+        title: title,
+        type: 'num',
+        render: function(data, type, row) {
+            if (type === 'display') {
+                return format(data, row);
             }
-        });
-    }
+            return data === null ? -Infinity : data;
+        }
+    };
+}
+
+// Combine all data into a single dataset with one row per coin
+function combineData(data) {
+    // ADV values for the currently selected range, aligned with data.coins
+    const advValues = data.adv ? data.adv[`${advRangeDays}d`] : null;
     
     // Create the combined dataset
     const combinedData = [];
     
     // Create data rows
-    allCoins.forEach(coin => {
-        // Use the isNew flag from the server if available,
-        // otherwise fall back to the old logic as a backup
-        let isNewCoin = newCoins[coin];
-        
-        // Fallback logic if server didn't provide isNew flag
-        if (isNewCoin === undefined) {
-            isNewCoin = avgRates['5d'][coin] === undefined || avgRates['5d'][coin] === null;
-            console.warn(`Missing isNew flag for coin ${coin}, using fallback detection`);
-        }
-        
-        // Get the ADV value for the current range if available
-        let advValue = null;
-        if (advValues.current && advValues.current[coin] !== undefined) {
-            advValue = advValues.current[coin];
-        }
+    data.coins.forEach((coin, i) => {
+        const isNewCoin = data.is_new[i] === 1;
+        const avg1d = data.funding.avg_1d[i];
+        const avg5d = data.funding.avg_5d[i];
         
         // Determine if coin is delisted - has 5d data but missing 1d data
-        const has5dData = avgRates['5d'][coin] !== undefined && avgRates['5d'][coin] !== null;
-        const missing1dData = !avgRates['1d'][coin] || avgRates['1d'][coin] === null;
+        const has5dData = avg5d !== null;
+        const missing1dData = !avg1d;
         const isDelisted = has5dData && missing1dData && !isNewCoin;
         
         combinedData.push({
             coin: coin,
             isNew: isNewCoin,
             isDelisted: isDelisted,
-            adv: advValue,  // Add ADV data
-            latestRate: currentRates[coin] || null,
-            avg1d: avgRates['1d'][coin] || null,
-            avg3d: avgRates['3d'][coin] || null,
-            avg5d: avgRates['5d'][coin] || null
+            adv: advValues ? advValues[i] : null,  // Add ADV data
+            latestRate: data.funding.current[i] || null,
+            avg1d: avg1d || null,
+            avg3d: data.funding.avg_3d[i] || null,
+            avg5d: avg5d || null,
+            avgWindow: carryWindowValue(data, i),
+            vol30d: statValue(data, 'vol_30d', i),
+            carryVol30d: statValue(data, 'carry_vol_30d', i),
+            zscore30d: statValue(data, 'zscore_30d', i),
+            streak: statValue(data, 'streak', i),
+            p10: statValue(data, 'p10_30d', i),
+            p50: statValue(data, 'p50_30d', i),
+            p90: statValue(data, 'p90_30d', i)
         });
     });
     
@@ -330,7 +375,20 @@ function initializeTable(data) {
                 render: function(data) {
                     return formatRate(data, displayMode);
                 }
-            }
+            },
+            {
+                data: 'avgWindow',
+                title: carryWindowTitle(),
+                type: 'funding-rate',
+                render: function(data) {
+                    return formatRate(data, displayMode);
+                }
+            },
+            statColumn('vol30d', '30d Vol', data => formatVol(data, displayMode)),
+            statColumn('carryVol30d', 'Carry/Vol', data => formatStat(data)),
+            statColumn('zscore30d', 'Z-Score', data => formatStat(data)),
+            statColumn('streak', 'Streak', data => formatStreak(data)),
+            statColumn('p50', '30d Median', (data, row) => formatMedian(data, row, displayMode))
         ],
         order: [[2, 'desc']], // Sort by latest funding rate by default (now column index 2 since we added ADV)
         responsive: true,
@@ -346,7 +404,7 @@ function initializeTable(data) {
         // Custom order callback for null-safe sorting on numeric columns
         columnDefs: [
             {
-                targets: [1, 2, 3, 4, 5], // Apply to ADV and all funding rate columns
+                targets: [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11], // Apply to ADV, funding rate and statistic columns
                 createdCell: function(cell, cellData, rowData, rowIndex, colIndex) {
                     // Add a custom attribute to cells with null values for easier identification
                     if (cellData === null || cellData === undefined) {
@@ -363,8 +421,8 @@ function initializeTable(data) {
         const columnIndex = order[0][0];
         const direction = order[0][1];
         
-        // Apply custom sorting for ADV column (1) and funding rate columns (2-5)
-        if (columnIndex >= 1 && columnIndex <= 5) {
+        // Apply custom sorting for ADV column (1), funding rate columns (2-6) and statistic columns (7-11)
+        if (columnIndex >= 1 && columnIndex <= 11) {
             // Get all rows with null values in the sorted column
             const nullRows = table.rows().nodes().toArray().filter(function(node) {
                 return $(node).find('td').eq(columnIndex).hasClass('null-value');
@@ -758,6 +816,76 @@ function showCoinInfoPopup(coin) {
     });
 }
 
+// Per-coin hourly history files written by generate_website.py
+let historyManifestRequest = null;
+const coinHistoryRequests = {};
+
+// Load a coin's history file (funding, volume and close series) and call
+// options.success(history) or options.error(xhr, status, error), like $.ajax.
+// Requests are shared, so the three charts of a coin download it once.
+function loadCoinHistory(coin, options) {
+    if (!historyManifestRequest) {
+        historyManifestRequest = $.ajax({ url: 'history/manifest.json', dataType: 'json', cache: false });
+        historyManifestRequest.fail(function() { historyManifestRequest = null; });
+    }
+    
+    historyManifestRequest.then(function(manifest) {
+        const entry = manifest.coins[coin];
+        if (!entry) {
+            // No history for this coin: an empty file shows the "no data" messages
+            return { version: manifest.version, coin: coin };
+        }
+        if (!coinHistoryRequests[coin]) {
+            // The update time in the query string bypasses stale cached copies
+            coinHistoryRequests[coin] = $.getJSON(`history/${entry.file}?v=${entry.updated}`);
+            coinHistoryRequests[coin].fail(function() { delete coinHistoryRequests[coin]; });
+        }
+        return coinHistoryRequests[coin];
+    }).then(options.success, options.error);
+}
+
+// Return the points of one history series as [{time, value}], skipping missing hours
+function historyPoints(history, name) {
+    const series = history[name];
+    const points = [];
+    if (!series) return points;
+    
+    const step = series.step || history.step || 60 * 60 * 1000;
+    series.values.forEach((value, i) => {
+        if (value !== null) {
+            points.push({ time: series.start + i * step, value: value });
+        }
+    });
+    return points;
+}
+
+// Daily series (e.g. 'volume_1d') reach further back than the hourly ones, so
+// a range starting before the hourly history is charted by day instead.
+// Returns {labels, data, labelInterval} on a grid of UTC days from startTime
+// to today, or null when the hourly series covers the range.
+function dailyChartData(history, name, startTime) {
+    const hourly = history[name];
+    const daily = history[name + '_1d'];
+    if (!daily || (hourly && hourly.start <= startTime)) return null;
+    
+    // Daily points are stamped with the end of their day
+    const day = 24 * 60 * 60 * 1000;
+    const values = {};
+    historyPoints(history, name + '_1d').forEach(point => {
+        values[point.time - day] = point.value;
+    });
+    const firstDay = daily.start - day;
+    
+    const labels = [];
+    const data = [];
+    for (let time = Math.floor(startTime / day) * day; time <= Date.now(); time += day) {
+        labels.push(new Date(time).toLocaleDateString([], { day: '2-digit', month: '2-digit', timeZone: 'UTC' }));
+        // Days without a value inside the covered range show as missing, like hours
+        data.push(time in values ? values[time] : time >= firstDay ? null : undefined);
+    }
+    return { labels: labels, data: data, labelInterval: Math.ceil(labels.length / 30) };
+}
+
 // Function to load chart data based on the selected range
 function loadChartData(coin, range) {
     // Show loading indicator
@@ -794,70 +922,37 @@ function loadChartData(coin, range) {
     }
     
     // Fetch the JSON data for current rates and averages
-    $.getJSON('funding_data.json', function(jsonData) {
+    getFundingData().done(function(jsonData) {
         console.log("JSON data loaded successfully");
         
-        // Get current funding rate
-        let currentRate = null;
-        if (jsonData.positive_current) {
-            const entry = jsonData.positive_current.find(item => item.coin === coin);
-            if (entry) currentRate = entry.fundingRate_annualized;
-        }
-        if (currentRate === null && jsonData.negative_current) {
-            const entry = jsonData.negative_current.find(item => item.coin === coin);
-            if (entry) currentRate = entry.fundingRate_annualized;
-        }
+        // Get current funding rate and historical averages (undefined when missing)
+        const index = coinIndex(jsonData, coin);
+        const value = (column) => (index >= 0 && column[index] ? column[index] : undefined);
         
-        // Get historical averages
-        const oneDay = jsonData.positive_1d?.find(item => item.coin === coin)?.fundingRate_avg_1d || 
-                      jsonData.negative_1d?.find(item => item.coin === coin)?.fundingRate_avg_1d;
-        
-        const threeDay = jsonData.positive_3d?.find(item => item.coin === coin)?.fundingRate_avg_3d || 
-                        jsonData.negative_3d?.find(item => item.coin === coin)?.fundingRate_avg_3d;
-        
-        const fiveDay = jsonData.positive_5d?.find(item => item.coin === coin)?.fundingRate_avg_5d || 
-                       jsonData.negative_5d?.find(item => item.coin === coin)?.fundingRate_avg_5d;
+        const currentRate = value(jsonData.funding.current) ?? null;
+        const oneDay = value(jsonData.funding.avg_1d);
+        const threeDay = value(jsonData.funding.avg_3d);
+        const fiveDay = value(jsonData.funding.avg_5d);
         
         console.log(`${coin} rates - Current: ${currentRate}, 1d: ${oneDay}, 3d: ${threeDay}, 5d: ${fiveDay}`);
         
-        // Now fetch the CSV file to get hourly data
-        $.ajax({
-            url: 'https://raw.githubusercontent.com/exo-trading/crypto-carry-screener/main/funding_data_all_coins.csv', // Try to access the file in the root directory
-            dataType: 'text',
-            success: function(csvData) {
-                console.log("CSV data loaded successfully");
-                
-                // Parse CSV data
-                const rows = csvData.split('\n');
-                console.log(`CSV has ${rows.length} rows`);
-                
-                // Try to detect CSV format
-                const firstRow = rows[0].split(',');
-                console.log(`CSV columns: ${firstRow.join(', ')}`);
+        // Now fetch the coin's history file to get hourly data
+        loadCoinHistory(coin, {
+            success: function(history) {
+                console.log("History data loaded successfully");
                 
-                // Find column indices
-                const coinIndex = firstRow.indexOf('coin');
-                const rateIndex = firstRow.indexOf('fundingRate');
-                const timeIndex = firstRow.indexOf('time');
-                
-                if (coinIndex >= 0 && rateIndex >= 0 && timeIndex >= 0) {
+                if (history.version === 1) {
                     // Filter data for the selected coin and time range
                     const coinData = [];
                     const timeLabels = [];
                     const timestamps = [];
                     
-                    // Process each row
-                    for (let i = 1; i < rows.length; i++) {
-                        if (!rows[i].trim()) continue; // Skip empty rows
-                        
-                        const columns = rows[i].split(',');
-                        if (columns.length <= Math.max(coinIndex, rateIndex, timeIndex)) continue;
+                    // Process each hourly point
+                    historyPoints(history, 'funding').forEach(point => {
+                        const fundingRate = point.value;
+                        const timestamp = point.time;
                         
-                        const rowCoin = columns[coinIndex];
-                        const fundingRate = parseFloat(columns[rateIndex]);
-                        const timestamp = parseInt(columns[timeIndex]);
-                        
-                        if (rowCoin === coin && timestamp >= startTime && !isNaN(fundingRate) && !isNaN(timestamp)) {
+                        if (timestamp >= startTime) {
                             // Convert funding rate to percentage and annualize it
                             // Hourly funding rate * 24 * 365 = APR
                             const fundingRateAPR = fundingRate * 24 * 365 * 100;
@@ -877,7 +972,7 @@ function loadChartData(coin, range) {
                             timeLabels.push(timeLabel);
                             timestamps.push(timestamp);
                         }
-                    }
+                    });
                     
                     // Hide loading indicator
                     $('#chartLoading').hide();
@@ -1098,18 +1193,18 @@ function loadChartData(coin, range) {
                     // Create the chart with the current chart type
                     createChart();
                 } else {
-                    // CSV format not recognized
+                    // History format not recognized
                     $('#chartLoading').hide();
                     $('.chart-container').hide(); // Hide the chart container
                     $('#coinInfoPopupContent').append('<p class="error-message">Could not parse funding data format.</p>');
                 }
             },
             error: function(xhr, status, error) {
-                console.error("Error loading CSV:", error);
+                console.error("Error loading history:", error);
                 console.log("Status:", status);
                 console.log("XHR:", xhr);
                 
-                // If CSV fetch fails, use the averages
+                // If the history fetch fails, use the averages
                 $('#chartLoading').hide();
                 
                 if (currentRate === null && oneDay === undefined && threeDay === undefined && fiveDay === undefined) {
@@ -1716,49 +1811,36 @@ function loadVolumeData(coin, range) {
             startTime = now - (24 * 60 * 60 * 1000); // Default to 1 day
     }
     
-    // Fetch the CSV file to get volume data
-    $.ajax({
-        url: 'https://raw.githubusercontent.com/exo-trading/crypto-carry-screener/main/ohlcv_data_main.csv', // Access the volume data file with the correct name
-        dataType: 'text',
-        success: function(csvData) {
-            console.log("Volume CSV data loaded successfully");
-            
-            // Parse CSV data
-            const rows = csvData.split('\n');
-            console.log(`Volume CSV has ${rows.length} rows`);
-            
-            // Try to detect CSV format
-            const firstRow = rows[0].split(',');
-            console.log(`Volume CSV columns: ${firstRow.join(', ')}`);
-            
-            // Find column indices - assuming OHLCV format with columns: timestamp, open, high, low, close, volume
-            const timeIndex = firstRow.indexOf('time');
-            const coinIndex = firstRow.indexOf('coin');
-            const volumeIndex = firstRow.indexOf('volume_usd');
+    // Fetch the coin's history file to get volume data
+    loadCoinHistory(coin, {
+        success: function(history) {
+            console.log("Volume history data loaded successfully");
             
-            if (timeIndex >= 0 && coinIndex >= 0 && volumeIndex >= 0) {
+            if (history.version === 1) {
+                // Long ranges are charted from the daily rollups
+                const daily = dailyChartData(history, 'volume', startTime);
+                if (daily) {
+                    $('#volumeChartLoading').hide();
+                    $('#volumeChartContainer .error-message').remove();
+                    $('#volumeChartContainer .chart-container').show();
+                    createVolumeChart(daily.labels, daily.data, daily.labelInterval);
+                    return;
+                }
+                
                 // Filter data for the selected coin and time range
                 const volumeData = [];
                 const timeLabels = [];
                 const timestamps = [];
                 
-                // Process each row
-                for (let i = 1; i < rows.length; i++) {
-                    if (!rows[i].trim()) continue; // Skip empty rows
-                    
-                    const columns = rows[i].split(',');
-                    if (columns.length <= Math.max(coinIndex, volumeIndex, timeIndex)) continue;
+                // Process each hourly point
+                historyPoints(history, 'volume').forEach(point => {
+                    const volume = point.value;
                     
-                    const rowCoin = columns[coinIndex];
-                    const volume = parseFloat(columns[volumeIndex]);
-                    const timestamp = parseInt(columns[timeIndex]);
+                    // History times already mark when the hour ENDED, like funding data
+                    // (the candle start time plus one hour)
+                    const adjustedTimestamp = point.time;
                     
-                    // Important: Volume timestamp shows when hour STARTED
-                    // Funding timestamp shows when hour ENDED
-                    // Add one hour to volume timestamp to align with funding data
-                    const adjustedTimestamp = timestamp + (60 * 60 * 1000);
-                    
-                    if (rowCoin === coin && adjustedTimestamp >= startTime && !isNaN(volume) && !isNaN(timestamp)) {
+                    if (adjustedTimestamp >= startTime) {
                         // Format time as hour (using adjusted timestamp for display)
                         const date = new Date(adjustedTimestamp);
                         // Shift time back by 1 hour to show the start of the collection period
@@ -1774,7 +1856,7 @@ function loadVolumeData(coin, range) {
                         timeLabels.push(timeLabel);
                         timestamps.push(adjustedTimestamp);
                     }
-                }
+                });
                 
                 // Hide loading indicator
                 $('#volumeChartLoading').hide();
@@ -1903,14 +1985,14 @@ function loadVolumeData(coin, range) {
                 createVolumeChart(completeTimeLabels, completeData);
                 
             } else {
-                // CSV format not recognized
+                // History format not recognized
                 $('#volumeChartLoading').hide();
                 $('#volumeChartContainer .chart-container').hide(); // Hide the chart container
                 $('#volumeChartContainer').append('<p class="error-message">Could not parse volume data format.</p>');
             }
         },
         error: function(xhr, status, error) {
-            console.error("Error loading volume CSV:", error);
+            console.error("Error loading volume history:", error);
             console.log("Status:", status);
             console.log("XHR:", xhr);
             
@@ -1923,7 +2005,7 @@ function loadVolumeData(coin, range) {
 }
 
 // Function to create the volume chart
-function createVolumeChart(labels, data) {
+function createVolumeChart(labels, data, labelInterval) {
     const ctx = document.getElementById('volumeHistoryChart').getContext('2d');
     
     // Destroy existing chart if it exists
@@ -2314,15 +2396,15 @@ function createVolumeChart(labels, data) {
                         minRotation: 45,
                         // Limit the number of x-axis labels for readability
                         callback: function(val, index) {
-                            // For longer ranges, show fewer labels
+                            // For longer ranges, show fewer labels (daily charts pass their own interval)
                             // Use the global selectedChartRange directly
-                            const labelInterval = selectedChartRange === '1d' ? 1 : 
+                            const interval = labelInterval || (selectedChartRange === '1d' ? 1 : 
                                                 selectedChartRange === '1w' ? 6 : 
                                                 selectedChartRange === '2w' ? 12 : 
                                                 selectedChartRange === '1m' ? 24 : 
                                                 selectedChartRange === '2m' ? 48 :
-                                                72; // For '3m', show every 72 hours
-                            return index % labelInterval === 0 ? this.getLabelForValue(val) : '';
+                                                72); // For '3m', show every 72 hours
+                            return index % interval === 0 ? this.getLabelForValue(val) : '';
                         }
                     }
                 },
@@ -2389,7 +2471,7 @@ function createVolumeChart(labels, data) {
 }
 
 $(document).ready(function() {
-    $.getJSON('funding_data.json', function(data) {
+    getFundingData().done(function(data) {
         // Update the data timestamp (from exchange)
         $('#timestamp').text(data.timestamp);
 
@@ -2405,6 +2487,9 @@ $(document).ready(function() {
         // Setup ADV range button functionality
         setupAdvRangeButton();
         
+        // Setup the carry window selector
+        setupCarryWindowSelect(data);
+        
         // Clean up any existing display mode buttons and popups
         $('.mobile-display-mode-button').remove();
         $('.mobile-popup-container').each(function() {
@@ -2415,6 +2500,7 @@ $(document).ready(function() {
         
         // Create mobile-friendly popup menu for display mode selector
         createMobilePopupMenu('displayMode', 'mobile-display-mode-button');
+        createMobilePopupMenu('carryWindow', 'mobile-display-mode-button');
         
         // Setup chart resizing functionality
         setupChartResizing();
@@ -2737,6 +2823,32 @@ function updateAdvColumnHeader() {
     }
 }
 
+// Function to set up the carry window selector with the windows the payload provides
+function setupCarryWindowSelect(data) {
+    const select = $('#carryWindow');
+    select.find('option').each(function() {
+        if (!data.funding[`avg_${$(this).val()}`]) {
+            $(this).remove();
+        }
+    });
+    select.val(carryWindow);
+    
+    select.on('change', function() {
+        carryWindow = $(this).val();
+        
+        const table = $('#fundingTable').DataTable();
+        $(table.column(6).header()).html(carryWindowTitle());
+        
+        // Every window is already in the payload, so only the rows change
+        table.rows().every(function() {
+            const rowData = this.data();
+            rowData.avgWindow = carryWindowValue(data, coinIndex(data, rowData.coin));
+            this.data(rowData);
+        });
+        table.draw();
+    });
+}
+
 // Helper function to create mobile-friendly popup menus
 function createMobilePopupMenu(selectId, buttonClass) {
     const isMobile = /iPhone|iPad|iPod|Android/i.test(navigator.userAgent);
@@ -2873,47 +2985,35 @@ function loadPriceData(coin, range) {
             startTime = now - (24 * 60 * 60 * 1000); // Default to 1 day
     }
     
-    // Fetch the CSV file to get price data (from same file as volume data)
-    $.ajax({
-        url: 'https://raw.githubusercontent.com/exo-trading/crypto-carry-screener/main/ohlcv_data_main.csv',
-        dataType: 'text',
-        success: function(csvData) {
-            console.log("Price CSV data loaded successfully");
-            
-            // Parse CSV data
-            const rows = csvData.split('\n');
-            console.log(`Price CSV has ${rows.length} rows`);
-            
-            // Try to detect CSV format
-            const firstRow = rows[0].split(',');
-            console.log(`Price CSV columns: ${firstRow.join(', ')}`);
+    // Fetch the coin's history file to get price data (same file as volume data)
+    loadCoinHistory(coin, {
+        success: function(history) {
+            console.log("Price history data loaded successfully");
             
-            // Find column indices for price data
-            const timeIndex = firstRow.indexOf('time');
-            const coinIndex = firstRow.indexOf('coin');
-            const closePriceIndex = firstRow.indexOf('close_price');
-            
-            if (timeIndex >= 0 && coinIndex >= 0 && closePriceIndex >= 0) {
+            if (history.version === 1) {
+                // Long ranges are charted from the daily rollups
+                const daily = dailyChartData(history, 'close', startTime);
+                if (daily) {
+                    $('#priceChartLoading').hide();
+                    $('#priceChartContainer .error-message').remove();
+                    $('#priceChartContainer .chart-container').show();
+                    createPriceChart(daily.labels, daily.data, daily.labelInterval);
+                    return;
+                }
+                
                 // Filter data for the selected coin and time range
                 const priceData = [];
                 const timeLabels = [];
                 const timestamps = [];
                 
-                // Process each row
-                for (let i = 1; i < rows.length; i++) {
-                    if (!rows[i].trim()) continue; // Skip empty rows
-                    
-                    const columns = rows[i].split(',');
-                    if (columns.length <= Math.max(coinIndex, closePriceIndex, timeIndex)) continue;
-                    
-                    const rowCoin = columns[coinIndex];
-                    const closePrice = parseFloat(columns[closePriceIndex]);
-                    const timestamp = parseInt(columns[timeIndex]);
+                // Process each hourly point
+                historyPoints(history, 'close').forEach(point => {
+                    const closePrice = point.value;
                     
-                    // Adjust timestamp to align with funding data
-                    const adjustedTimestamp = timestamp + (60 * 60 * 1000);
+                    // History times are already aligned with funding data
+                    const adjustedTimestamp = point.time;
                     
-                    if (rowCoin === coin && adjustedTimestamp >= startTime && !isNaN(closePrice) && !isNaN(timestamp)) {
+                    if (adjustedTimestamp >= startTime) {
                         // Format time as hour (using adjusted timestamp for display)
                         const date = new Date(adjustedTimestamp);
                         // Shift time back by 1 hour to show the start of the collection period
@@ -2929,7 +3029,7 @@ function loadPriceData(coin, range) {
                         timeLabels.push(timeLabel);
                         timestamps.push(adjustedTimestamp);
                     }
-                }
+                });
                 
                 // Hide loading indicator
                 $('#priceChartLoading').hide();
@@ -3054,14 +3154,14 @@ function loadPriceData(coin, range) {
                 // Create price chart
                 createPriceChart(completeTimeLabels, completeData);
             } else {
-                // CSV format not recognized
+                // History format not recognized
                 $('#priceChartLoading').hide();
                 $('#priceChartContainer .chart-container').hide();
                 $('#priceChartContainer').append('<p class="error-message">Could not parse price data format.</p>');
             }
         },
         error: function(xhr, status, error) {
-            console.error("Error loading price CSV:", error);
+            console.error("Error loading price history:", error);
             console.log("Status:", status);
             console.log("XHR:", xhr);
             
@@ -3074,7 +3174,7 @@ function loadPriceData(coin, range) {
 }
 
 // Function to create the price chart with area fill
-function createPriceChart(labels, data) {
+function createPriceChart(labels, data, labelInterval) {
     const ctx = document.getElementById('priceHistoryChart').getContext('2d');
     
     // Destroy existing chart if it exists
@@ -3293,14 +3393,14 @@ function createPriceChart(labels, data) {
                         minRotation: 45,
                         // Limit the number of x-axis labels for readability
                         callback: function(val, index) {
-                            // For longer ranges, show fewer labels
-                            const labelInterval = selectedChartRange === '1d' ? 1 : 
+                            // For longer ranges, show fewer labels (daily charts pass their own interval)
+                            const interval = labelInterval || (selectedChartRange === '1d' ? 1 : 
                                                selectedChartRange === '1w' ? 6 : 
                                                selectedChartRange === '2w' ? 12 : 
                                                selectedChartRange === '1m' ? 24 : 
                                                selectedChartRange === '2m' ? 48 :
-                                               72; // For '3m', show every 72 hours
-                            return index % labelInterval === 0 ? this.getLabelForValue(val) : '';
+                                               72); // For '3m', show every 72 hours
+                            return index % interval === 0 ? this.getLabelForValue(val) : '';
                         }
                     }
                 }
@@ -3393,22 +3493,18 @@ function updateADVData() {
     if (!table) return;
     
     // Get current data from the JSON file
-    $.getJSON('funding_data.json', function(data) {
+    getFundingData().done(function(data) {
         // Check if we have ADV data for the selected range
-        if (data.adv_data && data.adv_data[`${advRangeDays}d`]) {
-            const advData = data.adv_data[`${advRangeDays}d`];
+        if (data.adv && data.adv[`${advRangeDays}d`]) {
+            const advData = data.adv[`${advRangeDays}d`];
             
             // Update each row with the new ADV data
             table.rows().every(function() {
                 const rowData = this.data();
-                const coin = rowData.coin;
+                const index = coinIndex(data, rowData.coin);
                 
                 // Update ADV value if we have data for this coin
-                if (advData[coin] !== undefined) {
-                    rowData.adv = advData[coin];
-                } else {
-                    rowData.adv = null;
-                }
+                rowData.adv = index >= 0 ? advData[index] : null;
                 
                 this.data(rowData);
             });
@@ -0,0 +1,118 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Hyperliquid allows an aggregate weight of 1200 per minute per IP for REST requests.
+# Most info requests (fundingHistory, candleSnapshot, meta, ...) cost 20 weight.
+HYPERLIQUID_WEIGHT_PER_MINUTE = 1200
+DEFAULT_REQUEST_WEIGHT = 20
+DEFAULT_MAX_WORKERS = 8
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to keep requests within a weight budget.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. A caller
+    blocks in `acquire` until enough tokens are available, so requests are
+    sent as fast as the budget allows instead of sleeping a fixed time after
+    every call.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, weight=DEFAULT_REQUEST_WEIGHT):
+        """
+        Block until `weight` tokens are available, then take them.
+        """
+        weight = min(float(weight), self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= weight:
+                    self._tokens -= weight
+                    return
+                wait = (weight - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def charge(self, weight):
+        """
+        Take `weight` tokens without blocking. The balance may go negative,
+        which delays later `acquire` calls. Used for weight that is only known
+        after a response arrives (e.g. per-item surcharges).
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= float(weight)
+
+
+def hyperliquid_limiter(weight_per_minute=HYPERLIQUID_WEIGHT_PER_MINUTE):
+    """
+    Create a token bucket sized for Hyperliquid's per-minute weight budget.
+    """
+    return TokenBucket(rate=weight_per_minute / 60.0, capacity=weight_per_minute)
+
+
+# Shared limiter for every request made by this process
+DEFAULT_LIMITER = hyperliquid_limiter()
+
+
+class FetchResult:
+    """
+    Outcome of fetching one item: either a value or the error that was raised.
+    """
+
+    __slots__ = ('key', 'value', 'error')
+
+    def __init__(self, key, value=None, error=None):
+        self.key = key
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return f"FetchResult({self.key!r}, ok)"
+        return f"FetchResult({self.key!r}, error={self.error!r})"
+
+
+def fetch_all(keys, fetch_fn, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Call `fetch_fn(key)` for every key on a bounded thread pool.
+
+    Pacing is left to the rate limiter used by `fetch_fn`, so the pool keeps
+    as many requests in flight as the budget allows.
+
+    Args:
+        keys: Iterable of keys (e.g. coin symbols)
+        fetch_fn: Function taking one key and returning its data
+        max_workers: Maximum number of concurrent requests
+
+    Returns:
+        List of FetchResult in the same order as `keys`
+    """
+    keys = list(keys)
+    if not keys:
+        return []
+
+    def run(key):
+        try:
+            return FetchResult(key, value=fetch_fn(key))
+        except Exception as e:
+            return FetchResult(key, error=e)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as executor:
+        return list(executor.map(run, keys))
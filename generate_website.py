@@ -1,173 +1,311 @@
 import pandas as pd
+import argparse
+import gzip
 import json
+import os
 import numpy as np
-from datetime import datetime, timezone, timedelta
-
-def generate_website():
-    # Load the funding data
-    df = pd.read_csv('funding_data_all_coins.csv')
-    
-    # Load the volume data
-    try:
-        volume_df = pd.read_csv('ohlcv_data_main.csv')
-    except FileNotFoundError:
-        volume_df = pd.DataFrame()
-
-    # Ensure 'fundingRate' is numeric
-    df['fundingRate'] = pd.to_numeric(df['fundingRate'], errors='coerce')
-
-    # Convert 'time' to datetime, ensuring it's timezone-aware
-    df['time'] = pd.to_datetime(df['time'], unit='ms', utc=True)
-    
-    # Also convert volume data time to datetime if volume data exists
-    if not volume_df.empty:
-        volume_df['time'] = pd.to_datetime(volume_df['time'], unit='ms', utc=True)
-    
+from datetime import datetime, timezone
+from aggregates import CarryStats, WindowIndex
+from coin_history import update_history_shards
+from registry import coin_registry
+from rollups import ohlcv_rollups
+from storage import DAY_MS, funding_store, ohlcv_store
+from completeness import HOUR_MS
+from outputs import compact_number, write_file
+import telemetry
+from telemetry import current_run, span, timed
+
+try:
+    import brotli
+except ImportError:  # Optional: only needed for the precompressed .br payload
+    brotli = None
+
+# ADV windows in days, trailing back from the latest candle
+ADV_DAYS = np.arange(1, 31)
+
+PAYLOAD_PATH = os.path.join('docs', 'funding_data.json')
+PAYLOAD_VERSION = 2
+
+# Funding average windows; each covers [latest - days, latest] with both ends included.
+# They come from the funding window index, so any window up to the retention costs the same.
+FUNDING_PERIODS = {
+    '1d': {'days': 1, 'required_points': 24},
+    '3d': {'days': 3, 'required_points': 72},
+    '5d': {'days': 5, 'required_points': 120},
+    '7d': {'days': 7, 'required_points': 168},
+    '14d': {'days': 14, 'required_points': 336},
+    '30d': {'days': 30, 'required_points': 720},
+    '60d': {'days': 60, 'required_points': 1440},
+}
+
+# Funding distribution statistics (volatility, z-score, quantiles) cover the last 30 days
+CARRY_STATS_HOURS = 30 * 24
+CARRY_STATS_REQUIRED_POINTS = 30 * 24
+CARRY_STATS_QUANTILES = {'p10_30d': 0.1, 'p50_30d': 0.5, 'p90_30d': 0.9}
+
+
+def build_payload(timestamp, generated_at, coins, is_new, funding_columns, adv_columns, stats_columns=None):
+    """
+    Build the columnar website payload.
+
+    Every array is aligned with `coins`; the page sorts the table itself.
+
+    Args:
+        timestamp: Exchange time of the latest funding print
+        generated_at: Time the payload was generated
+        coins: Coin symbols, one per table row
+        is_new: Whether each coin first appeared within the last 7 days
+        funding_columns: Metric name -> array of annualized funding rates (NaN for no value)
+        adv_columns: ADV range (e.g. '30d') -> array of average daily volumes (NaN for no value)
+        stats_columns: Statistic name (e.g. 'vol_30d') -> array of funding statistics (NaN for no value)
+
+    Returns:
+        Dict ready to be written as JSON
+    """
+    return {
+        'version': PAYLOAD_VERSION,
+        'timestamp': timestamp,
+        'generated_at': generated_at,
+        'coins': list(coins),
+        'is_new': [int(flag) for flag in is_new],
+        'funding': {name: [compact_number(value) for value in values] for name, values in funding_columns.items()},
+        'adv': {name: [compact_number(value) for value in values] for name, values in adv_columns.items()},
+        'stats': {name: [compact_number(value) for value in values] for name, values in (stats_columns or {}).items()},
+    }
+
+
+def write_payload(path, data):
+    """
+    Write the payload as minified JSON with precompressed .gz and .br siblings.
+    The .br file is skipped if the brotli package is not installed. Files
+    whose content is unchanged are left alone, and a payload that differs
+    from the published one only in `generated_at` is not written at all.
+
+    Returns:
+        Number of files written
+    """
+    raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            try:
+                previous = json.loads(f.read())
+            except ValueError:
+                previous = None
+        # A rerun over the same data keeps the published files
+        if isinstance(previous, dict) and {**previous, 'generated_at': None} == {**data, 'generated_at': None}:
+            return 0
+    written = write_file(path, raw)
+    # mtime=0 keeps the .gz bytes identical when the payload is unchanged
+    written += write_file(path + '.gz', gzip.compress(raw, compresslevel=9, mtime=0))
+    if brotli is not None:
+        written += write_file(path + '.br', brotli.compress(raw, quality=11))
+    return written
+
+
+def load_rollups(store, rebuild=False, verify=False):
+    """
+    Bring the daily and weekly rollups of the OHLCV store up to date.
+
+    Args:
+        store: Hourly OHLCV PartitionedStore
+        rebuild: Roll up every day the hourly store holds instead of the stale ones
+        verify: Check the rollups of the index window against a recomputation
+
+    Returns:
+        OhlcvRollups
+    """
+    if store.index is not None and not store.index.loaded and not store.is_empty():
+        store.index.rebuild(store)
+    rollups = ohlcv_rollups(store)
+    if rebuild:
+        rollups.rebuild()
+    else:
+        rollups.update()
+    if verify:
+        differing_days, differing_weeks = rollups.verify()
+        print(f"Verified OHLCV rollups: {differing_days} daily and {differing_weeks} weekly rows "
+              f"differ from a full rebuild.")
+        if differing_days or differing_weeks:
+            rollups.rebuild()
+    return rollups
+
+
+def load_window_index(store, column, rebuild=False, verify=False):
+    """
+    Load the persisted window index of a store and bring it up to date.
+
+    Args:
+        store: PartitionedStore the index summarizes
+        column: Column totalled by the index
+        rebuild: Recompute the index from the store instead of updating it
+        verify: Check the updated totals against a full recomputation
+
+    Returns:
+        WindowIndex covering the store's retention window
+    """
+    state = WindowIndex(os.path.join(store.root, 'window_index.npz'), column, store.index.retention_hours)
+    return sync_state(state, store, rebuild, verify)
+
+
+def load_carry_stats(store, column, window_hours, rebuild=False, verify=False):
+    """
+    Load the persisted distribution statistics of a store and bring them up to date.
+
+    Args:
+        store: PartitionedStore the statistics describe
+        column: Column the statistics are computed over
+        window_hours: Length of the trailing window in hours
+        rebuild: Recompute the statistics from the store instead of updating them
+        verify: Check the updated statistics against a full recomputation
+
+    Returns:
+        CarryStats
+    """
+    state = CarryStats(os.path.join(store.root, 'carry_stats.npz'), column, window_hours)
+    return sync_state(state, store, rebuild, verify)
+
+
+def sync_state(state, store, rebuild=False, verify=False):
+    """
+    Update a persisted summary (CarryStats or WindowIndex) from its store and save it.
+
+    The summary files are not committed (see .gitignore): they change on
+    every run and are megabytes each. A fresh checkout, like every CI run,
+    therefore rebuilds them from the partitions. The incremental refresh
+    only pays off where the data directory persists between runs.
+    """
+    if store.index is not None and not store.index.loaded and not store.is_empty():
+        store.index.rebuild(store)
+    if rebuild or not state.loaded:
+        state.rebuild(store)
+    else:
+        state.refresh(store)
+    if verify:
+        differing_sums, differing_counts = state.verify(store)
+        print(f"Verified {state.column} {type(state).__name__}: {differing_sums} sums and {differing_counts} counts "
+              f"differ from a full rebuild.")
+        if differing_sums or differing_counts:
+            state.rebuild(store)
+    state.save()
+    return state
+
+
+@timed('generate_website')
+def generate_website(rebuild=False, verify=False):
+    funding = funding_store()
+    volume = ohlcv_store()
+
+    # Running totals and window sums, updated with only the hours added since the last run
+    with span('rolling_funding'):
+        funding_state = load_window_index(funding, 'fundingRate', rebuild, verify)
+    if funding_state.end_hour is None:
+        print("No funding data found. Run market_data_collector.py first.")
+        return
+    with span('carry_stats'):
+        stats_state = load_carry_stats(funding, 'fundingRate', CARRY_STATS_HOURS, rebuild, verify)
+    with span('rollups'):
+        rollups = load_rollups(volume, rebuild, verify)
+
+    # Per-coin history files for the coin detail charts
+    with span('history_shards'):
+        written = update_history_shards({'funding': funding, 'ohlcv': volume}, daily=rollups.daily)
+    current_run().count('history_files_written', written)
+    print(f"Updated {written} coin history files.")
+
     # Get the latest timestamp from the funding data (exchange's timestamp)
-    latest_time = df['time'].max()
-    
-    # Calculate ADV (Average Daily Volume) for all possible day ranges (1-30)
-    adv_data = {}
-    if not volume_df.empty:
-        # Get the latest volume data timestamp
-        latest_volume_time = volume_df['time'].max()
-        
-        # For each day range (1-30 days)
-        for days in range(1, 31):
-            start_time = latest_volume_time - timedelta(days=days)
-            
-            # Filter volume data for the specific time range
-            range_df = volume_df[volume_df['time'] > start_time]
-            
-            # Calculate required points (hours) for this range
-            required_points = days * 24
-            
-            # Calculate ADV for each coin
-            coin_adv = {}
-            for coin in volume_df['coin'].unique():
-                # Filter data for this coin in this range
-                coin_data = range_df[range_df['coin'] == coin]
-                
-                # Only calculate ADV if we have all required data points
-                if len(coin_data) >= required_points:
-                    # Calculate average daily volume (sum of hourly volumes divided by number of days)
-                    total_volume = coin_data['volume_usd'].sum()
-                    adv = total_volume / days
-                    coin_adv[coin] = adv
-                else:
-                    coin_adv[coin] = None
-            
-            # Store the ADV data for this day range
-            adv_data[f"{days}d"] = coin_adv
-    
-    # Get the latest timestamp from the data (exchange's timestamp)
-    latest_time = df['time'].max()
+    latest_hour = funding_state.end_hour - 1
+    latest_time = pd.Timestamp(latest_hour * HOUR_MS, unit='ms', tz='UTC')
+
+    # Coins with a funding print at the latest hour are the rows of the table
+    latest_rates, has_latest = funding_state.latest()
+    coins = np.array(funding_state.coins)[has_latest]
+
+    # Calculate ADV (Average Daily Volume) over the trailing 1-30 days up to the
+    # latest candle: whole days from the rollups, the partial edges hourly
+    adv = np.full((len(ADV_DAYS), len(coins)), np.nan)
+    if volume.index.end_hour is not None:
+        volume_coins, totals, hours = rollups.window_totals(volume.index.end_hour * HOUR_MS, ADV_DAYS * DAY_MS)
+        volume_ids = {coin: i for i, coin in enumerate(volume_coins)}
+        cols = np.array([volume_ids.get(coin, -1) for coin in coins.tolist()], dtype=np.int64)
+        has_volume = cols >= 0
+        totals = totals[:, cols[has_volume]]
+        hours = hours[:, cols[has_volume]]
+
+        # Only report ADV if we have every hour of the days
+        adv[:, has_volume] = np.where(hours >= ADV_DAYS[:, None] * 24, totals / ADV_DAYS[:, None], np.nan)
 
     # Get the current time (when the script finishes executing)
     current_time = datetime.now(timezone.utc)
 
-    # Filter data for the latest time
-    df_latest = df[df['time'] == latest_time].copy()
-
     # Calculate annualized funding rate percentage (hourly_funding*24*365*100)
     annualization_factor = 24 * 365 * 100  # Convert to percentage and annualize
-    df_latest['fundingRate_annualized'] = df_latest['fundingRate'] * annualization_factor
+    funding_columns = {'current': latest_rates[has_latest] * annualization_factor}
+
+    # A coin is "new" if the registry first saw it within the last 7 days; coins
+    # it does not know yet fall back to their first hour in the funding window
+    registry = coin_registry()
+    is_new = []
+    for coin in coins.tolist():
+        if coin in registry:
+            is_new.append(registry.is_new(coin, latest_hour))
+        else:
+            first_hour = funding.index.first_hour(coin)
+            is_new.append(first_hour is None or first_hour >= latest_hour - 7 * 24)
 
     # Calculate average funding rates over different time periods
-    time_periods = {
-        '1d': {'days': 1, 'required_points': 24},
-        '3d': {'days': 3, 'required_points': 72},
-        '5d': {'days': 5, 'required_points': 120}
-    }
+    sums, counts = funding_state.windows(
+        funding_state.end_hour, [config['days'] * 24 + 1 for config in FUNDING_PERIODS.values()])
+    sums = sums[:, has_latest]
+    counts = counts[:, has_latest]
+    for i, (period, config) in enumerate(FUNDING_PERIODS.items()):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_rate = sums[i] / counts[i] * annualization_factor
+        # Not enough data for a coin in this period leaves it empty
+        funding_columns[f'avg_{period}'] = np.where(counts[i] >= config['required_points'], avg_rate, np.nan)
 
-    # Get list of all coins
-    all_coins = df_latest['coin'].unique()
-
-    # Calculate the timestamp for 7 days ago to determine "new" coins
-    seven_days_ago = latest_time - timedelta(days=7)
-
-    # Create a dictionary to store whether each coin is "new"
-    new_coins = {}
-    for coin in all_coins:
-        # Find the earliest timestamp for this coin
-        coin_data = df[df['coin'] == coin]
-        earliest_timestamp = coin_data['time'].min()
-        
-        # A coin is "new" if it first appeared within the last 7 days
-        new_coins[coin] = earliest_timestamp >= seven_days_ago
-
-    # Prepare average funding rates per coin for each time period
-    avg_funding_rates = []
-
-    for coin in all_coins:
-        coin_data = {'coin': coin, 'isNew': new_coins[coin]}
-        
-        # Calculate averages for each time period
-        for period, config in time_periods.items():
-            start_time = latest_time - timedelta(days=config['days'])
-            df_period = df[(df['time'] >= start_time) & (df['coin'] == coin)]
-            
-            if len(df_period) >= config['required_points']:
-                # Calculate annualized average
-                avg_rate = df_period['fundingRate'].mean() * annualization_factor
-                coin_data[f'fundingRate_avg_{period}'] = avg_rate
-            else:
-                # Not enough data for this coin in this period
-                coin_data[f'fundingRate_avg_{period}'] = None
-        
-        avg_funding_rates.append(coin_data)
-
-    df_avg = pd.DataFrame(avg_funding_rates)
-
-    # Create separate DataFrames for each time period
-    avg_dfs = {}
-    for period in time_periods.keys():
-        # Create column name for this period
-        col_name = f'fundingRate_avg_{period}'
-        
-        # Filter for coins with data for this period
-        df_period = df_avg[df_avg[col_name].notnull()].copy()
-        
-        # Separate positive and negative average funding rates
-        positive_df = df_period[df_period[col_name] > 0].sort_values(by=col_name, ascending=False)
-        negative_df = df_period[df_period[col_name] < 0].sort_values(by=col_name, ascending=True)
-        
-        avg_dfs[f'positive_{period}'] = positive_df[['coin', col_name, 'isNew']]
-        avg_dfs[f'negative_{period}'] = negative_df[['coin', col_name, 'isNew']]
-
-    # Separate positive and negative funding rates for current data
-    df_positive_current = df_latest[df_latest['fundingRate_annualized'] > 0]
-    df_negative_current = df_latest[df_latest['fundingRate_annualized'] < 0]
-
-    # Sort the current funding rate tables
-    df_positive_current = df_positive_current.sort_values(by='fundingRate_annualized', ascending=False)
-    df_negative_current = df_negative_current.sort_values(by='fundingRate_annualized', ascending=True)
-
-    # Add the isNew status to the current data frames
-    df_positive_current['isNew'] = df_positive_current['coin'].map(new_coins)
-    df_negative_current['isNew'] = df_negative_current['coin'].map(new_coins)
-
-    # Prepare data for JSON output
-    data = {
-        'timestamp': latest_time.strftime('%Y-%m-%d %H:%M:%S UTC'),
-        'generated_at': current_time.strftime('%Y-%m-%d %H:%M:%S UTC'),
-        'positive_current': df_positive_current[['coin', 'fundingRate_annualized', 'isNew']].to_dict(orient='records'),
-        'negative_current': df_negative_current[['coin', 'fundingRate_annualized', 'isNew']].to_dict(orient='records'),
-        'adv_data': adv_data,  # Add ADV data for all day ranges
+    # Funding volatility, z-score of the latest print, carry/vol ratio, sign
+    # streak and quantiles over the last 30 days
+    stats_ids = {coin: i for i, coin in enumerate(stats_state.coins)}
+    cols = np.array([stats_ids.get(coin, -1) for coin in coins.tolist()], dtype=np.int64)
+    stats = stats_state.stats(CARRY_STATS_REQUIRED_POINTS, list(CARRY_STATS_QUANTILES.values()))
+    stats_columns = {
+        'vol_30d': stats['std'] * annualization_factor,
+        'carry_vol_30d': stats['carry_vol'],
+        'zscore_30d': stats['zscore'],
+        'streak': stats['streak'].astype(np.float64),
     }
-    
-    # Add average data for each time period
-    for key, df in avg_dfs.items():
-        data[key] = df.to_dict(orient='records')
+    for i, name in enumerate(CARRY_STATS_QUANTILES):
+        stats_columns[name] = stats['quantiles'][i] * annualization_factor
+    stats_columns = {name: np.where(cols >= 0, values[cols], np.nan) for name, values in stats_columns.items()}
 
-    # Save the data to a JSON file
-    with open('docs/funding_data.json', 'w') as f:
-        json.dump(data, f)
-
-    # Copy the funding_data_all_coins.csv to docs (optional)
-    df.to_csv('docs/funding_data_temp.csv', index=False)
+    with span('build_payload'):
+        data = build_payload(
+            latest_time.strftime('%Y-%m-%d %H:%M:%S UTC'),
+            current_time.strftime('%Y-%m-%d %H:%M:%S UTC'),
+            coins.tolist(), is_new, funding_columns,
+            {f"{days}d": adv[i] for i, days in enumerate(ADV_DAYS)},
+            stats_columns,
+        )
+    with span('write_payload'):
+        written = write_payload(PAYLOAD_PATH, data)
+    if not written:
+        print("Website data unchanged; kept the published payload.")
 
     print("Website data generated successfully.")
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the website data")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Recompute the rolling window sums and rollups from the full history")
+    parser.add_argument('--verify', action='store_true',
+                        help="Check the incrementally updated sums against a full rebuild")
+    telemetry.add_arguments(parser)
+    return parser.parse_args(argv)
+
 if __name__ == '__main__':
-    generate_website()
+    args = parse_args()
+    run = telemetry.start_run('website', out_dir=args.telemetry_dir,
+                              profile_stage=args.profile, profile_mode=args.profile_mode)
+    generate_website(rebuild=args.rebuild, verify=args.verify)
+    report_path, _ = run.write()
+    print(f"Run report written to {report_path}")
@@ -0,0 +1,313 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from fetch_engine import DEFAULT_LIMITER, DEFAULT_REQUEST_WEIGHT
+from telemetry import current_run
+
+DEFAULT_BASE_URL = 'https://api.hyperliquid.xyz'
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Circuit breaker states
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half-open'
+
+
+class HyperliquidAPIError(Exception):
+    """
+    Raised when an info request fails after all retries.
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(HyperliquidAPIError):
+    """
+    Raised without sending a request while the circuit breaker is open.
+    """
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header (delta-seconds or HTTP-date) into seconds.
+    Returns None if the header is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class HyperliquidInfoClient:
+    """
+    Client for Hyperliquid's /info endpoint.
+
+    All requests share one pooled keep-alive session with gzip negotiation and
+    are paced by a token-bucket limiter. Rate limiting (429), 5xx responses,
+    timeouts, connection errors and other transport errors are retried with
+    jittered exponential backoff that honours Retry-After. After
+    `breaker_threshold` consecutive failed requests the circuit opens and
+    calls fail fast for `breaker_cooldown` seconds. Then it is half-open: a
+    single trial request (one attempt, no retries) is let through while every
+    other call keeps failing fast, and its outcome closes the circuit or opens
+    it for another cooldown.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, timeout=(5, 30), max_retries=5,
+                 backoff_base=1.0, backoff_max=30.0, limiter=DEFAULT_LIMITER,
+                 pool_size=16, breaker_threshold=5, breaker_cooldown=60.0):
+        self.base_url = base_url.rstrip('/')
+        self.info_url = f"{self.base_url}/info"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = limiter
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+        })
+
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._state = CIRCUIT_CLOSED
+        self._opened_at = None
+        self.stats = {
+            'requests': 0,
+            'retries': 0,
+            'failures': 0,
+            'bytes_received': 0,
+            'bytes_decoded': 0,
+            'status_codes': {},
+        }
+
+    # ---------------- circuit breaker ----------------
+
+    def _check_circuit(self, allow_trial=True):
+        """
+        Raise CircuitOpenError unless a request may be sent now.
+
+        Returns:
+            True if the caller is the trial request of a half-open circuit
+        """
+        with self._lock:
+            if self._state == CIRCUIT_CLOSED:
+                return False
+            if (allow_trial and self._state == CIRCUIT_OPEN
+                    and time.monotonic() - self._opened_at >= self.breaker_cooldown):
+                self._state = CIRCUIT_HALF_OPEN
+                return True
+            state = self._state
+        raise CircuitOpenError(f"Circuit breaker is {state}; skipping request")
+
+    def _open_circuit(self):
+        # Called with the lock held
+        self._state = CIRCUIT_OPEN
+        self._opened_at = time.monotonic()
+
+    def _record_outcome(self, success, trial=False):
+        with self._lock:
+            if success:
+                self._consecutive_failures = 0
+                if trial or self._state == CIRCUIT_HALF_OPEN:
+                    self._state = CIRCUIT_CLOSED
+                    self._opened_at = None
+                return
+            self.stats['failures'] += 1
+            self._consecutive_failures += 1
+            if trial:
+                self._open_circuit()
+                print("Circuit breaker trial request failed; open again.")
+            elif self._state == CIRCUIT_CLOSED and self._consecutive_failures >= self.breaker_threshold:
+                self._open_circuit()
+                print(f"Circuit breaker opened after {self._consecutive_failures} consecutive failures.")
+
+    def _end_trial(self):
+        # A trial that ended without an outcome (e.g. interrupted) must not leave the circuit half-open
+        with self._lock:
+            if self._state == CIRCUIT_HALF_OPEN:
+                self._open_circuit()
+
+    @property
+    def circuit_open(self):
+        with self._lock:
+            return self._state != CIRCUIT_CLOSED
+
+    # ---------------- requests ----------------
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        # Full jitter, but never retry earlier than the server asked us to
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def post(self, payload, weight=DEFAULT_REQUEST_WEIGHT):
+        """
+        Send one info request and return the decoded JSON response.
+
+        Args:
+            payload: JSON body of the request (must contain 'type')
+            weight: Rate limit weight charged before each attempt
+
+        Returns:
+            Decoded JSON response
+
+        Raises:
+            HyperliquidAPIError: if the request still fails after all retries
+            CircuitOpenError: if the circuit breaker is open
+        """
+        trial = self._check_circuit()
+        try:
+            return self._send(payload, weight, trial)
+        finally:
+            if trial:
+                self._end_trial()
+
+    def _send(self, payload, weight, trial):
+        last_error = None
+        last_status = None
+        # The trial request of a half-open circuit gets a single attempt
+        attempts = 1 if trial else self.max_retries + 1
+
+        for attempt in range(attempts):
+            if attempt > 0:
+                # Other requests may have opened the circuit while this one was backing off
+                self._check_circuit(allow_trial=False)
+                self._count('retries')
+            if self.limiter is not None:
+                self.limiter.acquire(weight)
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                self._count('requests')
+                response = self.session.post(self.info_url, json=payload, timeout=self.timeout)
+                last_status = response.status_code
+                received = int(response.headers.get('Content-Length') or len(response.content))
+                with self._lock:
+                    codes = self.stats['status_codes']
+                    codes[response.status_code] = codes.get(response.status_code, 0) + 1
+                    self.stats['bytes_decoded'] += len(response.content)
+                    self.stats['bytes_received'] += received
+                current_run().record_request(payload.get('type'), response.status_code,
+                                             time.perf_counter() - started, received, retry=attempt > 0)
+
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    last_error = f"HTTP {response.status_code}"
+                elif response.status_code >= 400:
+                    self._record_outcome(False, trial)
+                    raise HyperliquidAPIError(
+                        f"HTTP {response.status_code} for {payload.get('type')}: {response.text[:200]}",
+                        status_code=response.status_code)
+                else:
+                    try:
+                        data = response.json()
+                    except ValueError as e:
+                        self._record_outcome(False, trial)
+                        raise HyperliquidAPIError(f"Invalid JSON in {payload.get('type')} response: {e}",
+                                                  status_code=response.status_code)
+                    self._record_outcome(True, trial)
+                    return data
+            except requests.RequestException as e:
+                # Timeouts, connection errors and broken or undecodable bodies alike
+                last_error = f"{type(e).__name__}: {e}"
+                last_status = None
+                current_run().record_request(payload.get('type'), type(e).__name__,
+                                             time.perf_counter() - started, retry=attempt > 0)
+
+            if attempt < attempts - 1:
+                delay = self._backoff_delay(attempt, retry_after)
+                print(f"{payload.get('type')} request failed ({last_error}). Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+
+        self._record_outcome(False, trial)
+        raise HyperliquidAPIError(
+            f"{payload.get('type')} request failed after {attempts - 1} retries: {last_error}",
+            status_code=last_status)
+
+    def meta(self):
+        return self.post({'type': 'meta'})
+
+    def meta_and_asset_ctxs(self):
+        return self.post({'type': 'metaAndAssetCtxs'})
+
+    def funding_history(self, coin, start_time_ms, end_time_ms=None):
+        payload = {'type': 'fundingHistory', 'coin': coin, 'startTime': start_time_ms}
+        if end_time_ms is not None:
+            payload['endTime'] = end_time_ms
+        data = self.post(payload)
+        # fundingHistory costs 1 extra weight per 20 items returned
+        if self.limiter is not None:
+            self.limiter.charge(len(data) // 20)
+        return data
+
+    def candle_snapshot(self, coin, interval, start_time_ms, end_time_ms):
+        data = self.post({
+            'type': 'candleSnapshot',
+            'req': {'coin': coin, 'interval': interval, 'startTime': start_time_ms, 'endTime': end_time_ms},
+        })
+        # candleSnapshot costs 1 extra weight per 60 items returned
+        if self.limiter is not None:
+            self.limiter.charge(len(data) // 60)
+        return data
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide client, creating it on first use.
+    The base URL can be overridden with the HYPERLIQUID_API_URL environment variable.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HyperliquidInfoClient(
+                base_url=os.environ.get('HYPERLIQUID_API_URL', DEFAULT_BASE_URL))
+        return _default_client
+
+
+def set_client(client):
+    """
+    Replace the process-wide client (e.g. with one pointed at a local stand-in server).
+    """
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
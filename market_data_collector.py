@@ -1,32 +1,117 @@
-import requests
-import pandas as pd
-import time
 from datetime import datetime, timezone, timedelta
-from requests.exceptions import HTTPError
+import argparse
+import asyncio
 import os
+import re
 import sys
+import threading
+import time
+import clock
+from backfill import CHECKPOINT_PATH, BackfillCheckpoint, run_backfill
+from streaming import StreamingCollector, ws_url_from_env
+from cassette import Cassette, RecordingClient, ReplayClient
+from completeness import HOUR_MS
+from hyperliquid_client import DEFAULT_BASE_URL, get_client, set_client
+from registry import coin_registry
+from rollups import ohlcv_rollups
+from scheduler import Dataset, FetchScheduler
+from sharding import (check_merge, find_shards, merge_shards, parse_shard, shard_coins, shard_queue, shard_registry,
+                      shard_store, write_manifest)
+from storage import (DAY_MS, FUNDING_RETENTION_DAYS, OHLCV_DAILY_RETENTION_DAYS, OHLCV_RETENTION_DAYS,
+                     candle_to_ohlcv_row, funding_store, ohlcv_store)
+import telemetry
+from telemetry import current_run, span, timed
+
+FUNDING_CSV = 'funding_data_all_coins.csv'
+OHLCV_CSV = 'ohlcv_data_main.csv'
+
+# Maximum records returned by one fundingHistory / candleSnapshot response
+FUNDING_PAGE_SIZE = 500
+CANDLE_PAGE_SIZE = 5000
+# candleSnapshot serves only the latest 5000 candles of each interval
+CANDLE_HISTORY = 5000
 
 # Common Functions
+def open_store(store, legacy_csv):
+    """
+    Return the store, importing the legacy CSV file on first use.
+    """
+    if store.is_empty() and os.path.exists(legacy_csv):
+        rows = store.import_csv(legacy_csv)
+        print(f"Imported {rows} rows from {legacy_csv} into {store.root}.")
+    elif not store.index.loaded and not store.is_empty():
+        store.index.rebuild(store)
+        print(f"Rebuilt completeness index for {store.root}.")
+    return store
+
+_compaction_threads = []
+
+def start_background_compaction(store, force=False):
+    """
+    Merge the store's journal into its partitions on a background thread
+    when compaction is due (or always, if force is set).
+    """
+    if not store.segments() or not (force or store.compaction_due()):
+        return None
+
+    def run():
+        with span(f"compact_{os.path.basename(store.root)}"):
+            merged = store.compact()
+        current_run().count('segments_compacted', merged)
+        print(f"Compacted {merged} journal segments into {store.root}.")
+
+    thread = threading.Thread(target=run, name=f"compact-{store.root}")
+    thread.start()
+    _compaction_threads.append(thread)
+    return thread
+
+def wait_for_compaction():
+    """
+    Block until every background compaction has finished.
+    """
+    while _compaction_threads:
+        _compaction_threads.pop().join()
+
+def to_ms(dt):
+    return int(dt.timestamp() * 1000)
+
 def get_all_coins():
     """
-    Get a list of all available coins from Hyperliquid API.
-    Returns a list of coin symbols.
+    Get a list of all listed coins from the coin registry.
+    The registry is refreshed from Hyperliquid's meta at most once per TTL;
+    if the request fails, the last known universe is used.
+    Returns a list of coin symbols (empty if no universe was ever fetched).
+    """
+    registry = coin_registry()
+    registry.refresh(get_client().meta)
+    return registry.active_coins()
+
+def get_market_snapshot():
+    """
+    Get the perp universe from a single metaAndAssetCtxs request, whatever
+    the age of the coin registry, and refresh the registry with it. The asset
+    contexts are not used: their funding field is the predicted rate for the
+    next hour, not a settled print.
+
+    Returns:
+        Dict with 'coins' (list of listed coin symbols), or None if the request fails
     """
     try:
-        response = requests.post('https://api.hyperliquid.xyz/info', json={'type':'meta'}, headers={'Content-Type': 'application/json'})
-        response.raise_for_status()
-        data = response.json()
-        coins = [item['name'] for item in data.get('universe', [])]
-        return coins
+        meta, _ = get_client().meta_and_asset_ctxs()
+        universe = meta.get('universe', [])
+        coin_registry().update(universe)
+        return {'coins': [item['name'] for item in universe if not item.get('isDelisted')]}
     except Exception as e:
-        print(f"Error fetching coin list: {e}")
-        return []
+        print(f"Error fetching market snapshot: {e}")
+        return None
 
 # ================ FUNDING DATA COLLECTION ================
 
 def get_funding_for_time_range(coin, start_time_ms, end_time_ms):
     """
     Fetch funding data for a specific coin within a time range.
+    Responses are capped at one page, so full pages are followed by a request
+    starting just after the last record until the range is covered.
     
     Args:
         coin: The coin symbol
@@ -35,617 +120,584 @@ def get_funding_for_time_range(coin, start_time_ms, end_time_ms):
         
     Returns:
         List of funding data entries within the specified time range
+
+    Raises:
+        HyperliquidAPIError: if the request fails after all retries
     """
-    max_retries = 5
-    retry_delay = 2  # Start with a 2-second delay
-
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(
-                'https://api.hyperliquid.xyz/info',
-                json={'type': 'fundingHistory', 'coin': coin, 'startTime': start_time_ms},
-                headers={'Content-Type': 'application/json'}
-            )
-            response.raise_for_status()
-            data = response.json()
-            # Filter to include only records within the specific time range
-            data_in_range = [entry for entry in data if start_time_ms <= entry['time'] < end_time_ms]
-            return data_in_range
-        except HTTPError as http_err:
-            if response.status_code == 429:
-                print(f"Rate limit exceeded for {coin}. Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-                continue
-            else:
-                print(f"HTTP error occurred for {coin}: {http_err}")
-                return []
-        except Exception as e:
-            print(f"Error fetching funding data for {coin}: {e}")
-            return []
-    print(f"Failed to fetch funding data for {coin} after {max_retries} retries due to rate limiting.")
-    return []
+    data_in_range = []
+    cursor = start_time_ms
+    while cursor < end_time_ms:
+        page = get_client().funding_history(coin, cursor, end_time_ms - 1)
+        # Filter to include only records within the specific time range
+        data_in_range.extend(entry for entry in page if cursor <= entry['time'] < end_time_ms)
+        if len(page) < FUNDING_PAGE_SIZE:
+            break
+        last_time = max(entry['time'] for entry in page)
+        if last_time < cursor:
+            break
+        cursor = last_time + 1
+    return data_in_range
+
+# ================ VOLUME DATA COLLECTION ================
 
-def get_latest_funding(coin):
+def get_candles(coin, interval, start_time_ms, end_time_ms):
     """
-    Get the latest funding data for a coin.
+    Fetch the candles of one interval ('1h' or '1d') that start within a time
+    range. Full pages are followed by a request starting after the last
+    candle until the range is covered.
+
+    Raises:
+        HyperliquidAPIError: if the request fails after all retries
     """
-    current_time_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
-    # Get data from the last 2 hours to ensure we capture the latest entry
-    start_time_ms = current_time_ms - 2 * 60 * 60 * 1000  
-    
-    funding_data = get_funding_for_time_range(coin, start_time_ms, current_time_ms)
-    if funding_data:
-        return funding_data[-1]  # Return the latest entry
-    return None
+    data = []
+    cursor = start_time_ms
+    while cursor < end_time_ms:
+        page = get_client().candle_snapshot(coin, interval, cursor, end_time_ms - 1)
+        # Only candles that start inside the range (the in-progress one is excluded)
+        data.extend(candle for candle in page if cursor <= candle['t'] < end_time_ms)
+        if len(page) < CANDLE_PAGE_SIZE:
+            break
+        last_time = max(candle['t'] for candle in page)
+        if last_time < cursor:
+            break
+        cursor = last_time + 1
+    return data
 
-def check_missing_funding_data_past_24h(existing_df, coins):
+def get_volume_for_time_range(coin, start_time_ms, end_time_ms):
     """
-    Check for missing funding data points in the past 24 hours and fetch them if needed.
-    Only checks BTC for missing hours, as BTC should always have data and can be 
-    used as a reference for all coins.
+    Fetch hourly candle data for a specific coin within a time range.
+    Each candle contains volume data for that hour.
     
     Args:
-        existing_df: DataFrame containing existing funding data
-        coins: List of coin symbols
+        coin: The coin symbol
+        start_time_ms: Start time in milliseconds (inclusive)
+        end_time_ms: End time in milliseconds (exclusive)
         
     Returns:
-        DataFrame with any missing data added, and a boolean indicating if latest hour data was collected
+        List of hourly candle data within the specified time range
+
+    Raises:
+        HyperliquidAPIError: if the request fails after all retries
     """
-    # Get current time and 24 hours ago
-    now = datetime.now(timezone.utc)
-    latest_completed_hour = now.replace(minute=0, second=0, microsecond=0)
-    next_hour = latest_completed_hour + timedelta(hours=1)  # Important to include the latest hour in the range
-    hours_24_ago = latest_completed_hour - timedelta(hours=24)
-    
-    # Convert to milliseconds for API and filtering
-    next_hour_ms = int(next_hour.timestamp() * 1000)
-    hours_24_ago_ms = int(hours_24_ago.timestamp() * 1000)
-    
-    # Generate expected hourly timestamps for the past 24 hours
-    expected_hours = []
-    for i in range(24, 0, -1):  # From 24 hours ago to 1 hour ago
-        hour_timestamp = latest_completed_hour - timedelta(hours=i)
-        expected_hours.append(hour_timestamp)
-    # Add latest completed hour
-    expected_hours.append(latest_completed_hour)
-    
-    # Flag to track if we need to collect latest hour data separately
-    latest_hour_collected = False
-    
-    # Reference coin to check for missing data (BTC is the oldest and most reliable)
-    reference_coin = "BTC"
-    
-    if existing_df.empty:
-        print("No existing funding data found. Will fetch data for all coins for the past 24 hours.")
-        # If no data exists, we'll fetch everything from the past 24 hours
-        start_time_ms = hours_24_ago_ms
-        end_time_ms = next_hour_ms
-        missing_hours = expected_hours
-        latest_hour_collected = True  # We'll collect latest hour data in this pass
-    else:
-        # Optimize CSV parsing by only looking at recent data
-        # First, convert the 'time' column to numeric if it's not already
-        if 'time' not in existing_df.columns:
-            print("Warning: 'time' column not found in funding CSV. Using empty DataFrame.")
-            existing_df = pd.DataFrame()
-            start_time_ms = hours_24_ago_ms
-            end_time_ms = next_hour_ms
-            missing_hours = expected_hours
-            latest_hour_collected = True  # We'll collect latest hour data in this pass
-            return check_missing_funding_data_past_24h(existing_df, coins)
-        
-        # Filter to only include data from the past 48 hours (to be safe)
-        cutoff_time_ms = hours_24_ago_ms - 24 * 60 * 60 * 1000  # 48 hours ago
-        recent_df = existing_df[existing_df['time'] >= cutoff_time_ms].copy()
-        
-        if recent_df.empty:
-            print("No recent funding data found in the past 48 hours. Will fetch data for all coins for the past 24 hours.")
-            start_time_ms = hours_24_ago_ms
-            end_time_ms = next_hour_ms
-            missing_hours = expected_hours
-            latest_hour_collected = True  # We'll collect latest hour data in this pass
-        else:
-            # Convert time column to datetime
-            recent_df['time_dt'] = pd.to_datetime(recent_df['time'], unit='ms', utc=True)
-            
-            # Round timestamps to the nearest hour to match expected hourly data points
-            recent_df['hour'] = recent_df['time_dt'].dt.floor('h')
-            
-            # Get unique hours in the existing data for the past 24 hours, but only for BTC
-            btc_df = recent_df[
-                (recent_df['coin'] == reference_coin) & 
-                (recent_df['hour'] >= hours_24_ago) & 
-                (recent_df['hour'] <= latest_completed_hour)
-            ]
-            
-            # Get the hours for which we have BTC data
-            btc_hours = set(btc_df['hour'])
-            
-            # Find missing hours for BTC only
-            missing_hours = []
-            for hour in expected_hours:
-                if hour not in btc_hours:
-                    missing_hours.append(hour)
-            
-            missing_hours = sorted(missing_hours)
-            
-            # Check if only the latest hour is missing
-            if missing_hours == [latest_completed_hour]:
-                print(f"Only latest hour data is missing for {reference_coin}, which will be collected in the next step.")
-                return existing_df, False
-            elif not missing_hours:
-                print(f"No funding data missing for {reference_coin} in past 24h.")
-                return existing_df, True  # Signal that we have all data
-            
-            # Print missing hours
-            missing_hours_str = ", ".join([hour.strftime('%Y-%m-%d %H:%M:%S UTC') for hour in missing_hours])
-            print(f"Found missing funding data for {reference_coin} during hours: {missing_hours_str}")
-            
-            # Check if latest hour is among the missing hours
-            if latest_completed_hour in missing_hours:
-                latest_hour_collected = True
-                print("Latest hour funding data will be collected along with other missing data.")
-            
-            # Set time range to cover all missing hours plus latest hour if needed
-            if missing_hours:
-                start_time_ms = int(min(missing_hours).timestamp() * 1000)
-                # If latest hour is not in missing hours, don't extend to next hour
-                if latest_hour_collected:
-                    end_time_ms = next_hour_ms  # Include the latest hour by extending to the next hour
-                else:
-                    # Find the latest missing hour that's not the latest completed hour
-                    latest_missing = max(missing_hours)
-                    if latest_missing < latest_completed_hour:
-                        end_time_ms = int((latest_missing + timedelta(hours=1)).timestamp() * 1000)
-                    else:
-                        # This shouldn't happen given our checks, but just in case
-                        end_time_ms = next_hour_ms
-                        latest_hour_collected = True
-    
-    # Fetch all missing data in one go for each coin
-    all_missing_data = []
-    
-    # Introduce delay to stay within rate limits
-    max_requests_per_minute = 60
-    delay_between_requests = 60 / max_requests_per_minute  # in seconds
-    
-    print(f"Fetching funding data from {datetime.fromtimestamp(start_time_ms/1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC to {datetime.fromtimestamp(end_time_ms/1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC")
-    
-    for coin in coins:
-        # Fetch data for the entire time range
-        coin_data = get_funding_for_time_range(coin, start_time_ms, end_time_ms)
-        if coin_data:
-            all_missing_data.extend(coin_data)
-            print(f"Collected funding data for {coin} ({len(coin_data)} entries)")
-        else:
-            print(f"No funding data available for {coin} in the specified time range")
-        
-        time.sleep(delay_between_requests)  # Pause to respect rate limits
-    
-    if all_missing_data:
-        # Add the missing data to the existing DataFrame
-        missing_df = pd.DataFrame(all_missing_data)
-        combined_df = pd.concat([existing_df, missing_df], ignore_index=True)
-        # Remove duplicates
-        combined_df.drop_duplicates(subset=['coin', 'time'], inplace=True)
-        print(f"Added {len(all_missing_data)} entries to fill missing funding data.")
-        return combined_df, latest_hour_collected
-    
-    return existing_df, latest_hour_collected
+    # Convert the candle data to our standard format for volume data
+    return [candle_to_ohlcv_row(coin, candle) for candle in get_candles(coin, '1h', start_time_ms, end_time_ms)]
 
-def collect_funding_data():
+def get_daily_volume_for_time_range(coin, start_time_ms, end_time_ms):
     """
-    Main function to collect funding data.
+    Fetch daily candles for a specific coin as daily rollup rows, for the days
+    older than the hourly candle history.
+
+    A 1d candle counts the hours of its day the coin traded: on its listing
+    day (a first candle after the range start) from the hour the registry
+    first saw the coin, if that falls inside the day, and never past the
+    current hour. The USD volume is the base volume at the typical price
+    (o+h+l+c)/4, the daily candle's closest match to the sum of hourly
+    volume × close the rollups build from hourly candles.
+
+    Args:
+        coin: The coin symbol
+        start_time_ms: Start time in milliseconds (inclusive)
+        end_time_ms: End time in milliseconds (exclusive)
+
+    Returns:
+        List of daily rollup rows (see schema.ROLLUP_SCHEMA)
+
+    Raises:
+        HyperliquidAPIError: if the request fails after all retries
     """
-    # Initialize an empty DataFrame or read existing data
-    filename = 'funding_data_all_coins.csv'
-    try:
-        existing_df = pd.read_csv(filename)
-        print(f"Loaded existing funding data with {len(existing_df)} rows.")
-    except FileNotFoundError:
-        existing_df = pd.DataFrame()
-        print("No existing funding data file found. Starting fresh.")
-
-    print(f"Fetching funding data at {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC")
-    coins = get_all_coins()
-    print(f"Found {len(coins)} coins.")
-    
-    # Check for missing data from the past 24 hours
-    result_df, latest_hour_collected = check_missing_funding_data_past_24h(existing_df, coins)
-    
-    # Exit if no data is missing (None, None is returned)
-    if result_df is None and latest_hour_collected is None:
-        print("Exiting funding data collection as no data collection is needed.")
-        return
-    
-    # Only fetch latest hour's data if it wasn't already collected
-    if not latest_hour_collected:
-        print("Collecting latest hour's funding data...")
-        funding_data = []
-
-        # Introduce delay to stay within rate limits
-        max_requests_per_minute = 60
-        delay_between_requests = 60 / max_requests_per_minute  # in seconds
-
-        for coin in coins:
-            latest_funding = get_latest_funding(coin)
-            if latest_funding:
-                funding_data.append(latest_funding)
-                print(f"Collected funding data for {coin}")
-            else:
-                print(f"Could not collect funding data for {coin}")
-            time.sleep(delay_between_requests)  # Pause to respect rate limits
+    first_seen = coin_registry().first_seen(coin)
+    listed_ms = None if first_seen is None else first_seen * HOUR_MS
+    hour_end_ms = -(-int(clock.now() * 1000) // HOUR_MS) * HOUR_MS
+    rows = []
+    for candle in get_candles(coin, '1d', start_time_ms, end_time_ms):
+        row = candle_to_ohlcv_row(coin, candle)
+        typical_price = (row['open_price'] + row['high_price'] + row['low_price'] + row['close_price']) / 4
+        row['volume_usd'] = float(candle['v']) * typical_price
+        day_start, day_end = candle['t'], min(candle['t'] + DAY_MS, hour_end_ms)
+        if not rows and start_time_ms < day_start and listed_ms is not None and day_start < listed_ms < day_end:
+            # The listing day
+            day_start = listed_ms
+        rows.append(dict(row, hours=max(1, (day_end - day_start) // HOUR_MS)))
+    return rows
 
-        if funding_data:
-            df_new = pd.DataFrame(funding_data)
-            # Combine with existing data
-            combined_df = pd.concat([result_df, df_new], ignore_index=True)
-            # Remove duplicates
-            combined_df.drop_duplicates(subset=['coin', 'time'], inplace=True)
-            result_df = combined_df
-            print(f"Added {len(funding_data)} entries for latest hour.")
 
-    # Keep only data from the past N days
-    N = 90  # Number of days to keep
-    cutoff_time = datetime.now(timezone.utc) - timedelta(days=N)
-    cutoff_time_ms = int(cutoff_time.timestamp() * 1000)
-    result_df = result_df[result_df['time'] >= cutoff_time_ms]
+# ================ SCHEDULED COLLECTION ================
 
-    # Save to CSV
-    result_df.to_csv(filename, index=False)
-    print(f"Saved funding data to {filename} with {len(result_df)} rows.")
+# Dataset -> (store factory, legacy CSV, range fetcher, hours per response page, retention days)
+DATASETS = {
+    'funding': (funding_store, FUNDING_CSV, get_funding_for_time_range, FUNDING_PAGE_SIZE, FUNDING_RETENTION_DAYS),
+    'volume': (ohlcv_store, OHLCV_CSV, get_volume_for_time_range, CANDLE_PAGE_SIZE, OHLCV_RETENTION_DAYS),
+}
 
+# Days a backfill may reach back where it differs from the retention: hourly
+# candles as far as candleSnapshot serves them (older than the hourly window,
+# they still go into the daily and weekly rollups)
+BACKFILL_DAYS = {'volume': CANDLE_HISTORY // 24}
 
-# ================ VOLUME DATA COLLECTION ================
+# Wall-clock budget of a default collection run, so it finishes inside the CI
+# job limit; work left when it runs out is queued for the next run
+DEFAULT_DEADLINE_SECONDS = 600
 
-def get_volume_for_time_range(coin, start_time_ms, end_time_ms):
+@timed('collect_data')
+def collect_data(datasets=('funding', 'volume'), snapshot=None, use_snapshot=True, coins=None, stores=None,
+                 deadline=None, backfill=True, shard=None):
     """
-    Fetch hourly candle data for a specific coin within a time range.
-    Each candle contains volume data for that hour.
-    
+    Main function to collect funding and volume data.
+
+    The holes of every dataset are turned into range requests that share one
+    scheduler and rate budget, most valuable first: the latest hour, then the
+    rest of the past 24 hours, then older holes in the retention window.
+    Unless coins are given, the coin list comes from one metaAndAssetCtxs
+    request in snapshot mode and from the coin registry otherwise. Every
+    hour's funding is fetched from fundingHistory.
+
+    A shard run collects only its share of the coins into the shard's
+    output directory (see sharding.py), saves the coin registry and
+    dictionary there instead of in the data directory, and leaves the
+    rollups, retention and compaction to the merge.
+
     Args:
-        coin: The coin symbol
-        start_time_ms: Start time in milliseconds (inclusive)
-        end_time_ms: End time in milliseconds (exclusive)
-        
+        datasets: Datasets to collect ('funding' and/or 'volume')
+        snapshot: Market snapshot to reuse (fetched here if not given)
+        use_snapshot: Set to False to take the coin list from the coin registry instead
+        coins: List of coin symbols (taken from the snapshot or the registry if not given)
+        stores: Dict of dataset -> store to write into (opened here if not given)
+        deadline: time.monotonic() value after which no new request is started;
+            the remaining work is deferred to the next run
+        backfill: Whether holes older than 24 hours are repaired as well
+        shard: (index, count) to collect only shard `index` of `count`, or None for all coins
+
     Returns:
-        List of hourly candle data within the specified time range
+        Scheduler summary (see FetchScheduler.run)
     """
-    max_retries = 5
-    retry_delay = 2  # Start with a 2-second delay
-
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(
-                'https://api.hyperliquid.xyz/info',
-                json={
-                    "type": "candleSnapshot", 
-                    "req": {
-                        "coin": coin, 
-                        "interval": "1h", 
-                        "startTime": start_time_ms, 
-                        "endTime": end_time_ms
-                    }
-                },
-                headers={'Content-Type': 'application/json'}
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            # Convert the candle data to our standard format for volume data
-            volume_data = []
-            for candle in data:
-                volume_data.append({
-                    'coin': coin,
-                    'open_price': float(candle['o']),
-                    'high_price': float(candle['h']),
-                    'low_price': float(candle['l']),
-                    'close_price': float(candle['c']),
-                    'volume_usd': float(candle['v']) * float(candle['c']),  # Volume in USD (volume × close price)
-                    'trade_count': candle['n'],
-                    'time': candle['t']  # Start time of the candle
-                })
-            
-            return volume_data
-            
-        except HTTPError as http_err:
-            if response.status_code == 429:
-                print(f"Rate limit exceeded for {coin}. Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-                continue
+    stores = dict(stores or {})
+    if shard is not None:
+        shard_registry(shard)
+    with span('open_store'):
+        for dataset in datasets:
+            make_store, legacy_csv = DATASETS[dataset][:2]
+            store = stores.get(dataset) or make_store()
+            if shard is not None:
+                # Shards never import the legacy CSV: parallel imports would race
+                store = shard_store(store, shard)
+                if not store.index.loaded and not store.is_empty():
+                    store.index.rebuild(store)
+                stores[dataset] = store
             else:
-                print(f"HTTP error occurred for {coin}: {http_err}")
-                return []
-        except Exception as e:
-            print(f"Error fetching volume data for {coin}: {e}")
-            return []
-    
-    print(f"Failed to fetch volume data for {coin} after {max_retries} retries due to rate limiting.")
-    return []
+                stores[dataset] = open_store(store, legacy_csv)
+
+    now = clock.utcnow()
+    print(f"Fetching {' and '.join(datasets)} data at {now.strftime('%Y-%m-%d %H:%M:%S')} UTC")
+    if coins is None and use_snapshot:
+        if snapshot is None:
+            with span('snapshot'):
+                snapshot = get_market_snapshot()
+        if snapshot:
+            coins = snapshot['coins']
+    if coins is None:
+        with span('coin_list'):
+            coins = get_all_coins()
+    print(f"Found {len(coins)} coins.")
+    if shard is not None:
+        coins = shard_coins(coins, shard)
+        print(f"Collecting shard {shard[0]}/{shard[1]}: {len(coins)} coins.")
+
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    # Funding for the current hour is settled at its start, so its print is
+    # already in fundingHistory. Candles are only complete once the hour ends.
+    end_hours = {
+        'funding': current_hour + timedelta(hours=1),
+        'volume': current_hour,
+    }
+    scheduler = FetchScheduler(
+        [Dataset(dataset, stores[dataset], DATASETS[dataset][2], DATASETS[dataset][3], to_ms(end_hours[dataset]))
+         for dataset in datasets],
+        deadline=deadline,
+        queue=shard_queue(shard) if shard is not None else None,
+    )
+    with span('plan'):
+        items = scheduler.plan(coins, backfill=backfill)
+    if items:
+        print(f"Found {len(items)} missing ranges across {len({item.coin for item in items})} coins.")
+    else:
+        print("No data missing.")
+    with span('fetch'):
+        summary = scheduler.run(items)
+    fetched = ', '.join(f"{count} {tier}" for tier, count in summary['fetched'].items() if count) or 'none'
+    rows = ', '.join(f"{count} {dataset}" for dataset, count in summary['rows'].items())
+    print(f"Fetched ranges: {fetched}; appended rows: {rows}.")
+    if summary['failed']:
+        print(f"{summary['failed']} ranges failed and are queued for the next run.")
+    if summary['deferred'] > summary['failed']:
+        print(f"Deadline reached: {summary['deferred'] - summary['failed']} ranges deferred to the next run.")
+    if summary['skipped']:
+        print(f"Skipped {summary['skipped']} ranges the exchange had no data for on earlier attempts.")
+
+    if shard is not None:
+        write_manifest(shard, coins, {dataset: to_ms(end_hours[dataset]) for dataset in datasets}, summary['rows'])
+        print("Shard output written; run the merge mode once every shard has finished.")
+        return summary
+    registry = coin_registry()
+    finish_collection(stores, backdate=sorted(registry.added))
+    registry.added.clear()
+    return summary
 
-def get_latest_volume(coin):
+def finish_collection(stores, backdate=(), force_compaction=False):
     """
-    Get the latest completed hourly volume data for a coin.
-    Ensures we only get data for the last fully completed hour.
+    Upkeep after new rows reached the stores: date coins from their history,
+    roll up the closed candles, drop data past retention and compact.
+
+    Args:
+        stores: Dict of dataset -> store
+        backdate: Coins whose registry first-seen hour may be later than their first row
+        force_compaction: Compact the journals even if compaction is not due yet
     """
-    # Get current time and find the last completed hour
-    now = datetime.now(timezone.utc)
-    current_hour = now.replace(minute=0, second=0, microsecond=0)
-    
-    # Always use the previous hour to ensure it's complete
-    latest_completed_hour = current_hour - timedelta(hours=1)
-    
-    # Calculate the time range for the last completed hour
-    end_time_ms = int(latest_completed_hour.timestamp() * 1000) + 3600000  # Add one hour in ms
-    start_time_ms = int(latest_completed_hour.timestamp() * 1000)
-    
-    print(f"Collecting latest volume for {coin} from {datetime.fromtimestamp(start_time_ms/1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} to {datetime.fromtimestamp(end_time_ms/1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    volume_data = get_volume_for_time_range(coin, start_time_ms, end_time_ms)
-    if volume_data:
-        return volume_data[0]  # Return the latest hour's data
-    return None
+    # Coins the registry has just met may have older history (e.g. collected
+    # before the registry existed or backfilled above); date them from it
+    registry = coin_registry()
+    backdated = [coin for coin in backdate for store in stores.values()
+                 if registry.backdate(coin, store.index.first_hour(coin))]
+    if backdated:
+        registry.save()
+
+    # Fold the closed candles into the daily and weekly rollups
+    if 'volume' in stores:
+        with span('rollups'):
+            rollups = ohlcv_rollups(stores['volume'])
+            days, weeks = rollups.update()
+        if days:
+            print(f"Rolled up {days} days and {weeks} weeks of volume data.")
 
-def check_missing_volume_data_past_24h(existing_df, coins):
+    # Keep only data from the past N days by dropping whole partitions
+    with span('retention'):
+        for dataset in stores:
+            N = DATASETS[dataset][4]  # Number of days to keep
+            cutoff_time = clock.utcnow() - timedelta(days=N)
+            dropped = stores[dataset].drop_before(to_ms(cutoff_time))
+            if dropped:
+                print(f"Dropped {len(dropped)} {dataset} partitions older than {N} days.")
+        if 'volume' in stores:
+            rollups.drop_expired(to_ms(clock.utcnow()))
+
+    for store in stores.values():
+        start_background_compaction(store, force=force_compaction)
+
+def collect_funding_data(snapshot=None, use_snapshot=True, store=None, deadline=None, backfill=True, shard=None):
     """
-    Check for missing hourly volume data in the past 24 hours and fetch them if needed.
-    Only checks BTC for missing hours, as BTC should always have data and can be 
-    used as a reference for all coins.
-    
+    Collect funding data only (see collect_data).
+
     Args:
-        existing_df: DataFrame containing existing volume data
-        coins: List of coin symbols
-        
+        snapshot: Market snapshot to reuse (fetched here if not given)
+        use_snapshot: Set to False to take the coin list from the coin registry instead
+        store: Funding store to write into (opened here if not given)
+        deadline: time.monotonic() value after which no new request is started
+        backfill: Whether holes older than 24 hours are repaired as well
+        shard: (index, count) to collect only one shard of the coins
+    """
+    return collect_data(('funding',), snapshot=snapshot, use_snapshot=use_snapshot,
+                        stores={'funding': store}, deadline=deadline, backfill=backfill, shard=shard)
+
+def collect_volume_data(coins=None, store=None, deadline=None, backfill=True, shard=None, snapshot=None,
+                        use_snapshot=True):
+    """
+    Collect volume data only (see collect_data).
+
+    Args:
+        coins: List of coin symbols (taken from the snapshot or the registry if not given)
+        store: Volume store to write into (opened here if not given)
+        deadline: time.monotonic() value after which no new request is started
+        backfill: Whether holes older than 24 hours are repaired as well
+        shard: (index, count) to collect only one shard of the coins
+        snapshot: Market snapshot to reuse (fetched here if not given)
+        use_snapshot: Set to False to take the coin list from the coin registry instead
+    """
+    return collect_data(('volume',), snapshot=snapshot, use_snapshot=use_snapshot, coins=coins,
+                        stores={'volume': store}, deadline=deadline, backfill=backfill, shard=shard)
+
+# ================ SHARDED COLLECTION ================
+
+@timed('merge_shards')
+def merge_shard_outputs():
+    """
+    Merge the outputs of `--shard i/N` runs into the main stores, check that
+    together they covered every coin and the latest hour, then do the upkeep
+    a single collection run does (rollups, retention, compaction). The
+    journals are compacted even if not due, so the next shard runs read
+    everything from the partitions.
+
     Returns:
-        DataFrame with any missing data added, and a boolean indicating if latest hour data was collected
+        The completeness report (see sharding.check_merge), or None if there
+        was nothing to merge
     """
-    # Get current time and 24 hours ago
-    now = datetime.now(timezone.utc)
-    current_hour = now.replace(minute=0, second=0, microsecond=0)
-    
-    # Always use the previous hour to ensure it's complete
-    latest_completed_hour = current_hour - timedelta(hours=1)
-    
-    next_hour = latest_completed_hour + timedelta(hours=1)  # Important to include the latest hour in the range
-    hours_24_ago = latest_completed_hour - timedelta(hours=24)
-    
-    # Convert to milliseconds for API and filtering
-    next_hour_ms = int(next_hour.timestamp() * 1000)
-    hours_24_ago_ms = int(hours_24_ago.timestamp() * 1000)
-    
-    # Generate expected hourly timestamps for the past 24 hours
-    expected_hours = []
-    for i in range(24, 0, -1):  # From 24 hours ago to 1 hour ago
-        hour_timestamp = latest_completed_hour - timedelta(hours=i)
-        expected_hours.append(hour_timestamp)
-    # Add latest completed hour
-    expected_hours.append(latest_completed_hour)
-    
-    # Flag to track if we need to collect latest hour data separately
-    latest_hour_collected = False
-    
-    # Reference coin to check for missing data (BTC is the oldest and most reliable)
-    reference_coin = "BTC"
-    
-    if existing_df.empty:
-        print("No existing volume data found. Will fetch data for all coins for the past 24 hours.")
-        # If no data exists, we'll fetch everything from the past 24 hours
-        start_time_ms = hours_24_ago_ms
-        end_time_ms = next_hour_ms
-        missing_hours = expected_hours
-        latest_hour_collected = True  # We'll collect latest hour data in this pass
-    else:
-        # Remove any incomplete data (specifically the timestamp provided)
-        incomplete_timestamp = 1743692400000
-        if incomplete_timestamp in existing_df['time'].values:
-            incomplete_count = len(existing_df[existing_df['time'] == incomplete_timestamp])
-            print(f"Found {incomplete_count} entries with incomplete data (timestamp {incomplete_timestamp}), removing them.")
-            existing_df = existing_df[existing_df['time'] != incomplete_timestamp].copy()
-            print(f"After removal, dataframe has {len(existing_df)} rows.")
-        
-        # Optimize CSV parsing by only looking at recent data
-        # First, convert the 'time' column to numeric if it's not already
-        if 'time' not in existing_df.columns:
-            print("Warning: 'time' column not found in volume CSV. Using empty DataFrame.")
-            existing_df = pd.DataFrame()
-            start_time_ms = hours_24_ago_ms
-            end_time_ms = next_hour_ms
-            missing_hours = expected_hours
-            latest_hour_collected = True  # We'll collect latest hour data in this pass
-            return check_missing_volume_data_past_24h(existing_df, coins)
-        
-        # Filter to only include data from the past 48 hours (to be safe)
-        cutoff_time_ms = hours_24_ago_ms - 24 * 60 * 60 * 1000  # 48 hours ago
-        recent_df = existing_df[existing_df['time'] >= cutoff_time_ms].copy()
-        
-        if recent_df.empty:
-            print("No recent volume data found in the past 48 hours. Will fetch data for all coins for the past 24 hours.")
-            start_time_ms = hours_24_ago_ms
-            end_time_ms = next_hour_ms
-            missing_hours = expected_hours
-            latest_hour_collected = True  # We'll collect latest hour data in this pass
-        else:
-            # Convert time column to datetime
-            recent_df['time_dt'] = pd.to_datetime(recent_df['time'], unit='ms', utc=True)
-            
-            # Round timestamps to the nearest hour to match expected hourly data points
-            recent_df['hour'] = recent_df['time_dt'].dt.floor('h')
-            
-            # Get unique hours in the existing data for the past 24 hours, but only for BTC
-            btc_df = recent_df[
-                (recent_df['coin'] == reference_coin) & 
-                (recent_df['hour'] >= hours_24_ago) & 
-                (recent_df['hour'] <= latest_completed_hour)
-            ]
-            
-            # Get the hours for which we have BTC data
-            btc_hours = set(btc_df['hour'])
-            
-            # Find missing hours for BTC only
-            missing_hours = []
-            for hour in expected_hours:
-                if hour not in btc_hours:
-                    missing_hours.append(hour)
-            
-            missing_hours = sorted(missing_hours)
-            
-            # Check if only the latest hour is missing
-            if missing_hours == [latest_completed_hour]:
-                print(f"Only latest hour data is missing for {reference_coin}, which will be collected in the next step.")
-                return existing_df, False
-            elif not missing_hours:
-                print(f"No data missing for {reference_coin} in past 24h. Assuming all coins have complete volume data.")
-                return existing_df, True  # Signal that we have all data
-            
-            # Print missing hours
-            missing_hours_str = ", ".join([hour.strftime('%Y-%m-%d %H:%M:%S UTC') for hour in missing_hours])
-            print(f"Found missing volume data for {reference_coin} during hours: {missing_hours_str}")
-            print(f"Will collect these hours for all {len(coins)} coins.")
-            
-            # Check if latest hour is among the missing hours
-            if latest_completed_hour in missing_hours:
-                latest_hour_collected = True
-                print("Latest hour volume data will be collected along with other missing data.")
-            
-            # Set time range to cover all missing hours plus an hour
-            start_time_ms = int(min(missing_hours).timestamp() * 1000)
-            end_time_ms = int((max(missing_hours) + timedelta(hours=1)).timestamp() * 1000)
-    
-    # Fetch all missing data in one go for each coin
-    all_missing_data = []
-    
-    # Introduce delay to stay within rate limits
-    max_requests_per_minute = 60
-    delay_between_requests = 60 / max_requests_per_minute  # in seconds
-    
-    print(f"Fetching volume data from {datetime.fromtimestamp(start_time_ms/1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC to {datetime.fromtimestamp(end_time_ms/1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC")
-    
-    for coin in coins:
-        # Fetch data for the entire time range
-        coin_data = get_volume_for_time_range(coin, start_time_ms, end_time_ms)
-        if coin_data:
-            all_missing_data.extend(coin_data)
-            total_volume = sum(item['volume_usd'] for item in coin_data)
-            print(f"Collected volume data for {coin}: ${total_volume:.2f} across {len(coin_data)} hourly periods")
+    shards = find_shards()
+    if not shards:
+        print("No shard outputs to merge.")
+        return None
+    stores = {}
+    with span('open_store'):
+        for dataset in DATASETS:
+            make_store, legacy_csv = DATASETS[dataset][:2]
+            stores[dataset] = open_store(make_store(), legacy_csv)
+    registry = coin_registry()
+    with span('merge'):
+        rows = merge_shards(stores, shards, registry)
+    print(f"Merged {len(shards)} shard outputs: " + ', '.join(f"{count} {dataset}" for dataset, count in rows.items())
+          + " rows.")
+
+    report = check_merge(stores, shards, registry.active_coins())
+    for index, count in report['absent']:
+        print(f"Warning: shard {index}/{count} left no output.")
+    for index, count in report['unfinished']:
+        print(f"Warning: shard {index}/{count} did not finish; merged the rows it collected.")
+    if report['uncovered']:
+        print(f"Warning: {len(report['uncovered'])} coins were in no finished shard: "
+              f"{', '.join(report['uncovered'][:10])}{' ...' if len(report['uncovered']) > 10 else ''}")
+    for dataset, missing in report['missing_latest'].items():
+        if missing:
+            print(f"{sum(len(coins) for coins in missing.values())} coins have no {dataset} row for the latest hour ("
+                  + ', '.join(f"shard {index}/{count}: {len(coins)}" for (index, count), coins in missing.items())
+                  + "); they are repaired by the next run.")
         else:
-            print(f"No volume data available for {coin} in the specified time range")
-        
-        time.sleep(delay_between_requests)  # Pause to respect rate limits
-    
-    if all_missing_data:
-        # Add the missing data to the existing DataFrame
-        missing_df = pd.DataFrame(all_missing_data)
-        combined_df = pd.concat([existing_df, missing_df], ignore_index=True)
-        # Remove duplicates
-        combined_df.drop_duplicates(subset=['coin', 'time'], inplace=True)
-        print(f"Added {len(all_missing_data)} entries to fill missing volume data.")
-        return combined_df, latest_hour_collected
-    
-    return existing_df, latest_hour_collected
+            print(f"Every merged coin has a {dataset} row for the latest hour.")
+    current_run().count('shards_merged', len(shards))
 
-def collect_volume_data():
+    finish_collection(stores, backdate=sorted({coin for manifest in shards.values() if manifest
+                                               for coin in manifest['coins']}), force_compaction=True)
+    return report
+
+
+# ================ HISTORICAL BACKFILL ================
+
+def parse_since(value):
     """
-    Main function to collect volume data.
+    Parse a --since value: an ISO date or datetime (UTC), or an age such as '90d' or '36h'.
+    Returns a timezone-aware datetime.
     """
-    # Initialize an empty DataFrame or read existing data
-    filename = 'ohlcv_data_main.csv'
-    try:
-        existing_df = pd.read_csv(filename)
-        print(f"Loaded existing volume data with {len(existing_df)} rows.")
-        
-        # First, remove any incomplete data (specifically the timestamp provided)
-        incomplete_timestamp = 1743692400000
-        if incomplete_timestamp in existing_df['time'].values:
-            incomplete_count = len(existing_df[existing_df['time'] == incomplete_timestamp])
-            print(f"Found {incomplete_count} entries with incomplete data (timestamp {incomplete_timestamp}), removing them.")
-            existing_df = existing_df[existing_df['time'] != incomplete_timestamp].copy()
-            print(f"After removal, dataframe has {len(existing_df)} rows.")
-    except FileNotFoundError:
-        existing_df = pd.DataFrame()
-        print("No existing volume data file found. Starting fresh.")
-
-    print(f"Fetching volume data at {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC")
-    coins = get_all_coins()
-    print(f"Found {len(coins)} coins.")
-    
-    # Get current time to calculate the latest completed hour
-    now = datetime.now(timezone.utc)
-    current_hour = now.replace(minute=0, second=0, microsecond=0)
-    latest_completed_hour = current_hour - timedelta(hours=1)
-    print(f"Current time: {now.strftime('%Y-%m-%d %H:%M:%S')} UTC")
-    print(f"Latest completed hour: {latest_completed_hour.strftime('%Y-%m-%d %H:%M:%S')} UTC")
-    
-    # Check for missing data from the past 24 hours
-    result_df, latest_hour_collected = check_missing_volume_data_past_24h(existing_df, coins)
-    
-    # Only fetch latest hour's data if it wasn't already collected
-    if not latest_hour_collected:
-        print(f"Collecting latest completed hour's volume data ({latest_completed_hour.strftime('%Y-%m-%d %H:%M:%S')} UTC)...")
-        volume_data = []
-
-        # Introduce delay to stay within rate limits
-        max_requests_per_minute = 60
-        delay_between_requests = 60 / max_requests_per_minute  # in seconds
-
-        for coin in coins:
-            latest_volume = get_latest_volume(coin)
-            if latest_volume:
-                volume_data.append(latest_volume)
-                print(f"Collected volume data for {coin}: ${latest_volume['volume_usd']:.2f}")
-            else:
-                print(f"Could not collect volume data for {coin}")
-            time.sleep(delay_between_requests)  # Pause to respect rate limits
+    match = re.fullmatch(r'(\d+)([dh])', value.strip())
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)
+        delta = timedelta(days=amount) if unit == 'd' else timedelta(hours=amount)
+        return clock.utcnow() - delta
+    since = datetime.fromisoformat(value)
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return since
 
-        if volume_data:
-            df_new = pd.DataFrame(volume_data)
-            # Combine with existing data
-            combined_df = pd.concat([result_df, df_new], ignore_index=True)
-            # Remove duplicates
-            combined_df.drop_duplicates(subset=['coin', 'time'], inplace=True)
-            result_df = combined_df
-            print(f"Added {len(volume_data)} entries for latest hour's volume data.")
+@timed('backfill')
+def backfill_data(since, coins=None, datasets=('funding', 'volume')):
+    """
+    Backfill history from `since` up to the current hour in page-sized chunks.
+    Progress is checkpointed, so running the same command again after an
+    interruption resumes where it stopped.
 
-    # Keep only data from the past N days for volume
-    N_volume = 31  # Keep 31 days of volume data
-    cutoff_time_volume = datetime.now(timezone.utc) - timedelta(days=N_volume)
-    cutoff_time_ms_volume = int(cutoff_time_volume.timestamp() * 1000)
-    result_df = result_df[result_df['time'] >= cutoff_time_ms_volume]
+    Args:
+        since: Backfill start as given on the command line (see parse_since)
+        coins: List of coin symbols (all coins if not given)
+        datasets: Datasets to backfill ('funding' and/or 'volume')
+    """
+    all_coins = get_all_coins()
+    if coins:
+        unknown = sorted(set(coins) - set(all_coins))
+        if unknown:
+            print(f"Warning: unknown coins will be skipped: {', '.join(unknown)}")
+        backfill_coins = [coin for coin in coins if coin in all_coins]
+    else:
+        backfill_coins = all_coins
+    if not backfill_coins:
+        print("No coins to backfill.")
+        return
+
+    current_hour = clock.utcnow().replace(minute=0, second=0, microsecond=0)
+    since_hour = parse_since(since).replace(minute=0, second=0, microsecond=0)
+    checkpoint = BackfillCheckpoint(CHECKPOINT_PATH, since, coins, datasets, to_ms(since_hour), to_ms(current_hour))
+    if checkpoint.resumed:
+        print(f"Resuming backfill with {len(checkpoint.done)} chunks already done.")
+
+    failed = 0
+    for dataset in datasets:
+        make_store, legacy_csv, fetch_fn, chunk_hours, retention_days = DATASETS[dataset]
+        retention_days = BACKFILL_DAYS.get(dataset, retention_days)
+        store = open_store(make_store(), legacy_csv)
 
-    # Save to CSV
-    result_df.to_csv(filename, index=False)
-    print(f"Saved volume data to {filename} with {len(result_df)} rows.")
+        # Nothing older than the retention window would be kept. Both bounds are
+        # fixed when the job is created, so resumed runs see the same chunk grid.
+        start_ms = max(checkpoint.start_ms, checkpoint.end_ms - retention_days * 24 * 3600000)
+        if start_ms > checkpoint.start_ms:
+            print(f"Clamping {dataset} backfill start to {retention_days} days back.")
+
+        summary = run_backfill(store, dataset, backfill_coins, start_ms, checkpoint.end_ms,
+                               fetch_fn, chunk_hours, checkpoint)
+        failed += summary['failed']
+        if dataset == 'volume':
+            rollups = ohlcv_rollups(store)
+            # Before the next collection drops the candles older than the hourly retention
+            days, weeks = rollups.update(start_ms=start_ms)
+            print(f"Rolled up {days} days and {weeks} weeks of volume data.")
+            # Whole days before the hourly candle history come from 1d candles
+            daily_start = -(-max(checkpoint.start_ms, checkpoint.end_ms - OHLCV_DAILY_RETENTION_DAYS * DAY_MS)
+                            // DAY_MS) * DAY_MS
+            daily_end = -(-start_ms // DAY_MS) * DAY_MS
+            if daily_start < daily_end:
+                summary = run_backfill(rollups.daily, 'volume_1d', backfill_coins, daily_start, daily_end,
+                                       get_daily_volume_for_time_range, CANDLE_HISTORY * 24, checkpoint)
+                failed += summary['failed']
+                weeks = rollups.update_weeks(list(range(daily_start, daily_end, DAY_MS)))
+                print(f"Rolled up {weeks} weeks of volume data from daily candles.")
+                start_background_compaction(rollups.daily, force=True)
+        start_background_compaction(store, force=True)
+
+    wait_for_compaction()
+    if failed:
+        print(f"{failed} chunks failed; run the same command again to retry them.")
+    else:
+        checkpoint.clear()
+        print("Backfill complete.")
+
+
+# ================ STREAMING DAEMON ================
+
+def run_daemon(ws_url=None, deadline=None):
+    """
+    Run the WebSocket streaming collector until interrupted.
+    Gaps are repaired over REST on startup (including older holes, until the
+    deadline) and the past 24 hours again after every reconnect.
+    """
+    funding = open_store(funding_store(), FUNDING_CSV)
+    volume = open_store(ohlcv_store(), OHLCV_CSV)
+
+    snapshot = get_market_snapshot()
+    coins = snapshot['coins'] if snapshot else get_all_coins()
+    if not coins:
+        print("Could not fetch the coin list. Exiting.")
+        return
+
+    def repair(deadline=None, backfill=False):
+        print("Repairing gaps over REST...")
+        collect_data(use_snapshot=False, coins=coins, stores={'funding': funding, 'volume': volume},
+                     deadline=deadline, backfill=backfill)
+
+    repair(deadline=deadline, backfill=True)
+    collector = StreamingCollector(
+        coins, funding, volume,
+        rollups=ohlcv_rollups(volume),
+        url=ws_url or ws_url_from_env(),
+        refresh_coins=get_all_coins,
+        on_reconnect=repair,
+    )
+    try:
+        asyncio.run(collector.run())
+    except KeyboardInterrupt:
+        print("Streaming collector stopped.")
 
 
 # ================ MAIN FUNCTION ================
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Hyperliquid market data collector")
+    parser.add_argument('mode', nargs='?', type=str.lower,
+                        choices=['funding', 'volume', 'compact', 'backfill', 'daemon', 'merge'],
+                        help="Collect only one dataset, compact the journals, backfill history, "
+                             "stream continuously over WebSocket, or merge the outputs of --shard runs. "
+                             "If omitted, both funding and volume data are collected.")
+    parser.add_argument('--since', help="Backfill start: ISO date/datetime (UTC) or an age like 90d or 36h")
+    parser.add_argument('--coins', help="Comma-separated coins to backfill (default: all)")
+    parser.add_argument('--dataset', choices=['funding', 'volume', 'both'], default='both',
+                        help="Dataset to backfill (default: both)")
+    parser.add_argument('--ws-url', help="WebSocket URL for daemon mode (default: HYPERLIQUID_WS_URL or mainnet)")
+    parser.add_argument('--deadline', type=float, default=DEFAULT_DEADLINE_SECONDS, metavar='SECONDS',
+                        help="Stop starting gap repair requests this many seconds after start and queue the "
+                             f"rest for the next run; 0 for no limit (default: {DEFAULT_DEADLINE_SECONDS})")
+    parser.add_argument('--shard', type=shard_arg, metavar='I/N',
+                        help="Collect only shard I of N of the coins (split by a stable hash of the symbol) into "
+                             "data/shards/, so N collectors can run in parallel; the merge mode then unions "
+                             "their outputs into the main stores")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument('--record', metavar='DIR',
+                          help="Record every /info request and its response into a cassette directory")
+    cassette.add_argument('--replay', metavar='DIR',
+                          help="Serve /info requests from a cassette made with --record, with no network or rate "
+                               "limiting and the clock set to the recording time. Run it on a copy of the data "
+                               "directory as it was before the recorded run.")
+    telemetry.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.mode == 'backfill' and not args.since:
+        parser.error("backfill requires --since")
+    if args.shard and args.mode not in (None, 'funding', 'volume'):
+        parser.error(f"--shard only applies to collection runs, not {args.mode} mode")
+    if args.mode == 'daemon' and (args.record or args.replay):
+        parser.error("--record and --replay do not cover the WebSocket stream of daemon mode")
+    return args
+
+def shard_arg(value):
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def open_cassette(args, argv=None):
+    """
+    Install a recording or replaying client for --record / --replay.
+
+    Returns:
+        The Cassette, or None if neither option was given
+    """
+    if args.record:
+        cassette = Cassette.create(args.record, argv if argv is not None else sys.argv[1:])
+        set_client(RecordingClient(cassette, base_url=os.environ.get('HYPERLIQUID_API_URL', DEFAULT_BASE_URL)))
+        print(f"Recording API responses to {args.record}")
+        return cassette
+    if args.replay:
+        cassette = Cassette.open(args.replay)
+        clock.freeze(cassette.recorded_at)
+        set_client(ReplayClient(cassette))
+        print(f"Replaying {len(cassette)} API responses from {args.replay}")
+        return cassette
+    return None
+
+def main(argv=None):
+    args = parse_args(argv)
+    cassette = open_cassette(args, argv)
+    deadline = time.monotonic() + args.deadline if args.deadline > 0 else None
+    run_name = f"collector-shard-{args.shard[0]}-of-{args.shard[1]}" if args.shard else 'collector'
+    run = telemetry.start_run(run_name, out_dir=args.telemetry_dir,
+                              profile_stage=args.profile, profile_mode=args.profile_mode)
+
     print("=== Hyperliquid Market Data Collector ===")
-    print(f"Starting collection at: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}")
-    
-    # Check for command line arguments
-    if len(sys.argv) > 1:
-        if sys.argv[1].lower() == 'funding':
-            print("Collecting only funding data...")
-            collect_funding_data()
-        elif sys.argv[1].lower() == 'volume':
-            print("Collecting only volume data...")
-            collect_volume_data()
-        else:
-            print(f"Unknown argument: {sys.argv[1]}")
-            print("Usage: python market_data_collector.py [funding|volume]")
-            print("       If no argument is provided, both funding and volume data will be collected.")
-            return
+    print(f"Starting collection at: {clock.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}")
+    
+    if args.mode == 'funding':
+        print("Collecting only funding data...")
+        collect_funding_data(deadline=deadline, shard=args.shard)
+    elif args.mode == 'volume':
+        print("Collecting only volume data...")
+        collect_volume_data(deadline=deadline, shard=args.shard)
+    elif args.mode == 'compact':
+        print("Compacting journals...")
+        start_background_compaction(funding_store(), force=True)
+        start_background_compaction(ohlcv_store(), force=True)
+    elif args.mode == 'backfill':
+        coins = [coin.strip() for coin in args.coins.split(',') if coin.strip()] if args.coins else None
+        datasets = ('funding', 'volume') if args.dataset == 'both' else (args.dataset,)
+        backfill_data(args.since, coins=coins, datasets=datasets)
+    elif args.mode == 'daemon':
+        run_daemon(ws_url=args.ws_url, deadline=deadline)
+    elif args.mode == 'merge':
+        print("Merging shard outputs...")
+        merge_shard_outputs()
     else:
-        # Collect both types of data
-        print("Collecting funding data...")
-        collect_funding_data()
-        
-        print("\nCollecting volume data...")
-        collect_volume_data()
-    
-    print(f"Data collection completed at: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}")
+        # Both datasets share one snapshot, coin list and request schedule
+        print("Collecting funding and volume data...")
+        collect_data(deadline=deadline, shard=args.shard)
+    
+    with span('wait_for_compaction'):
+        wait_for_compaction()
+    if cassette is not None:
+        cassette.close()
+        if args.replay and cassette.misses:
+            print(f"{cassette.misses} requests were not in the cassette.")
+    print(f"Data collection completed at: {clock.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}")
+    report_path, _ = run.write()
+    print(f"Run report written to {report_path}")
 
 if __name__ == "__main__":
     main()
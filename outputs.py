@@ -0,0 +1,101 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from telemetry import current_run
+
+# Timestamp of every .npz member, so equal arrays always give equal bytes
+NPZ_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+# Enough for every figure the table shows (e.g. $123.45M, or 6 decimals of the hourly rate)
+PAYLOAD_SIGNIFICANT_DIGITS = 6
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path):
+    """
+    Return the content hash of a file, or None if it does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_file(path, data):
+    """
+    Write bytes (or text, as UTF-8) to a file unless it already holds exactly
+    that content. The new content goes to a temporary file that is renamed
+    over the old one, so readers never see a partial file, and files whose
+    content hash is unchanged keep their bytes and mtime (nothing to commit).
+
+    Returns:
+        True if the file was written, False if it was already up to date
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if (os.path.exists(path) and os.path.getsize(path) == len(data)
+            and file_hash(path) == content_hash(data)):
+        current_run().count('output_files_unchanged')
+        return False
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    # A temporary file of its own, so concurrent writers of the same path never share one
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp creates the file private to the user; keep the usual permissions
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    current_run().count('output_files_written')
+    current_run().count('output_bytes_written', len(data))
+    return True
+
+
+def write_json(path, data):
+    """
+    Write data as minified JSON with write_file.
+    """
+    return write_file(path, json.dumps(data, separators=(',', ':')))
+
+
+def compact_number(value, digits=PAYLOAD_SIGNIFICANT_DIGITS):
+    """
+    Round a value to a number of significant digits for a JSON payload.
+    NaN becomes None; integral results are written without a fraction.
+    """
+    if value is None or np.isnan(value):
+        return None
+    rounded = float(f"{value:.{digits}g}")
+    return int(rounded) if rounded.is_integer() and abs(rounded) < 2 ** 53 else rounded
+
+
+def npz_bytes(arrays, compress=True):
+    """
+    Serialize arrays like np.savez / np.savez_compressed, but with fixed
+    member timestamps, so the same arrays always give the same bytes.
+    """
+    buffer = io.BytesIO()
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with zipfile.ZipFile(buffer, 'w', compression=compression, allowZip64=True) as archive:
+        for name, values in arrays.items():
+            info = zipfile.ZipInfo(name + '.npy', date_time=NPZ_DATE_TIME)
+            info.compress_type = compression
+            with archive.open(info, 'w', force_zip64=True) as member:
+                np.lib.format.write_array(member, np.asanyarray(values), allow_pickle=False)
+    return buffer.getvalue()
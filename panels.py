@@ -0,0 +1,105 @@
+import numpy as np
+
+from schema import coin_codes, hour_key
+
+
+class HourlyPanel:
+    """
+    Dense hour x coin arrays pivoted from a long (coin, time, ...) frame.
+
+    Row i holds epoch hour `start_hour + i` and column j holds `coins[j]`.
+    `valid` marks the cells that have a row in the source frame; value
+    columns are zero where there is no row. Window sums and counts come from
+    cumulative sums along the hour axis, so any number of windows over every
+    coin costs two lookups per window instead of a scan over the rows.
+    """
+
+    def __init__(self, coins, start_hour, values, valid):
+        self.coins = coins
+        self.start_hour = start_hour
+        self.values = values
+        self.valid = valid
+        self._cumsums = {}
+
+    @classmethod
+    def from_frame(cls, df, columns, time_column='time'):
+        """
+        Pivot a frame into a panel. Times are floored to the hour; if a coin
+        has several rows in one hour the last one wins.
+
+        Args:
+            df: DataFrame with 'coin', the time column (ms) and the value columns
+            columns: Value columns to pivot
+
+        Returns:
+            HourlyPanel
+        """
+        hours = hour_key(df[time_column])
+        coins, coin_ids = coin_codes(df['coin'])
+        coins = np.array(coins, dtype=str)
+        start_hour = int(hours.min()) if len(hours) else 0
+        n_hours = int(hours.max()) - start_hour + 1 if len(hours) else 0
+
+        rows = hours - start_hour
+        valid = np.zeros((n_hours, len(coins)), dtype=bool)
+        valid[rows, coin_ids] = True
+        values = {}
+        for col in columns:
+            panel = np.zeros((n_hours, len(coins)), dtype=np.float64)
+            panel[rows, coin_ids] = np.nan_to_num(df[col].to_numpy(dtype=np.float64))
+            values[col] = panel
+        return cls(coins, start_hour, values, valid)
+
+    @property
+    def end_hour(self):
+        # Exclusive end of the panel, in epoch hours
+        return self.start_hour + self.valid.shape[0]
+
+    def _cumsum(self, column):
+        # Cumulative sums with a leading zero row; column None counts valid cells
+        if column not in self._cumsums:
+            source = self.valid if column is None else self.values[column]
+            cumsum = np.zeros((source.shape[0] + 1, source.shape[1]), dtype=np.float64)
+            np.cumsum(source, axis=0, out=cumsum[1:])
+            self._cumsums[column] = cumsum
+        return self._cumsums[column]
+
+    def _window(self, column, end_hour, lengths):
+        lengths = np.atleast_1d(np.asarray(lengths, dtype=np.int64))
+        cumsum = self._cumsum(column)
+        hi = np.clip(end_hour - self.start_hour, 0, self.valid.shape[0])
+        lo = np.clip(end_hour - lengths - self.start_hour, 0, self.valid.shape[0])
+        return cumsum[hi] - cumsum[lo]
+
+    def window_sums(self, column, end_hour, lengths):
+        """
+        Sum a column over the windows [end_hour - length, end_hour) for each length.
+
+        Returns:
+            Array of shape (len(lengths), len(coins))
+        """
+        return self._window(column, end_hour, lengths)
+
+    def window_counts(self, end_hour, lengths):
+        """
+        Count the hours present over the windows [end_hour - length, end_hour).
+
+        Returns:
+            Integer array of shape (len(lengths), len(coins))
+        """
+        return self._window(None, end_hour, lengths).astype(np.int64)
+
+    def row(self, column, hour):
+        """
+        Return (values, valid) for every coin at one epoch hour.
+        """
+        i = hour - self.start_hour
+        if not 0 <= i < self.valid.shape[0]:
+            return np.zeros(len(self.coins)), np.zeros(len(self.coins), dtype=bool)
+        return self.values[column][i], self.valid[i]
+
+    def first_valid_hour(self):
+        """
+        Return each coin's first present hour (epoch hours).
+        """
+        return self.start_hour + np.argmax(self.valid, axis=0)
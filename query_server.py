@@ -0,0 +1,407 @@
+"""
+Read-only JSON query service over the collected data.
+
+The funding and volume stores are loaded once into hour x coin panels, so
+rankings and filters over any window are answered from cumulative sums
+instead of re-reading the data. Results are kept in an LRU cache that is
+cleared when new hours land in the stores.
+
+    python query_server.py --port 8765
+
+    # Top 20 by 14d average funding with 7d ADV above $5M
+    curl 'localhost:8765/query?column=f14:funding:14d&column=adv7:adv:7d&where=adv7>5e6&sort=-f14&limit=20'
+
+    # Coins whose 3d and 7d averages disagree in sign
+    curl -d '{"columns": {"f3": "funding:3d", "f7": "funding:7d"}, "where": [["f3", "opposite_sign", "f7"]]}' \\
+        localhost:8765/query
+
+Column specs are name:metric:window (or {name: "metric:window"} in JSON).
+Windows are a number of hours or days ('36h', '14d') ending at the latest
+hour, inclusive; 'end' moves the end back to an earlier hour. Metrics:
+
+    funding   average funding rate, annualized in percent (as on the site)
+    premium   average premium
+    adv       average daily volume in USD
+    volume    total volume in USD
+
+A window value is null unless at least min_coverage (default 1.0) of its
+hours are present, like the site's columns.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from completeness import HOUR_MS
+from outputs import compact_number
+from panels import HourlyPanel
+from registry import coin_registry
+from storage import funding_store, ohlcv_store
+
+DEFAULT_PORT = 8765
+CACHE_SIZE = 256
+
+# Seconds between checks for new data in the stores
+RELOAD_CHECK_SECONDS = 5.0
+
+ANNUALIZATION_FACTOR = 24 * 365 * 100
+
+# Metric -> (panel, column, aggregation)
+METRICS = {
+    'funding': ('funding', 'fundingRate', 'mean'),
+    'premium': ('funding', 'premium', 'mean'),
+    'adv': ('volume', 'volume_usd', 'daily'),
+    'volume': ('volume', 'volume_usd', 'sum'),
+}
+
+OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+    'same_sign': lambda a, b: np.sign(a) == np.sign(b),
+    'opposite_sign': lambda a, b: np.sign(a) * np.sign(b) < 0,
+}
+
+MAX_LIMIT = 1000
+
+
+class QueryError(ValueError):
+    """
+    Raised for a malformed query; reported to the client as HTTP 400.
+    """
+
+
+def parse_window(value):
+    """
+    Parse a window such as '36h' or '14d' into hours.
+    """
+    match = re.fullmatch(r'(\d+)([hd])', str(value).strip().lower())
+    if not match or int(match.group(1)) == 0:
+        raise QueryError(f"Invalid window {value!r}; expected e.g. 36h or 14d")
+    return int(match.group(1)) * (24 if match.group(2) == 'd' else 1)
+
+
+def parse_end(value):
+    """
+    Parse an 'end' value (ISO datetime in UTC, or milliseconds) into an epoch hour.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        return int(value) // HOUR_MS
+    try:
+        end = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise QueryError(f"Invalid end {value!r}; expected an ISO datetime or milliseconds")
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    return int(end.timestamp() * 1000) // HOUR_MS
+
+
+def spec_from_params(params):
+    """
+    Build a query spec from URL query parameters (see the module docstring).
+    """
+    columns = {}
+    for value in params.get('column', []):
+        name, _, rest = value.partition(':')
+        columns[name] = rest
+    where = []
+    for value in params.get('where', []):
+        match = re.fullmatch(r'(\w+)\s*(>=|<=|==|!=|>|<|\s+same_sign\s+|\s+opposite_sign\s+)\s*(.+)', value.strip())
+        if not match:
+            raise QueryError(f"Invalid condition {value!r}")
+        where.append([match.group(1), match.group(2).strip(), match.group(3).strip()])
+    spec = {'columns': columns, 'where': where}
+    for key in ('sort', 'limit', 'end', 'min_coverage'):
+        if key in params:
+            spec[key] = params[key][-1]
+    return spec
+
+
+class QueryEngine:
+    """
+    In-memory panels of the funding and volume stores with a result cache.
+
+    Args:
+        open_funding: Returns the funding store to load
+        open_volume: Returns the volume store to load
+        cache_size: Number of query results kept
+    """
+
+    def __init__(self, open_funding=funding_store, open_volume=ohlcv_store, cache_size=CACHE_SIZE):
+        self.open_funding = open_funding
+        self.open_volume = open_volume
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.panels = {}
+        self.version = None
+        self.latest_hour = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def _store_version(self, store):
+        # The completeness index is rewritten with every write to the store
+        path = store.index.path
+        return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+    def refresh(self, force=False):
+        """
+        Reload the panels if the stores changed since they were loaded.
+        Checks are made at most every RELOAD_CHECK_SECONDS unless forced.
+        """
+        with self._lock:
+            if not force and time.monotonic() - self._checked_at < RELOAD_CHECK_SECONDS:
+                return False
+            self._checked_at = time.monotonic()
+            stores = {'funding': self.open_funding(), 'volume': self.open_volume()}
+            version = tuple(self._store_version(store) for store in stores.values())
+            if not force and version == self.version:
+                return False
+
+            start = time.perf_counter()
+            columns = {'funding': ['fundingRate', 'premium'], 'volume': ['volume_usd']}
+            panels = {}
+            for name, store in stores.items():
+                df = store.read(columns=['coin', 'time'] + columns[name])
+                panel = panels[name] = HourlyPanel.from_frame(df, columns[name])
+                # Build the cumulative sums now rather than in the first query
+                panel.window_counts(panel.end_hour, 1)
+                for column in columns[name]:
+                    panel.window_sums(column, panel.end_hour, 1)
+            self.panels = panels
+            self.version = version
+            funding = panels['funding']
+            self.latest_hour = funding.end_hour - 1 if funding.valid.shape[0] else None
+            self.cache.clear()
+            print(f"Loaded {funding.valid.sum()} funding and {panels['volume'].valid.sum()} volume rows "
+                  f"for {len(funding.coins)} coins in {time.perf_counter() - start:.2f}s.")
+            return True
+
+    def _column(self, panels, coins, spec, end_hour, min_coverage):
+        metric, _, window = str(spec).partition(':')
+        if metric not in METRICS:
+            raise QueryError(f"Unknown metric {metric!r}; expected one of {sorted(METRICS)}")
+        hours = parse_window(window)
+        panel_name, column, aggregation = METRICS[metric]
+        panel = panels[panel_name]
+        values = np.full(len(coins), np.nan)
+        if not panel.valid.shape[0]:
+            return values
+        # Each window ends at its own panel's latest hour: candles land an hour after funding
+        panel_end = min(end_hour, panel.end_hour - 1) + 1
+        sums = panel.window_sums(column, panel_end, hours)[0]
+        counts = panel.window_counts(panel_end, hours)[0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if aggregation == 'mean':
+                result = sums / counts
+                if metric == 'funding':
+                    result = result * ANNUALIZATION_FACTOR
+            elif aggregation == 'daily':
+                result = sums / (hours / 24)
+            else:
+                result = sums
+        result = np.where(counts >= min_coverage * hours, result, np.nan)
+        # Panels list coins in their own order; align on the funding panel's coins
+        positions = {coin: i for i, coin in enumerate(panel.coins.tolist())}
+        cols = np.array([positions.get(coin, -1) for coin in coins], dtype=np.int64)
+        values[cols >= 0] = result[cols[cols >= 0]]
+        return values
+
+    def query(self, spec):
+        """
+        Answer a query spec (see the module docstring).
+
+        Returns:
+            Dict with the matching rows and query metadata
+        """
+        self.refresh()
+        key = json.dumps(spec, sort_keys=True, default=str)
+        with self._lock:
+            version = self.version
+            cached = self.cache.get((version, key))
+            if cached is not None:
+                self.cache.move_to_end((version, key))
+                return dict(cached, cached=True)
+            panels = self.panels
+            latest_hour = self.latest_hour
+
+        start = time.perf_counter()
+        if latest_hour is None:
+            raise QueryError("No funding data loaded")
+        columns = spec.get('columns') or {}
+        if not isinstance(columns, dict) or not columns:
+            raise QueryError("At least one column is required, e.g. column=f7:funding:7d")
+        end_hour = parse_end(spec.get('end'))
+        end_hour = latest_hour if end_hour is None else min(end_hour, latest_hour)
+        try:
+            min_coverage = float(spec.get('min_coverage', 1.0))
+            limit = min(int(spec.get('limit', 50)), MAX_LIMIT)
+        except (TypeError, ValueError):
+            raise QueryError("min_coverage and limit must be numbers")
+
+        coins = panels['funding'].coins.tolist()
+        values = {name: self._column(panels, coins, column, end_hour, min_coverage)
+                  for name, column in columns.items()}
+
+        keep = np.ones(len(coins), dtype=bool)
+        for condition in spec.get('where') or []:
+            if len(condition) != 3 or condition[0] not in values or condition[1] not in OPERATORS:
+                raise QueryError(f"Invalid condition {condition!r}; expected [column, operator, value]")
+            name, op, operand = condition
+            if operand in values:
+                operand = values[operand]
+            else:
+                try:
+                    operand = float(operand)
+                except (TypeError, ValueError):
+                    raise QueryError(f"Condition operand {operand!r} is neither a number nor a column")
+            # NaN compares false, so coins without enough data never match
+            with np.errstate(invalid='ignore'):
+                keep &= OPERATORS[op](values[name], operand)
+
+        order = np.flatnonzero(keep)
+        sort = str(spec.get('sort') or '-' + next(iter(columns))).strip()
+        descending = sort.startswith('-')
+        sort_name = sort.lstrip('+-')
+        if sort_name not in values and sort_name != 'coin':
+            raise QueryError(f"Unknown sort column {sort_name!r}")
+        if sort_name == 'coin':
+            order = order[np.argsort(np.array(coins)[order], kind='stable')]
+            if descending:
+                order = order[::-1]
+        else:
+            sort_values = values[sort_name][order]
+            # Coins without a value go last in either direction
+            sort_key = np.where(np.isnan(sort_values), np.inf, -sort_values if descending else sort_values)
+            order = order[np.argsort(sort_key, kind='stable')]
+
+        rows = []
+        for i in order[:limit].tolist():
+            row = {'coin': coins[i]}
+            for name, column_values in values.items():
+                row[name] = compact_number(column_values[i])
+            rows.append(row)
+        result = {
+            'end': datetime.fromtimestamp(end_hour * HOUR_MS / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+            'matched': int(len(order)),
+            'rows': rows,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+        }
+        with self._lock:
+            if version == self.version:
+                self.cache[(version, key)] = result
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return dict(result, cached=False)
+
+    def coins(self):
+        """
+        Return the loaded coins with their registry entries.
+        """
+        self.refresh()
+        registry = coin_registry()
+        return [dict(coin=coin, **(registry.info(coin) or {})) for coin in self.panels['funding'].coins.tolist()]
+
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, engine):
+        super().__init__(address, QueryHandler)
+        self.engine = engine
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body, separators=(',', ':'), allow_nan=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, path, spec=None):
+        engine = self.server.engine
+        try:
+            if path == '/query':
+                self._send(200, engine.query(spec))
+            elif path == '/coins':
+                self._send(200, {'coins': engine.coins()})
+            elif path == '/health':
+                engine.refresh()
+                self._send(200, {'latest_hour': engine.latest_hour, 'cached_results': len(engine.cache)})
+            else:
+                self._send(404, {'error': f"Unknown path {path}; use /query, /coins or /health"})
+        except QueryError as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            self._send(500, {'error': f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            spec = spec_from_params(parse_qs(url.query))
+        except QueryError as e:
+            self._send(400, {'error': str(e)})
+            return
+        self._handle(url.path, spec)
+
+    def do_POST(self):
+        try:
+            spec = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        except json.JSONDecodeError as e:
+            self._send(400, {'error': f"Invalid JSON: {e}"})
+            return
+        if not isinstance(spec, dict):
+            self._send(400, {'error': "The query must be a JSON object"})
+            return
+        self._handle(urlsplit(self.path).path, spec)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve ad-hoc funding and volume queries over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="Query results kept in the LRU cache")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    engine = QueryEngine(cache_size=args.cache_size)
+    server = QueryServer((args.host, args.port), engine)
+    print(f"Serving queries on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
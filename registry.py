@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+
+import clock
+from completeness import HOUR_MS
+from outputs import write_file
+from schema import coin_dictionary
+from storage import DATA_DIR
+
+REGISTRY_NAME = 'universe.json'
+REGISTRY_VERSION = 1
+
+# A universe refreshed less than this long ago is reused instead of fetched
+# again, so one run (or several runs close together) makes one meta request
+REFRESH_TTL_SECONDS = 30 * 60
+
+# A coin counts as new for this many hours after it was first seen
+NEW_COIN_HOURS = 7 * 24
+
+
+class CoinRegistry:
+    """
+    Persisted view of the perp universe.
+
+    Every coin the exchange has listed keeps an entry with the hour it was
+    first and last seen in the universe, whether it is delisted, its coin
+    dictionary id and its cached meta fields (szDecimals, maxLeverage, ...).
+    Entries are never dropped, so first-seen hours survive retention, and the
+    last good universe stays available when a refresh fails.
+    """
+
+    def __init__(self, path, dictionary=None):
+        self.path = path
+        self.dictionary = dictionary or coin_dictionary(os.path.dirname(path) or '.')
+        self.coins = {}         # coin -> entry, in the order first seen
+        self.refreshed_at = None  # Unix time of the last successful refresh
+        self.added = set()      # Coins first seen by this process
+        self._lock = threading.RLock()
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == REGISTRY_VERSION:
+                self.coins = data['coins']
+                self.refreshed_at = data['refreshed_at']
+
+    def __len__(self):
+        return len(self.coins)
+
+    def __contains__(self, coin):
+        return coin in self.coins
+
+    def save(self):
+        with self._lock:
+            write_file(self.path, json.dumps(
+                {'version': REGISTRY_VERSION, 'refreshed_at': self.refreshed_at, 'coins': self.coins}, indent=1))
+
+    def fresh(self, ttl=REFRESH_TTL_SECONDS):
+        return self.refreshed_at is not None and clock.now() - self.refreshed_at < ttl
+
+    def update(self, universe, now=None):
+        """
+        Record a meta universe as the current listing.
+
+        Args:
+            universe: The 'universe' list of a meta response
+            now: Unix time of the response (defaults to now)
+
+        Returns:
+            List of coins seen for the first time
+        """
+        now = clock.now() if now is None else now
+        hour = int(now * 1000) // HOUR_MS
+        with self._lock:
+            names = [asset['name'] for asset in universe]
+            ids = self.dictionary.ids(names)
+            listed = set()
+            added = []
+            for asset, coin_id in zip(universe, ids):
+                coin = asset['name']
+                entry = self.coins.get(coin)
+                if entry is None:
+                    entry = self.coins[coin] = {'id': int(coin_id), 'first_seen': hour}
+                    added.append(coin)
+                entry['last_seen'] = hour
+                entry['delisted'] = bool(asset.get('isDelisted', False))
+                entry['meta'] = {key: value for key, value in asset.items() if key not in ('name', 'isDelisted')}
+                listed.add(coin)
+            # Coins that dropped out of the universe altogether are delisted as well
+            for coin, entry in self.coins.items():
+                if coin not in listed:
+                    entry['delisted'] = True
+            self.refreshed_at = now
+            self.added.update(added)
+            self.save()
+        return added
+
+    def merge(self, other):
+        """
+        Fold in the entries of another copy of the registry (e.g. one saved by
+        a shard run): first-seen hours take the earlier of the two, and the
+        listing state comes from whichever copy was refreshed last. Coins new
+        to this registry get their ids from its own dictionary.
+
+        Returns:
+            List of coins new to this registry
+        """
+        with self._lock:
+            newer = other.refreshed_at is not None and (self.refreshed_at is None
+                                                        or other.refreshed_at > self.refreshed_at)
+            added = [coin for coin in other.coins if coin not in self.coins]
+            for coin, coin_id in zip(added, self.dictionary.ids(added)):
+                self.coins[coin] = dict(other.coins[coin], id=int(coin_id))
+            for coin, theirs in other.coins.items():
+                entry = self.coins[coin]
+                entry['first_seen'] = min(entry['first_seen'], theirs['first_seen'])
+                if newer:
+                    entry.update(last_seen=theirs['last_seen'], delisted=theirs['delisted'], meta=theirs['meta'])
+            if newer:
+                self.refreshed_at = other.refreshed_at
+            self.added.update(added)
+        return added
+
+    def refresh(self, fetch_meta, ttl=REFRESH_TTL_SECONDS):
+        """
+        Refresh the universe with fetch_meta() unless it is fresher than the
+        TTL. A failed request keeps the last good copy.
+
+        Returns:
+            True if the registry holds a universe afterwards
+        """
+        if self.fresh(ttl):
+            return True
+        try:
+            self.update(fetch_meta().get('universe', []))
+        except Exception as e:
+            if not self.coins:
+                print(f"Error fetching coin list: {e}")
+                return False
+            print(f"Error fetching coin list: {e}; using the universe from "
+                  f"{time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(self.refreshed_at))}.")
+        return True
+
+    def active_coins(self):
+        """
+        Return the coins currently listed.
+        """
+        with self._lock:
+            return [coin for coin, entry in self.coins.items() if not entry['delisted']]
+
+    def info(self, coin):
+        """
+        Return a coin's entry (id, first_seen, last_seen, delisted, meta), or None.
+        """
+        return self.coins.get(coin)
+
+    def first_seen(self, coin):
+        entry = self.coins.get(coin)
+        return None if entry is None else entry['first_seen']
+
+    def backdate(self, coin, hour):
+        """
+        Move a coin's first-seen hour back to `hour` if it had data before the
+        registry saw it (e.g. history collected before the registry existed).
+        """
+        with self._lock:
+            entry = self.coins.get(coin)
+            if entry is not None and hour is not None and hour < entry['first_seen']:
+                entry['first_seen'] = int(hour)
+                return True
+            return False
+
+    def is_new(self, coin, hour, hours=NEW_COIN_HOURS):
+        """
+        Whether a coin was first seen within `hours` before the given epoch hour.
+        Coins the registry has never seen count as new.
+        """
+        first_seen = self.first_seen(coin)
+        return first_seen is None or first_seen >= hour - hours
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def coin_registry(data_dir=DATA_DIR):
+    """
+    Return the process-wide coin registry of a data directory.
+    """
+    path = os.path.abspath(os.path.join(data_dir, REGISTRY_NAME))
+    with _registries_lock:
+        if path not in _registries:
+            _registries[path] = CoinRegistry(path)
+        return _registries[path]
@@ -0,0 +1,309 @@
+import numpy as np
+import pandas as pd
+
+from schema import ROLLUP_SCHEMA
+from storage import (DAY_MS, OHLCV_DAILY_RETENTION_DAYS, OHLCV_WEEKLY_RETENTION_DAYS, ohlcv_daily_store,
+                     ohlcv_store, ohlcv_weekly_store)
+from timeseries import TimeSeriesStore
+
+DAY_HOURS = 24
+WEEK_MS = 7 * DAY_MS
+# Weeks start on Monday 00:00 UTC; 1970-01-01 was a Thursday
+WEEK_OFFSET_MS = 4 * DAY_MS
+
+# Columns of a rollup row besides its coin and time
+ROLLUP_COLUMNS = [col for col in ROLLUP_SCHEMA if col not in ('coin', 'time')]
+
+
+def period_start(times_ms, period_ms, offset_ms=0):
+    """
+    Return the start (ms) of the period containing each time, for periods of
+    period_ms starting at offset_ms from the epoch.
+    """
+    times = np.asarray(times_ms, dtype=np.int64)
+    return (times - offset_ms) // period_ms * period_ms + offset_ms
+
+
+def _runs(starts_ms, period_ms):
+    # Merge period starts into (start, end) ranges of consecutive periods
+    starts = np.unique(np.asarray(starts_ms, dtype=np.int64))
+    if not len(starts):
+        return []
+    breaks = np.flatnonzero(np.diff(starts) != period_ms) + 1
+    return [(int(run[0]), int(run[-1]) + period_ms) for run in np.split(starts, breaks)]
+
+
+def rollup(series, period_ms, offset_ms=0):
+    """
+    Downsample OHLCV rows sorted by (coin, time) to one row per coin per period.
+
+    A period's open is its first open and its close its last close, high and
+    low are the extremes, and volume, trade count and hours are summed.
+
+    Args:
+        series: TimeSeriesStore with the rollup columns ('hours' is 1 for an hourly candle)
+        period_ms: Period length in milliseconds
+        offset_ms: Start of period 0 relative to the epoch
+
+    Returns:
+        TimeSeriesStore of rows stamped with their period's start
+    """
+    if not len(series):
+        return TimeSeriesStore([], [], {col: np.zeros(0, dtype=ROLLUP_SCHEMA[col]) for col in ROLLUP_COLUMNS})
+    starts = period_start(series.times, period_ms, offset_ms)
+    first = np.flatnonzero(np.r_[True, (series.coins[1:] != series.coins[:-1]) | (starts[1:] != starts[:-1])])
+    last = np.r_[first[1:] - 1, len(series) - 1]
+    columns = series.columns
+    return TimeSeriesStore(series.coins[first], starts[first], {
+        'open_price': columns['open_price'][first],
+        'high_price': np.maximum.reduceat(columns['high_price'], first),
+        'low_price': np.minimum.reduceat(columns['low_price'], first),
+        'close_price': columns['close_price'][last],
+        'volume_usd': np.add.reduceat(np.nan_to_num(columns['volume_usd'].astype(np.float64)), first),
+        'trade_count': np.add.reduceat(columns['trade_count'].astype(np.int64), first),
+        'hours': np.add.reduceat(columns['hours'].astype(np.int64), first),
+    })
+
+
+class OhlcvRollups:
+    """
+    Daily and weekly rollups of an hourly OHLCV store.
+
+    A (coin, day) is rolled up again from the hourly store whenever the
+    store's completeness index has a different number of hours for it than
+    its daily row was built from: new candles, repaired holes and the current
+    day filling up. Weeks that had a day rolled up again are rebuilt from
+    their daily rows. Days before the index window are never recounted, so
+    the rollups keep their history after the hourly partitions are dropped.
+    Days older than the hourly candle history are backfilled from 1d candles,
+    whose USD volume is priced at the day's typical price rather than summed
+    hour by hour, so it is an approximation of the hourly-derived totals.
+
+    Window totals read each part of a window from the coarsest tier whose
+    periods tile it: a 30-day total ending mid-day is the hours of the two
+    partial days plus daily and weekly rows, instead of 720 hourly ones.
+    """
+
+    def __init__(self, hourly, daily, weekly):
+        self.hourly = hourly
+        self.daily = daily
+        self.weekly = weekly
+
+    def _index_days(self):
+        # [first, last) epoch days whose every hour is inside the index window
+        index = self.hourly.index
+        if index is None or index.end_hour is None:
+            return None
+        return -(-index.start_hour // DAY_HOURS), -(-index.end_hour // DAY_HOURS)
+
+    def _read(self, store, start_ms, end_ms, columns):
+        # Rows of a store as a TimeSeriesStore over dictionary ids
+        df = store.read(start_ms=start_ms, end_ms=end_ms, columns=['coin', 'time'] + columns)
+        return TimeSeriesStore.from_arrays(df['coin'].cat.codes.to_numpy(), df['time'].to_numpy(),
+                                           {col: df[col].to_numpy() for col in columns})
+
+    def _write(self, store, series):
+        df = pd.DataFrame({'coin': store.dictionary.categorical(series.coins), 'time': series.times})
+        for col in ROLLUP_COLUMNS:
+            df[col] = series.columns[col]
+        store.write(df)
+
+    def _daily_rows(self, start_ms, end_ms):
+        # Daily rollup of the hourly rows in [start_ms, end_ms)
+        series = self._read(self.hourly, start_ms, end_ms, [col for col in ROLLUP_COLUMNS if col != 'hours'])
+        # Several rows in one hour (exchange timestamp jitter): the latest one wins
+        series = series.take(series.last_per_hour())
+        series.columns['hours'] = np.ones(len(series), dtype=np.int64)
+        return rollup(series, DAY_MS)
+
+    def _weekly_rows(self, start_ms, end_ms):
+        return rollup(self._read(self.daily, start_ms, end_ms, ROLLUP_COLUMNS), WEEK_MS, WEEK_OFFSET_MS)
+
+    def stale_days(self):
+        """
+        Return the start (ms) of every day in the index window whose hours in
+        the completeness index differ from its daily rows.
+        """
+        days = self._index_days()
+        if days is None or days[0] >= days[1]:
+            return []
+        first_day, end_day = days
+        index = self.hourly.index
+        ids = self.hourly.dictionary.ids(index.coins)
+        present = np.zeros((len(self.hourly.dictionary.coins), end_day - first_day), dtype=np.int64)
+        for coin_id, coin in zip(ids, index.coins):
+            present[coin_id] = index.present(coin, first_day * DAY_HOURS, end_day * DAY_HOURS).reshape(
+                -1, DAY_HOURS).sum(axis=1)
+        rolled = np.zeros_like(present)
+        stored = self._read(self.daily, first_day * DAY_MS, end_day * DAY_MS, ['hours'])
+        rolled[stored.coins, stored.times // DAY_MS - first_day] = stored.columns['hours']
+        return [(first_day + int(day)) * DAY_MS for day in np.flatnonzero((present != rolled).any(axis=0))]
+
+    def update(self, start_ms=None):
+        """
+        Roll up the stale days, plus every day from start_ms on (e.g. after a
+        backfill older than the index window), and the weeks containing them.
+
+        Returns:
+            Tuple of (days rolled up, weeks rolled up)
+        """
+        day_starts = self.stale_days()
+        if start_ms is not None:
+            latest_ms = self.hourly.max_time()
+            if latest_ms is not None:
+                # Whole days only: a day cut by start_ms would replace a full row with a partial one
+                day_starts += list(range(-(-int(start_ms) // DAY_MS) * DAY_MS, latest_ms + 1, DAY_MS))
+        days = _runs(day_starts, DAY_MS)
+        for start, end in days:
+            self._write(self.daily, self._daily_rows(start, end))
+        return sum((end - start) // DAY_MS for start, end in days), self.update_weeks(day_starts)
+
+    def update_weeks(self, day_starts):
+        """
+        Roll up the weeks containing the given days again from the daily rows,
+        e.g. after daily rows were written from 1d candles.
+
+        Returns:
+            Number of weeks rolled up
+        """
+        weeks = _runs(period_start(day_starts, WEEK_MS, WEEK_OFFSET_MS), WEEK_MS)
+        for start, end in weeks:
+            self._write(self.weekly, self._weekly_rows(start, end))
+        return sum((end - start) // WEEK_MS for start, end in weeks)
+
+    def rebuild(self):
+        """
+        Roll up every day the hourly store holds again. Older rollups are kept.
+
+        Returns:
+            Tuple of (days rolled up, weeks rolled up)
+        """
+        return self.update(start_ms=0)
+
+    def verify(self):
+        """
+        Compare the rollups of the index window with a recomputation from the hourly store.
+
+        Returns:
+            Tuple of (number of differing daily rows, number of differing weekly rows)
+        """
+        days = self._index_days()
+        if days is None or days[0] >= days[1]:
+            return 0, 0
+        start_ms, end_ms = days[0] * DAY_MS, days[1] * DAY_MS
+        # Only weeks wholly inside the window can be recomputed
+        week_start = int(period_start(start_ms + WEEK_MS - 1, WEEK_MS, WEEK_OFFSET_MS))
+        expected = [self._daily_rows(start_ms, end_ms)]
+        expected.append(rollup(expected[0].take(expected[0].select(week_start, end_ms)), WEEK_MS, WEEK_OFFSET_MS))
+        differing = []
+        for store, rows, start in ((self.daily, expected[0], start_ms), (self.weekly, expected[1], week_start)):
+            stored = self._read(store, start, end_ms, ROLLUP_COLUMNS)
+            if not np.array_equal(stored.keys, rows.keys):
+                differing.append(len(np.setxor1d(stored.keys, rows.keys)))
+                continue
+            same = np.ones(len(rows), dtype=bool)
+            for col in ROLLUP_COLUMNS:
+                same &= np.isclose(stored.columns[col], rows.columns[col], rtol=1e-9, equal_nan=True)
+            differing.append(int((~same).sum()))
+        return tuple(differing)
+
+    def drop_expired(self, now_ms):
+        """
+        Drop rollup partitions older than the daily and weekly retention.
+
+        Returns:
+            Number of partitions dropped
+        """
+        return (len(self.daily.drop_before(now_ms - OHLCV_DAILY_RETENTION_DAYS * DAY_MS))
+                + len(self.weekly.drop_before(now_ms - OHLCV_WEEKLY_RETENTION_DAYS * DAY_MS)))
+
+    # ---------------- reads ----------------
+
+    def tiles(self, start_ms, end_ms):
+        """
+        Split [start_ms, end_ms) into pieces that each read the coarsest tier
+        tiling them: whole weeks from the weekly store, the whole days around
+        them from the daily store and the hours at either edge from the
+        hourly store.
+
+        Returns:
+            List of (store, start_ms, end_ms), in time order
+        """
+        day_start = -(-start_ms // DAY_MS) * DAY_MS
+        day_end = end_ms // DAY_MS * DAY_MS
+        if day_start >= day_end:
+            return [(self.hourly, start_ms, end_ms)]
+        week_start = int(period_start(day_start + WEEK_MS - 1, WEEK_MS, WEEK_OFFSET_MS))
+        week_end = int(period_start(day_end, WEEK_MS, WEEK_OFFSET_MS))
+        if week_start < week_end:
+            middle = [(self.daily, day_start, week_start), (self.weekly, week_start, week_end),
+                      (self.daily, week_end, day_end)]
+        else:
+            middle = [(self.daily, day_start, day_end)]
+        pieces = [(self.hourly, start_ms, day_start)] + middle + [(self.hourly, day_end, end_ms)]
+        return [piece for piece in pieces if piece[1] < piece[2]]
+
+    def _read_tier(self, store, start_ms, end_ms, column):
+        # Rows of one tier with their hour counts ('hours' is 1 for an hourly candle)
+        if store is not self.hourly:
+            return self._read(store, start_ms, end_ms, [column, 'hours'])
+        series = self._read(store, start_ms, end_ms, [column])
+        series = series.take(series.last_per_hour())
+        series.columns['hours'] = np.ones(len(series), dtype=np.int64)
+        return series
+
+    def window_totals(self, end_ms, lengths_ms, column='volume_usd'):
+        """
+        Per-coin totals of a column over windows [end_ms - length, end_ms), and
+        the number of hourly candles each total covers. Each window is split
+        into tiles (see tiles); overlapping tiles of one tier share a read, so
+        a 30-day total is mostly daily and weekly rows plus the hours of the
+        two partial days at its edges.
+
+        Args:
+            end_ms: Exclusive end of every window in milliseconds
+            lengths_ms: Window lengths in milliseconds
+            column: Summed column
+
+        Returns:
+            Tuple of (coin symbols, totals, hours), with one row per window and
+            one column per coin
+        """
+        lengths = np.asarray(lengths_ms, dtype=np.int64)
+        dictionary = self.hourly.dictionary
+        windows = [self.tiles(end_ms - length, end_ms) for length in lengths.tolist()]
+
+        # One read per run of overlapping or adjacent tiles of a tier
+        reads = []
+        for store in (self.hourly, self.daily, self.weekly):
+            ranges = sorted((start, end) for tiles in windows for tier, start, end in tiles if tier is store)
+            runs = []
+            for start, end in ranges:
+                if runs and start <= runs[-1][1]:
+                    runs[-1][1] = max(runs[-1][1], end)
+                else:
+                    runs.append([start, end])
+            reads.extend((store, start, end, self._read_tier(store, start, end, column)) for start, end in runs)
+
+        used = np.unique(np.concatenate([series.coins for *_, series in reads] + [np.zeros(0, np.int32)]))
+        totals = np.zeros((len(lengths), len(used)))
+        hours = np.zeros((len(lengths), len(used)), dtype=np.int64)
+        for store, read_start, read_end, series in reads:
+            cols = np.searchsorted(used, series.coins)
+            values = np.nan_to_num(series.columns[column].astype(np.float64))
+            for i, tiles in enumerate(windows):
+                for tier, start, end in tiles:
+                    if tier is not store or not read_start <= start < read_end:
+                        continue
+                    inside = (series.times >= start) & (series.times < end)
+                    totals[i] += np.bincount(cols[inside], weights=values[inside], minlength=len(used))
+                    hours[i] += np.bincount(cols[inside], weights=series.columns['hours'][inside],
+                                            minlength=len(used)).astype(np.int64)
+        return [dictionary.coins[i] for i in used], totals, hours
+
+
+def ohlcv_rollups(hourly=None):
+    """
+    Return the rollups of the OHLCV store (opened here if not given).
+    """
+    return OhlcvRollups(hourly or ohlcv_store(), ohlcv_daily_store(), ohlcv_weekly_store())
@@ -0,0 +1,254 @@
+import json
+import os
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+import clock
+from completeness import HOUR_MS
+from fetch_engine import DEFAULT_MAX_WORKERS, fetch_all
+from outputs import write_file
+from telemetry import current_run, span
+
+QUEUE_PATH = os.path.join('data', 'fetch_queue.json')
+QUEUE_VERSION = 1
+
+# Work priorities, most valuable first
+PRIORITY_LATEST = 0    # Ranges ending at the latest hour to collect
+PRIORITY_RECENT = 1    # Other holes in the recent window
+PRIORITY_BACKFILL = 2  # Holes further back in the completeness index window
+PRIORITY_NAMES = {PRIORITY_LATEST: 'latest', PRIORITY_RECENT: 'recent', PRIORITY_BACKFILL: 'backfill'}
+
+# Hours before the latest hour that count as recent
+RECENT_HOURS = 24
+
+# Ranges fetched between two journal appends and deadline checks
+BATCH_SIZE = 50
+
+# A range that comes back without filling its hole (the exchange has no data
+# there) is not requested again for this long, doubling on every attempt
+EMPTY_RETRY_HOURS = 1
+EMPTY_RETRY_MAX_HOURS = 7 * 24
+
+WorkItem = namedtuple('WorkItem', ['dataset', 'coin', 'start_ms', 'end_ms', 'priority'])
+
+
+class Dataset:
+    """
+    A dataset the scheduler collects into.
+
+    Args:
+        name: Dataset name ('funding' or 'volume')
+        store: PartitionedStore with a completeness index
+        fetch_fn: Range fetcher taking (coin, start_ms, end_ms)
+        page_hours: Hours one response page covers; nearby holes are merged up to this span
+        end_ms: Exclusive end of the hours to collect
+    """
+
+    def __init__(self, name, store, fetch_fn, page_hours, end_ms):
+        self.name = name
+        self.store = store
+        self.fetch_fn = fetch_fn
+        self.page_hours = page_hours
+        self.end_ms = end_ms
+
+
+class DeadlineReached(Exception):
+    """
+    Raised instead of starting a fetch once the run's deadline has passed.
+    """
+
+
+class FetchQueue:
+    """
+    Scheduler state carried from one run to the next.
+
+    Work left over when a run hits its deadline is kept with the time it was
+    first queued, so it goes ahead of newer work of the same priority next
+    time instead of being starved by it. Ranges that were fetched but left
+    their hole unfilled are backed off, so missing exchange data does not use
+    up the budget on every run.
+    """
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        self.deferred = {}  # (dataset, coin, start_ms, end_ms) -> queued at (ms)
+        self.backoff = {}   # (dataset, coin, start_ms, end_ms) -> (attempts, not before (ms))
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get('version') == QUEUE_VERSION:
+                self.deferred = {tuple(item[:4]): item[4] for item in state['deferred']}
+                self.backoff = {tuple(item[:4]): (item[4], item[5]) for item in state['backoff']}
+
+    def save(self):
+        write_file(self.path, json.dumps({
+            'version': QUEUE_VERSION,
+            'deferred': [list(key) + [queued_at] for key, queued_at in sorted(self.deferred.items())],
+            'backoff': [list(key) + list(value) for key, value in sorted(self.backoff.items())],
+        }))
+
+    def backing_off(self, item, now_ms):
+        entry = self.backoff.get(item[:4])
+        return entry is not None and entry[1] > now_ms
+
+    def note_unfilled(self, item, now_ms):
+        attempts = self.backoff.get(item[:4], (0, 0))[0] + 1
+        delay_hours = min(EMPTY_RETRY_HOURS * 2 ** (attempts - 1), EMPTY_RETRY_MAX_HOURS)
+        self.backoff[item[:4]] = (attempts, now_ms + delay_hours * HOUR_MS)
+
+    def prune(self, oldest_ms):
+        """
+        Forget ranges that ended before oldest_ms (outside every window now).
+        """
+        self.deferred = {key: value for key, value in self.deferred.items() if key[3] > oldest_ms}
+        self.backoff = {key: value for key, value in self.backoff.items() if key[3] > oldest_ms}
+
+
+class FetchScheduler:
+    """
+    Fills the holes of several datasets under one rate budget, most valuable
+    data first.
+
+    Every dataset's completeness index is turned into range requests ranked
+    by priority: ranges reaching the latest hour, then recent holes, then
+    older holes (deep backfill). All of them share the client's rate limiter
+    and run in batches on one thread pool; the fetched rows are appended to
+    the stores after every batch. Once the optional deadline passes, no new
+    request is started and the remaining work is deferred to the next run
+    through the FetchQueue.
+
+    Args:
+        datasets: List of Dataset
+        deadline: time.monotonic() value after which no request is started (None for no deadline)
+        queue: FetchQueue carrying deferred work and backoff between runs
+        max_workers: Maximum number of concurrent requests
+        batch_size: Ranges per batch
+    """
+
+    def __init__(self, datasets, deadline=None, queue=None, max_workers=DEFAULT_MAX_WORKERS, batch_size=BATCH_SIZE):
+        self.datasets = {dataset.name: dataset for dataset in datasets}
+        self.deadline = deadline
+        self.queue = queue if queue is not None else FetchQueue()
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+
+    def deadline_passed(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def plan(self, coins, recent_hours=RECENT_HOURS, backfill=True):
+        """
+        Turn every dataset's missing hours into prioritized work items.
+
+        Args:
+            coins: List of coin symbols
+            recent_hours: Hours before each dataset's end that are repaired as recent holes
+            backfill: Also plan the older holes in the completeness index window
+
+        Returns:
+            List of WorkItem in the order they should run
+        """
+        items = []
+        for dataset in self.datasets.values():
+            index = dataset.store.index
+            end_ms = dataset.end_ms
+            recent_start_ms = end_ms - recent_hours * HOUR_MS
+            for coin, start_ms, range_end in index.plan_repairs(coins, recent_start_ms, end_ms,
+                                                                max_span_hours=dataset.page_hours):
+                priority = PRIORITY_LATEST if range_end == end_ms else PRIORITY_RECENT
+                items.append(WorkItem(dataset.name, coin, start_ms, range_end, priority))
+            if backfill and index.start_hour is not None:
+                for coin, start_ms, range_end in index.plan_repairs(coins, index.start_hour * HOUR_MS, recent_start_ms,
+                                                                    max_span_hours=dataset.page_hours):
+                    items.append(WorkItem(dataset.name, coin, start_ms, range_end, PRIORITY_BACKFILL))
+
+        # Within a priority: work deferred longest first, then the newest hours
+        now_ms = int(clock.now() * 1000)
+        items.sort(key=lambda item: (item.priority, self.queue.deferred.get(item[:4], now_ms), -item.end_ms))
+        return items
+
+    def _fetch(self, item):
+        if self.deadline_passed():
+            raise DeadlineReached()
+        return self.datasets[item.dataset].fetch_fn(item.coin, item.start_ms, item.end_ms)
+
+    def run(self, items):
+        """
+        Fetch the work items in order and append the rows to the stores.
+
+        Returns:
+            Dict with the number of items fetched per priority name, and the
+            numbers failed, deferred and skipped (backing off), and rows per dataset
+        """
+        run = current_run()
+        now_ms = int(clock.now() * 1000)
+        summary = {'fetched': {name: 0 for name in PRIORITY_NAMES.values()},
+                   'failed': 0, 'deferred': 0, 'skipped': 0, 'rows': {name: 0 for name in self.datasets}}
+
+        ready = []
+        for item in items:
+            if item.priority != PRIORITY_LATEST and self.queue.backing_off(item, now_ms):
+                summary['skipped'] += 1
+            else:
+                ready.append(item)
+
+        deferred = []
+        for batch_start in range(0, len(ready), self.batch_size):
+            if self.deadline_passed():
+                deferred.extend(ready[batch_start:])
+                break
+            batch = ready[batch_start:batch_start + self.batch_size]
+            rows = {name: [] for name in self.datasets}
+            fetched = []
+            for result in fetch_all(batch, self._fetch, max_workers=self.max_workers):
+                item = result.key
+                if isinstance(result.error, DeadlineReached):
+                    deferred.append(item)
+                    continue
+                if not result.ok:
+                    summary['failed'] += 1
+                    deferred.append(item)
+                    run.coin_outcome(item.dataset, item.coin, 'failed', error=result.error)
+                    print(f"Failed to fetch {item.dataset} data for {item.coin} "
+                          f"({(item.end_ms - item.start_ms) // HOUR_MS}h range): {result.error}")
+                    continue
+                index = self.datasets[item.dataset].store.index
+                index.note_range_fetched(item.coin, item.start_ms, item.end_ms, [entry['time'] for entry in result.value])
+                rows[item.dataset].extend(result.value)
+                fetched.append(item)
+                summary['fetched'][PRIORITY_NAMES[item.priority]] += 1
+                run.coin_outcome(item.dataset, item.coin, 'ok' if result.value else 'empty', rows=len(result.value))
+
+            # Store the rows before the next batch, so a cut-off run keeps what it fetched
+            for name, dataset in self.datasets.items():
+                if rows[name]:
+                    df = pd.DataFrame(rows[name]).drop_duplicates(subset=['coin', 'time'], keep='last')
+                    with span('append'):
+                        dataset.store.append(df)
+                    summary['rows'][name] += len(df)
+                    run.count(f"{name}_rows_appended", len(df))
+                else:
+                    dataset.store.index.save()
+
+            for item in fetched:
+                self.queue.deferred.pop(item[:4], None)
+                index = self.datasets[item.dataset].store.index
+                if index.missing_ranges(item.coin, item.start_ms, item.end_ms):
+                    self.queue.note_unfilled(item, now_ms)
+                else:
+                    self.queue.backoff.pop(item[:4], None)
+
+        for item in deferred:
+            self.queue.deferred.setdefault(item[:4], now_ms)
+        summary['deferred'] = len(deferred)
+        oldest_ms = min(dataset.store.index.start_hour * HOUR_MS if dataset.store.index.start_hour is not None
+                        else dataset.end_ms for dataset in self.datasets.values())
+        self.queue.prune(oldest_ms)
+        self.queue.save()
+
+        for name, count in summary['fetched'].items():
+            run.count(f"{name}_ranges_fetched", count)
+        run.count('ranges_deferred', summary['deferred'])
+        run.count('ranges_skipped', summary['skipped'])
+        return summary
@@ -0,0 +1,214 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from completeness import HOUR_MS
+from outputs import write_json
+
+# Column name -> in-memory dtype. Coins are categorical over the shared coin
+# dictionary, so filters and group-bys compare integer codes instead of
+# strings. Rates, prices and volumes are float32: exchange values carry at
+# most 5-7 significant digits, and sums over them are taken in float64.
+FUNDING_SCHEMA = {
+    'coin': 'category',
+    'fundingRate': 'float32',
+    'premium': 'float32',
+    'time': 'int64',
+}
+
+OHLCV_SCHEMA = {
+    'coin': 'category',
+    'open_price': 'float32',
+    'high_price': 'float32',
+    'low_price': 'float32',
+    'close_price': 'float32',
+    'volume_usd': 'float32',
+    'trade_count': 'int32',
+    'time': 'int64',
+}
+
+# Daily and weekly OHLCV rollups: one row per coin per period, stamped with the
+# period's start like a candle. Volumes and trade counts are sums over many
+# candles and keep full precision; 'hours' counts the hourly candles rolled in.
+ROLLUP_SCHEMA = {
+    'coin': 'category',
+    'open_price': 'float32',
+    'high_price': 'float32',
+    'low_price': 'float32',
+    'close_price': 'float32',
+    'volume_usd': 'float64',
+    'trade_count': 'int64',
+    'hours': 'int16',
+    'time': 'int64',
+}
+
+# Derived column available on every read: the row's epoch hour (time // 1h)
+HOUR_COLUMN = 'hour'
+
+COIN_DICTIONARY_NAME = 'coins.json'
+COIN_DICTIONARY_VERSION = 1
+
+
+def hour_key(times_ms):
+    """
+    Return int64 epoch hours for millisecond timestamps.
+    """
+    return np.asarray(times_ms, dtype=np.int64) // HOUR_MS
+
+
+def widen(values, digits=7):
+    """
+    Convert float32 values to float64, rounded to the significant digits
+    float32 holds, so a value stored from '0.0000125' reads back as 1.25e-05
+    rather than 1.2500000424e-05. Other dtypes are only cast.
+    """
+    values = np.asarray(values)
+    if values.dtype != np.float32:
+        return values.astype(np.float64)
+    values = values.astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exponent = digits - 1 - np.floor(np.log10(np.abs(values)))
+    exponent = np.nan_to_num(exponent, nan=0.0, posinf=0.0, neginf=0.0)
+    # Multiply or divide by an exact power of ten so the result is the double nearest the decimal
+    scale = 10.0 ** np.abs(exponent)
+    return np.where(exponent >= 0, np.round(values * scale) / scale, np.round(values / scale) * scale)
+
+
+class CoinDictionary:
+    """
+    Stable mapping between coin symbols and integer ids.
+
+    Ids are assigned in order of first appearance and never change or get
+    reused, so they can key arrays across runs. The mapping is shared by all
+    stores under one data directory and persisted as JSON next to them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.coins = []
+        self._ids = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == COIN_DICTIONARY_VERSION:
+                self.coins = list(data['coins'])
+                self._ids = {coin: i for i, coin in enumerate(self.coins)}
+
+    def __len__(self):
+        return len(self.coins)
+
+    def save(self):
+        with self._lock:
+            write_json(self.path, {'version': COIN_DICTIONARY_VERSION, 'coins': self.coins})
+
+    def ids(self, coins):
+        """
+        Return the ids of the given symbols, assigning new ids (and saving
+        the dictionary) for symbols not seen before.
+        """
+        added = False
+        with self._lock:
+            for coin in coins:
+                if coin not in self._ids:
+                    self._ids[coin] = len(self.coins)
+                    self.coins.append(coin)
+                    added = True
+            ids = np.array([self._ids[coin] for coin in coins], dtype=np.int32)
+        if added:
+            self.save()
+        return ids
+
+    def lookup(self, coins):
+        """
+        Return the ids of the given symbols that are in the dictionary, without adding any.
+        """
+        with self._lock:
+            return np.array([self._ids[coin] for coin in coins if coin in self._ids], dtype=np.int32)
+
+    def categorical(self, codes):
+        """
+        Build a categorical coin column from dictionary ids.
+        """
+        return pd.Categorical.from_codes(codes, categories=pd.Index(self.coins, dtype=object))
+
+    def encode(self, values):
+        """
+        Encode a sequence of symbols as a categorical over the dictionary.
+        """
+        symbols, codes = coin_codes(values)
+        return self.categorical(self.ids(symbols)[codes] if len(symbols) else np.zeros(0, dtype=np.int32))
+
+
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+
+def coin_dictionary(data_dir):
+    """
+    Return the process-wide coin dictionary of a data directory.
+    """
+    path = os.path.abspath(os.path.join(data_dir, COIN_DICTIONARY_NAME))
+    with _dictionaries_lock:
+        if path not in _dictionaries:
+            _dictionaries[path] = CoinDictionary(path)
+        return _dictionaries[path]
+
+
+def coin_codes(values):
+    """
+    Factorize a coin column into the distinct symbols present and each row's
+    index into them. Categorical columns are factorized on their integer
+    codes; anything else goes through the strings once.
+
+    Returns:
+        Tuple of (list of symbols, int array of codes)
+    """
+    if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.array
+    if isinstance(values, pd.Categorical):
+        used, codes = np.unique(values.codes, return_inverse=True)
+        return [str(coin) for coin in values.categories[used]], codes
+    symbols, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return symbols.tolist(), codes
+
+
+def coerce(df, schema, dictionary):
+    """
+    Return a frame with exactly the schema's columns in their in-memory dtypes.
+    Numeric strings are parsed; unparseable values become NaN.
+    """
+    columns = {}
+    for col, dtype in schema.items():
+        values = df[col] if col in df.columns else pd.Series([np.nan] * len(df), index=df.index)
+        if dtype == 'category':
+            columns[col] = dictionary.encode(values)
+        elif np.dtype(dtype).kind == 'f':
+            columns[col] = pd.to_numeric(values, errors='coerce').to_numpy(dtype=dtype)
+        else:
+            columns[col] = pd.to_numeric(values, errors='coerce').fillna(0).to_numpy(dtype=dtype)
+    return pd.DataFrame(columns)
+
+
+def read_csv(path, schema, dictionary):
+    """
+    Load a CSV export into the schema: only the schema's columns are parsed,
+    numbers go straight to their dtype and coins are dictionary-encoded.
+    Rows without a time are dropped.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [col for col in schema if col in header]
+    # Integer columns are read as float so missing values do not fail the parse
+    dtypes = {col: 'category' if dtype == 'category' else 'float64' if np.dtype(dtype).kind == 'i' else dtype
+              for col, dtype in schema.items() if col in usecols}
+    try:
+        df = pd.read_csv(path, usecols=usecols, dtype=dtypes)
+    except ValueError:
+        # Malformed numbers somewhere; parse as text and let coerce() clean up
+        df = pd.read_csv(path, usecols=usecols, dtype={col: dtypes[col] for col in usecols if col == 'coin'})
+    if 'time' in df.columns:
+        df = df[pd.to_numeric(df['time'], errors='coerce').notna()]
+    return coerce(df, schema, dictionary)
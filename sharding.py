@@ -0,0 +1,282 @@
+import json
+import os
+import re
+import shutil
+import zlib
+
+import pandas as pd
+
+import clock
+from completeness import HOUR_MS, CompletenessIndex
+from outputs import write_file
+from registry import REGISTRY_NAME, CoinRegistry, coin_registry
+from scheduler import QUEUE_PATH, FetchQueue
+from schema import COIN_DICTIONARY_NAME, CoinDictionary
+from storage import DATA_DIR, PartitionedStore
+
+SHARDS_DIR = os.path.join(DATA_DIR, 'shards')
+MANIFEST_NAME = 'shard.json'
+QUEUE_NAME = 'fetch_queue.json'
+
+_SHARD_DIR_PATTERN = re.compile(r'(\d+)-of-(\d+)')
+
+
+def parse_shard(value):
+    """
+    Parse a shard given as 'i/N': shard i (0 <= i < N) of N.
+
+    Returns:
+        Tuple of (index, count)
+
+    Raises:
+        ValueError: if the value is not of that form
+    """
+    match = re.fullmatch(r'(\d+)/(\d+)', value.strip())
+    if not match:
+        raise ValueError(f"Shard must look like i/N, got {value!r}")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index must be in 0..{count - 1}, got {index}")
+    return index, count
+
+
+def shard_of(coin, count):
+    """
+    Return the shard (0..count-1) a coin belongs to. The hash of the symbol
+    is the same in every process and on every machine, and a coin keeps its
+    shard however the rest of the coin list changes.
+    """
+    return zlib.crc32(coin.encode('utf-8')) % count
+
+
+def shard_coins(coins, shard):
+    """
+    Return the coins of a shard, in their original order.
+    """
+    index, count = shard
+    return [coin for coin in coins if shard_of(coin, count) == index]
+
+
+def shard_dir(shard, root=SHARDS_DIR):
+    index, count = shard
+    return os.path.join(root, f"{index}-of-{count}")
+
+
+def shard_store(store, shard, root=SHARDS_DIR):
+    """
+    Return the store a shard run collects into.
+
+    It reads the partitions of `store` and plans from a copy of its
+    completeness index, but appends its journal segments and saves the index
+    in the shard's directory, so parallel shards never write the same files
+    and the main store is only changed by the merge.
+    """
+    out = os.path.join(shard_dir(shard, root), os.path.basename(os.path.normpath(store.root)))
+    os.makedirs(out, exist_ok=True)
+    index = None
+    if store.index is not None:
+        index_path = os.path.join(out, os.path.basename(store.index.path))
+        if os.path.exists(store.index.path):
+            shutil.copyfile(store.index.path, index_path)
+        index = CompletenessIndex(index_path, store.index.retention_hours)
+    return PartitionedStore(store.root, store.schema, key=store.key, time_column=store.time_column, index=index,
+                            dictionary=store.dictionary, partition_days=store.partition_days,
+                            journal_dir=os.path.join(out, 'journal'))
+
+
+def shard_registry(shard, registry=None, root=SHARDS_DIR):
+    """
+    Point the coin registry and its dictionary at copies in the shard's
+    directory for a shard run.
+
+    Both stay loaded from the main data directory, but every save (a refreshed
+    universe, ids for new coins) goes to the shard's copies, so parallel
+    shards never write the shared files. The merge folds the copies back in.
+
+    Returns:
+        The registry (the process-wide one if not given)
+    """
+    registry = registry or coin_registry()
+    out = shard_dir(shard, root)
+    os.makedirs(out, exist_ok=True)
+    registry.path = os.path.join(out, REGISTRY_NAME)
+    registry.dictionary.path = os.path.join(out, COIN_DICTIONARY_NAME)
+    return registry
+
+
+def shard_queue(shard, path=QUEUE_PATH, root=SHARDS_DIR):
+    """
+    Return the FetchQueue of a shard run: a copy of the main queue that is
+    saved in the shard's directory. The merge takes the entries of the
+    shard's coins back into the main queue.
+    """
+    shard_path = os.path.join(shard_dir(shard, root), QUEUE_NAME)
+    os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+    if os.path.exists(path):
+        shutil.copyfile(path, shard_path)
+    return FetchQueue(shard_path)
+
+
+def write_manifest(shard, coins, end_ms, rows, root=SHARDS_DIR):
+    """
+    Record that a shard run finished: its coins, the exclusive end (ms) it
+    collected each dataset up to, and the rows it appended.
+    """
+    index, count = shard
+    write_file(os.path.join(shard_dir(shard, root), MANIFEST_NAME), json.dumps({
+        'shard': index,
+        'shards': count,
+        'coins': sorted(coins),
+        'end_ms': end_ms,
+        'rows': rows,
+        'finished_at': int(clock.now() * 1000),
+    }, indent=1))
+
+
+def find_shards(root=SHARDS_DIR):
+    """
+    Return the shard output directories under root.
+
+    Returns:
+        Dict of (index, count) -> manifest dict, or None for a shard that
+        has output but did not finish
+    """
+    if not os.path.isdir(root):
+        return {}
+    shards = {}
+    for name in sorted(os.listdir(root)):
+        match = _SHARD_DIR_PATTERN.fullmatch(name)
+        if not match or not os.path.isdir(os.path.join(root, name)):
+            continue
+        shard = (int(match.group(1)), int(match.group(2)))
+        manifest_path = os.path.join(root, name, MANIFEST_NAME)
+        manifest = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        shards[shard] = manifest
+    return shards
+
+
+def _merge_listed_from(store, shards, order, root):
+    # Listing hours the shards learned from their range requests, for their own coins
+    listed = {}
+    for shard in order:
+        manifest = shards[shard]
+        out = os.path.join(shard_dir(shard, root), os.path.basename(os.path.normpath(store.root)))
+        index_path = os.path.join(out, os.path.basename(store.index.path))
+        if manifest is None or not os.path.exists(index_path):
+            continue
+        owned = set(manifest['coins'])
+        shard_index = CompletenessIndex(index_path, store.index.retention_hours)
+        listed.update((coin, hour) for coin, hour in shard_index.listed_from.items() if coin in owned)
+    store.index.update_listed_from(listed)
+    store.index.save()
+
+
+def _merge_registries(registry, order, root):
+    # New coins get their ids in shard order before any rows reach the stores
+    for shard in order:
+        dictionary_path = os.path.join(shard_dir(shard, root), COIN_DICTIONARY_NAME)
+        if os.path.exists(dictionary_path):
+            registry.dictionary.ids(CoinDictionary(dictionary_path).coins)
+    for shard in order:
+        registry_path = os.path.join(shard_dir(shard, root), REGISTRY_NAME)
+        if os.path.exists(registry_path):
+            registry.merge(CoinRegistry(registry_path, dictionary=registry.dictionary))
+    registry.save()
+
+
+def merge_shards(stores, shards, registry=None, root=SHARDS_DIR, queue_path=QUEUE_PATH):
+    """
+    Union the outputs of the shard runs into the main registry, stores and
+    queue, then remove them.
+
+    The shards' copies of the coin dictionary and registry are folded in
+    first (see CoinRegistry.merge). Each dataset's shard segments are read as one journal (later segments
+    win), concatenated in the order the shards finished and appended to the
+    main store as one segment, which dedupes on (coin, time) and marks the
+    main completeness index. Every finished shard's listing hours and queue
+    entries for its own coins replace those in the main index and queue.
+
+    Args:
+        stores: Dict of dataset -> main store
+        shards: Shards to merge, as returned by find_shards
+        registry: The main coin registry (the process-wide one if not given)
+        root: Directory holding the shard outputs
+        queue_path: Path of the main FetchQueue
+
+    Returns:
+        Dict of dataset -> number of rows merged
+    """
+    order = sorted(shards, key=lambda shard: ((shards[shard] or {}).get('finished_at', 0), shard))
+    _merge_registries(registry or coin_registry(), order, root)
+    rows = {}
+    for dataset, store in stores.items():
+        frames = []
+        for shard in order:
+            out = os.path.join(shard_dir(shard, root), os.path.basename(os.path.normpath(store.root)))
+            if os.path.isdir(out):
+                frames.append(PartitionedStore(out, store.schema, key=store.key, time_column=store.time_column,
+                                               dictionary=store.dictionary).read())
+        frames = [df for df in frames if not df.empty]
+        rows[dataset] = sum(len(df) for df in frames)
+        if frames:
+            store.append(pd.concat(frames, ignore_index=True))
+        if store.index is not None:
+            _merge_listed_from(store, shards, order, root)
+
+    queue = FetchQueue(queue_path)
+    for shard in order:
+        manifest = shards[shard]
+        queue_file = os.path.join(shard_dir(shard, root), QUEUE_NAME)
+        if manifest is None or not os.path.exists(queue_file):
+            continue
+        owned = set(manifest['coins'])
+        shard_state = FetchQueue(queue_file)
+        for table, shard_table in ((queue.deferred, shard_state.deferred), (queue.backoff, shard_state.backoff)):
+            for key in [key for key in table if key[1] in owned]:
+                del table[key]
+            table.update((key, value) for key, value in shard_table.items() if key[1] in owned)
+    queue.save()
+
+    for shard in order:
+        shutil.rmtree(shard_dir(shard, root))
+    return rows
+
+
+def check_merge(stores, shards, coins):
+    """
+    Check that the merged shards covered every coin and collected the latest hour.
+
+    Args:
+        stores: Dict of dataset -> main store, after the merge
+        shards: The merged shards, as returned by find_shards
+        coins: Coins that should have been collected (the active universe)
+
+    Returns:
+        Dict with 'absent' (shards of each shard count that left no output),
+        'unfinished' (shards that left output but did not finish), 'uncovered'
+        (coins in no finished shard) and 'missing_latest' (dataset -> shard ->
+        its coins with no row for the last hour it collected)
+    """
+    counts = {count for _, count in shards}
+    absent = sorted((index, count) for count in counts for index in range(count) if (index, count) not in shards)
+    finished = {shard: manifest for shard, manifest in shards.items() if manifest is not None}
+    covered = set().union(*(manifest['coins'] for manifest in finished.values()))
+    missing_latest = {}
+    for dataset, store in stores.items():
+        if store.index is None:
+            continue
+        missing_latest[dataset] = {}
+        for shard, manifest in sorted(finished.items()):
+            if dataset in manifest['end_ms']:
+                missing = store.index.coins_missing(manifest['coins'], manifest['end_ms'][dataset] - HOUR_MS)
+                if missing:
+                    missing_latest[dataset][shard] = missing
+    return {
+        'absent': absent,
+        'unfinished': sorted(shard for shard, manifest in shards.items() if manifest is None),
+        'uncovered': [coin for coin in coins if coin not in covered],
+        'missing_latest': missing_latest,
+    }
@@ -0,0 +1,419 @@
+import itertools
+import os
+import threading
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+import pandas as pd
+
+import clock
+from completeness import CompletenessIndex
+from outputs import npz_bytes, write_file
+from schema import FUNDING_SCHEMA, HOUR_COLUMN, OHLCV_SCHEMA, ROLLUP_SCHEMA, coerce, coin_dictionary, hour_key, read_csv
+from timeseries import TimeSeriesStore
+
+DATA_DIR = 'data'
+FUNDING_DIR = os.path.join(DATA_DIR, 'funding')
+OHLCV_DIR = os.path.join(DATA_DIR, 'ohlcv')
+OHLCV_DAILY_DIR = os.path.join(DATA_DIR, 'ohlcv_daily')
+OHLCV_WEEKLY_DIR = os.path.join(DATA_DIR, 'ohlcv_weekly')
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Days of history kept for each dataset
+FUNDING_RETENTION_DAYS = 90
+OHLCV_RETENTION_DAYS = 31
+OHLCV_DAILY_RETENTION_DAYS = 400
+OHLCV_WEEKLY_RETENTION_DAYS = 3 * 365
+
+# Days covered by one partition of the rollup stores, which hold one row per
+# coin per day or week; partitions start at multiples of this from the epoch
+OHLCV_DAILY_PARTITION_DAYS = 28
+OHLCV_WEEKLY_PARTITION_DAYS = 364
+
+# Journal segments are merged into the day partitions once there are this
+# many of them, or once the oldest one reaches this age.
+COMPACT_MAX_SEGMENTS = 24
+COMPACT_MAX_AGE = timedelta(hours=24)
+
+
+def candle_to_ohlcv_row(coin, candle):
+    """
+    Convert a Hyperliquid candle (REST or WebSocket) to an OHLCV row.
+    """
+    return {
+        'coin': coin,
+        'open_price': float(candle['o']),
+        'high_price': float(candle['h']),
+        'low_price': float(candle['l']),
+        'close_price': float(candle['c']),
+        'volume_usd': float(candle['v']) * float(candle['c']),  # Volume in USD (volume × close price)
+        'trade_count': candle['n'],
+        'time': candle['t']  # Start time of the candle
+    }
+
+
+def _day_of(time_ms):
+    return datetime.fromtimestamp(time_ms / 1000, tz=timezone.utc).date()
+
+
+def _day_start_ms(day):
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+class PartitionedStore:
+    """
+    Columnar store with one .npz partition per UTC day (or per block of
+    `partition_days` days, for stores with few rows per day).
+
+    Each partition holds one typed array per schema column, sorted by
+    (coin, time). Reads prune whole partitions by time range before loading,
+    and only the requested columns are decompressed; the loaded rows are
+    merged into a TimeSeriesStore and the coins and time range asked for are
+    located by binary search. Writes upsert on (coin, time) with a sorted
+    merge and only rewrite the partitions that received rows. Retention
+    drops whole partitions.
+
+    Incremental ingestion goes through `append`, which writes the new rows to
+    a small journal segment instead of touching the partitions. Reads see the
+    journal merged over the partitions (later segments win), and `compact`
+    folds the segments into the partitions.
+
+    Coins are stored as integer codes with a per-file vocabulary and read
+    back as a categorical over the shared CoinDictionary, so no per-row
+    strings are created on load; numeric columns come back in the schema's
+    dtypes (see schema.py). Reads can also return the derived int64 'hour'
+    column.
+
+    If a CompletenessIndex is attached, every write marks the written
+    (coin, hour) pairs in it.
+
+    The journal lives in `root`/journal unless `journal_dir` puts it
+    elsewhere (e.g. the output directory of a collection shard).
+    """
+
+    def __init__(self, root, schema, key=('coin', 'time'), time_column='time', index=None, dictionary=None,
+                 partition_days=1, journal_dir=None):
+        self.root = root
+        self.partition_days = int(partition_days)
+        self.partition_ms = self.partition_days * DAY_MS
+        self.index = index
+        self.dictionary = dictionary or coin_dictionary(os.path.dirname(os.path.normpath(root)) or '.')
+        self.journal_dir = journal_dir or os.path.join(root, 'journal')
+        self.schema = schema
+        self.key = list(key)
+        self.time_column = time_column
+        self._lock = threading.RLock()
+        self._segment_seq = itertools.count()
+
+    def _path(self, day):
+        return os.path.join(self.root, f"{day.isoformat()}.npz")
+
+    def partitions(self):
+        """
+        Return the sorted list of partition days present on disk.
+        """
+        if not os.path.isdir(self.root):
+            return []
+        days = []
+        for name in os.listdir(self.root):
+            if name.endswith('.npz'):
+                try:
+                    days.append(datetime.strptime(name[:-4], '%Y-%m-%d').date())
+                except ValueError:
+                    continue
+        return sorted(days)
+
+    def segments(self):
+        """
+        Return journal segments as (path, created_ms, min_time, max_time), oldest first.
+        """
+        if not os.path.isdir(self.journal_dir):
+            return []
+        segments = []
+        for name in sorted(os.listdir(self.journal_dir)):
+            if not name.endswith('.npz'):
+                continue
+            try:
+                created_ms, _, min_time, max_time = (int(part) for part in name[:-4].split('-'))
+            except ValueError:
+                continue
+            segments.append((os.path.join(self.journal_dir, name), created_ms, min_time, max_time))
+        return segments
+
+    def is_empty(self):
+        return not self.partitions() and not self.segments()
+
+    def _empty_frame(self, columns):
+        return self._frame({col: np.array([], dtype=np.int64 if col == HOUR_COLUMN else
+                                          np.int32 if col == 'coin' else self.schema[col]) for col in columns})
+
+    def _load_arrays(self, path, columns):
+        # Columns of one file; coins as dictionary ids
+        arrays = {}
+        with np.load(path, allow_pickle=False) as npz:
+            for col in columns:
+                values = npz[col]
+                if col == 'coin':
+                    if values.dtype.kind == 'U':
+                        # Files written before coins were dictionary-encoded
+                        vocab, values = np.unique(values, return_inverse=True)
+                    else:
+                        vocab = npz['coin_vocab']
+                    values = self.dictionary.ids(vocab.tolist())[values] if len(vocab) else values.astype(np.int32)
+                else:
+                    values = values.astype(self.schema[col], copy=False)
+                arrays[col] = values
+        return arrays
+
+    def _series(self, arrays):
+        # Rows of a dict of arrays (coins as dictionary ids) sorted by key; the last duplicate wins
+        return TimeSeriesStore.from_arrays(arrays['coin'], arrays[self.time_column], {
+            col: values for col, values in arrays.items() if col not in ('coin', self.time_column)})
+
+    def _arrays(self, series, rows=slice(None)):
+        # Inverse of _series, for the selected rows
+        arrays = series.view(rows)
+        arrays[self.time_column] = arrays.pop('time')
+        return arrays
+
+    def _frame(self, arrays):
+        # Public frame: coin ids become a categorical over the dictionary
+        df = pd.DataFrame(arrays)
+        if 'coin' in df.columns:
+            df['coin'] = self.dictionary.categorical(df['coin'].to_numpy())
+        return df
+
+    def _save_file(self, path, rows):
+        # rows: column -> array, coins as dictionary ids, sorted by key
+        arrays = {col: np.asarray(rows[col], dtype=dtype) for col, dtype in self.schema.items() if col != 'coin'}
+        # Coins as codes into a vocabulary of the file's own coins, so the file
+        # reads back correctly even without the dictionary
+        used, codes = np.unique(rows['coin'], return_inverse=True)
+        arrays['coin'] = codes.astype(np.int32)
+        arrays['coin_vocab'] = np.array([self.dictionary.coins[i] for i in used], dtype='U')
+        write_file(path, npz_bytes(arrays))
+
+    def _save(self, day, rows):
+        self._save_file(self._path(day), rows)
+
+    def _normalize(self, df):
+        # Schema columns and dtypes as arrays, with coins as dictionary ids
+        df = coerce(df, self.schema, self.dictionary)
+        arrays = {col: df[col].to_numpy() for col in self.schema}
+        arrays['coin'] = df['coin'].cat.codes.to_numpy().astype(np.int32)
+        return arrays
+
+    def read(self, start_ms=None, end_ms=None, coins=None, columns=None):
+        """
+        Read rows with start_ms <= time < end_ms, optionally restricted to some coins.
+
+        Args:
+            start_ms: Inclusive lower time bound in milliseconds (None for no bound)
+            end_ms: Exclusive upper time bound in milliseconds (None for no bound)
+            coins: Iterable of coin symbols to keep (None for all)
+            columns: Columns to load (None for all schema columns)
+
+        Returns:
+            DataFrame of matching rows
+        """
+        columns = list(columns) if columns else list(self.schema)
+        stored = [col for col in columns if col != HOUR_COLUMN]
+        load_columns = list(dict.fromkeys(stored + self.key))
+
+        with self._lock:
+            # Files as (path, min time, max time): day partitions, then journal
+            # segments, which are skipped by their name when outside the range
+            files = [(self._path(day), _day_start_ms(day), _day_start_ms(day) + self.partition_ms - 1)
+                     for day in self.partitions()]
+            files += [(path, min_time, max_time) for path, _, min_time, max_time in self.segments()]
+            files = [(path, min_time, max_time) for path, min_time, max_time in files
+                     if (start_ms is None or max_time >= start_ms) and (end_ms is None or min_time < end_ms)]
+            parts = [(self._load_arrays(path, load_columns), min_time, max_time) for path, min_time, max_time in files]
+
+        if not parts:
+            return self._empty_frame(columns)
+
+        # Each file is sorted by key, so its matching rows are located by binary
+        # search (a slice when no coin filter cuts into it) before the merge
+        coin_ids = None if coins is None else self.dictionary.lookup(coins)
+        pieces = []
+        for arrays, min_time, max_time in parts:
+            series = self._series(arrays)
+            pieces.append(self._arrays(series, series.select(
+                start_ms if start_ms is not None and min_time < start_ms else None,
+                end_ms if end_ms is not None and max_time >= end_ms else None,
+                coin_ids)))
+        # Journal rows come last, so they replace partition rows with the same key
+        series = self._series({col: np.concatenate([piece[col] for piece in pieces]) for col in load_columns})
+        result = self._arrays(series)
+        if HOUR_COLUMN in columns:
+            result[HOUR_COLUMN] = hour_key(result[self.time_column])
+        return self._frame({col: result[col] for col in columns})
+
+    def max_time(self):
+        """
+        Return the latest timestamp in the store, or None if it is empty.
+        """
+        with self._lock:
+            candidates = [max_time for _, _, _, max_time in self.segments()]
+            days = self.partitions()
+            if days:
+                times = self._load_arrays(self._path(days[-1]), [self.time_column])[self.time_column]
+                if len(times):
+                    candidates.append(int(times.max()))
+        return max(candidates) if candidates else None
+
+    def write(self, df):
+        """
+        Upsert rows into their partitions. Rows with the same (coin, time)
+        as an existing row replace it.
+
+        Returns:
+            Number of partitions rewritten
+        """
+        if df is None or df.empty:
+            return 0
+        return self._write_normalized(self._normalize(df))
+
+    def _write_normalized(self, arrays):
+        # Group the rows by partition; the stable sort keeps their order within one
+        day_keys = arrays[self.time_column] // self.partition_ms
+        order = np.argsort(day_keys, kind='stable')
+        bounds = np.flatnonzero(np.diff(day_keys[order])) + 1
+        written = 0
+        with self._lock:
+            for rows in np.split(order, bounds):
+                day = _day_of(int(day_keys[rows[0]]) * self.partition_ms)
+                series = self._series({col: values[rows] for col, values in arrays.items()})
+                if os.path.exists(self._path(day)):
+                    existing = self._series(self._load_arrays(self._path(day), list(self.schema)))
+                    existing.upsert(series)
+                    series = existing
+                self._save(day, self._arrays(series))
+                written += 1
+            self._mark(arrays)
+        return written
+
+    def _mark(self, arrays):
+        if self.index is not None:
+            self.index.mark(self.dictionary.categorical(arrays['coin']), arrays[self.time_column])
+            self.index.save()
+
+    def append(self, df):
+        """
+        Append rows to a new journal segment without touching the partitions.
+        Rows upsert on (coin, time) over everything written before them.
+
+        Returns:
+            Path of the segment written, or None if there were no rows
+        """
+        if df is None or df.empty:
+            return None
+        rows = self._arrays(self._series(self._normalize(df)))
+        times = rows[self.time_column]
+        with self._lock:
+            # Segment names sort in write order, even when a replay froze the clock before older segments
+            segments = self.segments()
+            created_ms = max(int(clock.now() * 1000), segments[-1][1] if segments else 0)
+            name = f"{created_ms:013d}-{next(self._segment_seq) % 10000:04d}-{int(times.min())}-{int(times.max())}.npz"
+            path = os.path.join(self.journal_dir, name)
+            self._save_file(path, rows)
+            self._mark(rows)
+        return path
+
+    def compaction_due(self, max_segments=COMPACT_MAX_SEGMENTS, max_age=COMPACT_MAX_AGE):
+        """
+        Return True when the journal is long enough or old enough to compact.
+        """
+        segments = self.segments()
+        if not segments:
+            return False
+        oldest_age_ms = int(clock.now() * 1000) - segments[0][1]
+        return len(segments) >= max_segments or oldest_age_ms >= max_age.total_seconds() * 1000
+
+    def compact(self):
+        """
+        Merge every journal segment into the day partitions, then delete the segments.
+
+        Returns:
+            Number of segments merged
+        """
+        with self._lock:
+            segments = self.segments()
+            if not segments:
+                return 0
+            parts = [self._load_arrays(path, list(self.schema)) for path, _, _, _ in segments]
+            # Later segments win because writes keep the last duplicate
+            self._write_normalized({col: np.concatenate([part[col] for part in parts]) for col in self.schema})
+            for path, _, _, _ in segments:
+                os.remove(path)
+        return len(segments)
+
+    def drop_before(self, cutoff_ms):
+        """
+        Delete every partition whose whole span lies before cutoff_ms, and the
+        journal rows that belong to them, so compaction does not bring them back.
+
+        Returns:
+            List of dropped partition days
+        """
+        dropped = []
+        with self._lock:
+            for day in self.partitions():
+                if _day_start_ms(day + timedelta(days=self.partition_days)) <= cutoff_ms:
+                    os.remove(self._path(day))
+                    dropped.append(day)
+            self._drop_journal_before(cutoff_ms // self.partition_ms * self.partition_ms)
+        return dropped
+
+    def _drop_journal_before(self, start_ms):
+        # Rewrite the segments holding rows before start_ms without them, under the same creation time
+        for path, _, min_time, max_time in self.segments():
+            if min_time >= start_ms:
+                continue
+            if max_time >= start_ms:
+                rows = self._load_arrays(path, list(self.schema))
+                keep = rows[self.time_column] >= start_ms
+                created, seq = os.path.basename(path).split('-')[:2]
+                name = f"{created}-{seq}-{int(rows[self.time_column][keep].min())}-{max_time}.npz"
+                kept = {col: values[keep] for col, values in rows.items()}
+                self._save_file(os.path.join(self.journal_dir, name), kept)
+            os.remove(path)
+
+    def import_csv(self, path):
+        """
+        Load a legacy CSV file into the store.
+
+        Returns:
+            Number of rows imported
+        """
+        df = read_csv(path, self.schema, self.dictionary)
+        self.write(df)
+        return len(df)
+
+    def export_csv(self, path, start_ms=None):
+        """
+        Write the store (or the part from start_ms on) to a single CSV file.
+        """
+        df = self.read(start_ms=start_ms)
+        df.to_csv(path, index=False)
+        return len(df)
+
+
+def funding_store(root=FUNDING_DIR):
+    index = CompletenessIndex(os.path.join(root, 'completeness.npz'), FUNDING_RETENTION_DAYS * 24)
+    return PartitionedStore(root, FUNDING_SCHEMA, index=index)
+
+
+def ohlcv_store(root=OHLCV_DIR):
+    index = CompletenessIndex(os.path.join(root, 'completeness.npz'), OHLCV_RETENTION_DAYS * 24)
+    return PartitionedStore(root, OHLCV_SCHEMA, index=index)
+
+
+def ohlcv_daily_store(root=OHLCV_DAILY_DIR):
+    return PartitionedStore(root, ROLLUP_SCHEMA, partition_days=OHLCV_DAILY_PARTITION_DAYS)
+
+
+def ohlcv_weekly_store(root=OHLCV_WEEKLY_DIR):
+    return PartitionedStore(root, ROLLUP_SCHEMA, partition_days=OHLCV_WEEKLY_PARTITION_DAYS)
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from completeness import HOUR_MS
+from storage import candle_to_ohlcv_row
+
+DEFAULT_WS_URL = 'wss://api.hyperliquid.xyz/ws'
+
+# The server drops connections that are silent for 60 seconds
+PING_INTERVAL = 30
+# Wait this long after the top of the hour for the last candle updates
+FLUSH_GRACE_SECONDS = 5
+RECONNECT_MAX_DELAY = 60
+
+
+class HourlyBarBook:
+    """
+    In-memory hourly state per coin built from WebSocket updates.
+
+    Keeps the open hourly candle and the latest asset context for each coin.
+    A candle is closed once its hour has passed; the funding print for an
+    hour is the last funding rate seen before the hour ended, stamped with
+    the hour it settles at. Both are held until close_hour() collects them.
+    """
+
+    def __init__(self):
+        self.bars = {}            # coin -> latest candle dict for its open hour
+        self.closed = []          # rows of bars closed by a newer candle, not collected yet
+        self.contexts = {}        # coin -> (received_ms, ctx)
+        self.pending_prints = {}  # coin -> {settle_hour_ms: ctx}
+        self.last_printed = {}    # coin -> settle hour of the last funding print emitted
+
+    def on_candle(self, candle):
+        """
+        Record a candle update. A bar it closes is kept for close_hour().
+        """
+        coin = candle['s']
+        current = self.bars.get(coin)
+        if current is not None and current['t'] < candle['t']:
+            self.closed.append(candle_to_ohlcv_row(coin, current))
+        if current is None or current['t'] <= candle['t']:
+            self.bars[coin] = candle
+
+    def on_asset_ctx(self, coin, ctx, received_ms):
+        """
+        Record an asset context update.
+        """
+        previous = self.contexts.get(coin)
+        if previous is not None and previous[0] // HOUR_MS < received_ms // HOUR_MS:
+            # The previous context was the last one seen in its hour
+            settle_hour_ms = (previous[0] // HOUR_MS + 1) * HOUR_MS
+            self.pending_prints.setdefault(coin, {})[settle_hour_ms] = previous[1]
+        self.contexts[coin] = (received_ms, ctx)
+
+    def close_hour(self, hour_ms):
+        """
+        Close everything that ended at or before hour_ms.
+
+        Returns:
+            Tuple of (ohlcv rows, funding rows)
+        """
+        bar_rows = [row for row in self.closed if row['time'] + HOUR_MS <= hour_ms]
+        self.closed = [row for row in self.closed if row['time'] + HOUR_MS > hour_ms]
+        for coin, candle in list(self.bars.items()):
+            if candle['t'] + HOUR_MS <= hour_ms:
+                bar_rows.append(candle_to_ohlcv_row(coin, candle))
+                del self.bars[coin]
+
+        funding_rows = []
+        for coin, (received_ms, ctx) in self.contexts.items():
+            if received_ms < hour_ms:
+                settle_hour_ms = (received_ms // HOUR_MS + 1) * HOUR_MS
+                self.pending_prints.setdefault(coin, {}).setdefault(settle_hour_ms, ctx)
+        for coin, prints in list(self.pending_prints.items()):
+            for settle_hour_ms in sorted(prints):
+                if settle_hour_ms > hour_ms:
+                    continue
+                ctx = prints.pop(settle_hour_ms)
+                if ctx.get('funding') is None or settle_hour_ms <= self.last_printed.get(coin, 0):
+                    continue
+                self.last_printed[coin] = settle_hour_ms
+                funding_rows.append({
+                    'coin': coin,
+                    'fundingRate': float(ctx['funding']),
+                    'premium': float(ctx['premium']) if ctx.get('premium') is not None else None,
+                    'time': settle_hour_ms,
+                })
+            if not prints:
+                del self.pending_prints[coin]
+        return bar_rows, funding_rows
+
+
+class StreamingCollector:
+    """
+    Long-running collector fed by Hyperliquid's WebSocket candle and
+    activeAssetCtx feeds.
+
+    Closed hourly bars and funding prints are buffered and appended to the
+    stores once per hour boundary, and closed bars are folded into `rollups`
+    (OhlcvRollups) when given. The appends, rollups and compaction run on a
+    worker thread, so the event loop keeps reading messages meanwhile.
+    Dropped connections are reopened with jittered backoff and every
+    subscription is sent again; `on_reconnect` (e.g. a REST gap repair) runs
+    after each reconnect so nothing missed while offline stays missing.
+    """
+
+    def __init__(self, coins, funding_store, ohlcv_store, url=DEFAULT_WS_URL,
+                 flush_grace=FLUSH_GRACE_SECONDS, ping_interval=PING_INTERVAL,
+                 reconnect_max_delay=RECONNECT_MAX_DELAY, refresh_coins=None,
+                 on_reconnect=None, clock=time.time, rollups=None):
+        self.coins = list(coins)
+        self.funding_store = funding_store
+        self.ohlcv_store = ohlcv_store
+        self.url = url
+        self.flush_grace = flush_grace
+        self.ping_interval = ping_interval
+        self.reconnect_max_delay = reconnect_max_delay
+        self.refresh_coins = refresh_coins
+        self.on_reconnect = on_reconnect
+        self.rollups = rollups
+        self.clock = clock
+        self.book = HourlyBarBook()
+        # One thread, so flushes reach the stores one at a time and in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stream-store')
+        self.connections = 0
+        self._ws = None
+        self._subscribed = set()
+
+    def _now_ms(self):
+        return int(self.clock() * 1000)
+
+    # ---------------- storage ----------------
+
+    async def flush(self, hour_ms):
+        """
+        Append everything that closed by hour_ms to the stores. The book is
+        only touched on the event loop; the writes go to the store thread.
+        """
+        bar_rows, funding_rows = self.book.close_hour(hour_ms)
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._store, bar_rows, funding_rows)
+
+    def _store(self, bar_rows, funding_rows):
+        if bar_rows:
+            self.ohlcv_store.append(pd.DataFrame(bar_rows))
+            if self.rollups is not None:
+                self.rollups.update()
+        if funding_rows:
+            self.funding_store.append(pd.DataFrame(funding_rows))
+        if bar_rows or funding_rows:
+            print(f"Stored {len(bar_rows)} closed bars and {len(funding_rows)} funding prints.")
+        for store in (self.ohlcv_store, self.funding_store):
+            if store.compaction_due():
+                store.compact()
+
+    # ---------------- messages ----------------
+
+    def handle_message(self, message):
+        """
+        Process one decoded WebSocket message.
+        """
+        channel = message.get('channel')
+        data = message.get('data')
+        if channel == 'candle':
+            self.book.on_candle(data)
+        elif channel == 'activeAssetCtx':
+            self.book.on_asset_ctx(data['coin'], data['ctx'], self._now_ms())
+
+    async def _subscribe(self, ws, coins):
+        for coin in coins:
+            for subscription in ({'type': 'candle', 'coin': coin, 'interval': '1h'},
+                                 {'type': 'activeAssetCtx', 'coin': coin}):
+                await ws.send(json.dumps({'method': 'subscribe', 'subscription': subscription}))
+            self._subscribed.add(coin)
+
+    # ---------------- background tasks ----------------
+
+    async def _ping(self, ws):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await ws.send(json.dumps({'method': 'ping'}))
+
+    async def _hour_timer(self):
+        while True:
+            now_ms = self._now_ms()
+            next_hour_ms = (now_ms // HOUR_MS + 1) * HOUR_MS
+            await asyncio.sleep((next_hour_ms - now_ms) / 1000 + self.flush_grace)
+            await self.flush(next_hour_ms)
+            if self.refresh_coins is not None:
+                await self._refresh_universe()
+
+    async def _refresh_universe(self):
+        coins = await asyncio.to_thread(self.refresh_coins)
+        new_coins = [coin for coin in coins if coin not in self._subscribed]
+        if not new_coins:
+            return
+        self.coins.extend(new_coins)
+        if self._ws is not None:
+            print(f"Subscribing to {len(new_coins)} new coins.")
+            await self._subscribe(self._ws, new_coins)
+
+    # ---------------- connection loop ----------------
+
+    async def _session(self, websockets):
+        async with websockets.connect(self.url, max_size=None, ping_interval=None) as ws:
+            self._ws = ws
+            self._subscribed = set()
+            self.connections += 1
+            await self._subscribe(ws, self.coins)
+            print(f"Connected to {self.url} and subscribed to {len(self.coins)} coins.")
+            if self.connections > 1 and self.on_reconnect is not None:
+                await asyncio.to_thread(self.on_reconnect)
+            ping_task = asyncio.create_task(self._ping(ws))
+            try:
+                async for raw in ws:
+                    self.handle_message(json.loads(raw))
+            finally:
+                ping_task.cancel()
+                self._ws = None
+
+    async def run(self, stop_event=None):
+        """
+        Stream until stop_event is set (or forever), reconnecting on drops.
+        """
+        try:
+            import websockets
+        except ImportError:
+            raise RuntimeError("Daemon mode requires the 'websockets' package (pip install websockets)")
+
+        stop_event = stop_event or asyncio.Event()
+        timer_task = asyncio.create_task(self._hour_timer())
+        attempt = 0
+        try:
+            while not stop_event.is_set():
+                connections_before = self.connections
+                session = asyncio.create_task(self._session(websockets))
+                stopper = asyncio.create_task(stop_event.wait())
+                await asyncio.wait({session, stopper}, return_when=asyncio.FIRST_COMPLETED)
+                stopper.cancel()
+                if stop_event.is_set():
+                    session.cancel()
+                    break
+                error = session.exception() if session.done() else None
+                # Back off further only while connecting keeps failing
+                attempt = 1 if self.connections > connections_before else attempt + 1
+                delay = random.uniform(0, min(self.reconnect_max_delay, 2 ** attempt))
+                print(f"WebSocket connection closed ({error or 'server closed'}). Reconnecting in {delay:.1f} seconds...")
+                await asyncio.sleep(delay)
+        finally:
+            timer_task.cancel()
+            # Keep whatever already closed
+            await self.flush((self._now_ms() // HOUR_MS) * HOUR_MS)
+
+
+def ws_url_from_env():
+    return os.environ.get('HYPERLIQUID_WS_URL', DEFAULT_WS_URL)
@@ -0,0 +1,310 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+TELEMETRY_DIR = 'telemetry'
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+PROFILE_TOP = 25
+
+METRIC_PREFIX = 'carry_screener'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RunTelemetry:
+    """
+    Timings and counters for one run of a script.
+
+    Stages are timed with nested spans (`with run.span('fetch'):`), named by
+    their path from the outermost span, e.g. 'collect_funding_data/gap_check'.
+    Spans opened on other threads start their own path. Every info request
+    attempt is counted per request type with its status code, bytes and a
+    latency histogram, and each coin's fetch outcome is kept per dataset.
+
+    At the end of a run the telemetry is written as a JSON report and as a
+    Prometheus textfile (for node_exporter's textfile collector).
+
+    One span can be profiled: with `profile_stage` set to a span name or
+    path, that span runs under cProfile (stats dumped next to the report)
+    or tracemalloc (peak and top allocations in the report).
+    """
+
+    def __init__(self, name, out_dir=TELEMETRY_DIR, profile_stage=None, profile_mode='cprofile'):
+        if profile_mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {profile_mode!r}; expected one of {PROFILE_MODES}")
+        self.name = name
+        self.out_dir = out_dir
+        self.profile_stage = profile_stage
+        self.profile_mode = profile_mode
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.spans = {}
+        self.requests = {}
+        self.counters = {}
+        self.coins = {}
+        self.profile = None
+
+    # ---------------- spans ----------------
+
+    @contextmanager
+    def span(self, name):
+        """
+        Time the enclosed block; repeated spans with the same path add up.
+        """
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(name)
+        path = '/'.join(stack)
+        profiling = self.profile_stage is not None and self.profile_stage in (name, path) and self.profile is None
+        if profiling:
+            self.profile = {'stage': path, 'mode': self.profile_mode}
+            profiler = self._start_profile()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profiling:
+                self._stop_profile(profiler, path)
+            stack.pop()
+            with self._lock:
+                span = self.spans.setdefault(path, {'calls': 0, 'seconds': 0.0})
+                span['calls'] += 1
+                span['seconds'] += seconds
+
+    def _start_profile(self):
+        if self.profile_mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        tracemalloc.start()
+        return None
+
+    def _stop_profile(self, profiler, path):
+        if self.profile_mode == 'cprofile':
+            profiler.disable()
+            os.makedirs(self.out_dir, exist_ok=True)
+            stats_path = os.path.join(self.out_dir, f"{self.name}-{path.replace('/', '.')}.prof")
+            profiler.dump_stats(stats_path)
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            self.profile.update({'file': stats_path, 'summary': summary.getvalue()})
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        top = snapshot.statistics('lineno')[:PROFILE_TOP]
+        self.profile.update({
+            'peak_bytes': peak,
+            'top': [{'location': str(stat.traceback), 'bytes': stat.size, 'count': stat.count} for stat in top],
+        })
+
+    # ---------------- counters ----------------
+
+    def record_request(self, request_type, status, seconds, nbytes=0, retry=False):
+        """
+        Count one request attempt.
+
+        Args:
+            request_type: Info request type (e.g. 'fundingHistory')
+            status: HTTP status code, or an error name if no response arrived
+            seconds: Time until the response (or the error)
+            nbytes: Response bytes received
+            retry: Whether the attempt was a retry
+        """
+        with self._lock:
+            stats = self.requests.get(request_type)
+            if stats is None:
+                stats = self.requests[request_type] = {
+                    'count': 0, 'retries': 0, 'bytes': 0, 'status': {},
+                    'latency_sum': 0.0, 'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+                }
+            stats['count'] += 1
+            stats['retries'] += int(retry)
+            stats['bytes'] += nbytes
+            stats['status'][str(status)] = stats['status'].get(str(status), 0) + 1
+            stats['latency_sum'] += seconds
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+            stats['latency_buckets'][bucket] += 1
+
+    def count(self, name, amount=1):
+        """
+        Add to a named run counter (e.g. rows appended).
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def coin_outcome(self, dataset, coin, outcome, rows=0, error=None):
+        """
+        Record how fetching a coin's data went: 'ok', 'empty' or 'failed'.
+        Several ranges for one coin add up; a failure outranks the rest.
+        """
+        with self._lock:
+            entry = self.coins.setdefault(dataset, {}).setdefault(coin, {'outcome': outcome, 'ranges': 0, 'rows': 0})
+            entry['ranges'] += 1
+            entry['rows'] += rows
+            if outcome == 'failed' or (outcome == 'ok' and entry['outcome'] == 'empty'):
+                entry['outcome'] = outcome
+            if error is not None:
+                entry['error'] = str(error)
+
+    # ---------------- reports ----------------
+
+    def report(self):
+        """
+        Return the run's telemetry as a JSON-serializable dict.
+        """
+        with self._lock:
+            outcomes = {}
+            for dataset, coins in self.coins.items():
+                totals = outcomes[dataset] = {}
+                for entry in coins.values():
+                    totals[entry['outcome']] = totals.get(entry['outcome'], 0) + 1
+            return {
+                'run': self.name,
+                'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S UTC'),
+                'duration_seconds': round(time.perf_counter() - self._start, 4),
+                'spans': {path: {'calls': span['calls'], 'seconds': round(span['seconds'], 4)}
+                          for path, span in self.spans.items()},
+                'requests': json.loads(json.dumps(self.requests)),
+                'latency_buckets': list(LATENCY_BUCKETS),
+                'counters': dict(self.counters),
+                'coin_outcomes': outcomes,
+                'coins': json.loads(json.dumps(self.coins)),
+                'profile': self.profile,
+            }
+
+    def prometheus(self, report=None):
+        """
+        Render the run's metrics in the Prometheus text exposition format.
+        """
+        report = report or self.report()
+        run = f'run="{_label(self.name)}"'
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{METRIC_PREFIX}_{name}{suffix}{{{','.join([run] + labels)}}} {value}")
+
+        metric('run_duration_seconds', 'gauge', "Wall time of the run.",
+               [('', [], report['duration_seconds'])])
+        metric('run_last_completed_timestamp_seconds', 'gauge', "Unix time the run finished.",
+               [('', [], round(time.time(), 3))])
+        metric('span_seconds', 'gauge', "Wall time spent in each stage of the run.",
+               [('', [f'span="{_label(path)}"'], span['seconds']) for path, span in report['spans'].items()])
+
+        requests = report['requests']
+        metric('requests_total', 'counter', "Info request attempts by type and status.",
+               [('', [f'type="{_label(kind)}"', f'status="{_label(status)}"'], count)
+                for kind, stats in requests.items() for status, count in stats['status'].items()])
+        metric('request_retries_total', 'counter', "Info request attempts that were retries.",
+               [('', [f'type="{_label(kind)}"'], stats['retries']) for kind, stats in requests.items()])
+        metric('response_bytes_total', 'counter', "Info response bytes received.",
+               [('', [f'type="{_label(kind)}"'], stats['bytes']) for kind, stats in requests.items()])
+
+        samples = []
+        for kind, stats in requests.items():
+            type_label = f'type="{_label(kind)}"'
+            cumulative = 0
+            for bound, count in zip(list(LATENCY_BUCKETS) + ['+Inf'], stats['latency_buckets']):
+                cumulative += count
+                samples.append(('_bucket', [type_label, f'le="{bound}"'], cumulative))
+            samples.append(('_sum', [type_label], round(stats['latency_sum'], 6)))
+            samples.append(('_count', [type_label], stats['count']))
+        metric('request_latency_seconds', 'histogram', "Info request latency.", samples)
+
+        metric('coins', 'gauge', "Coins by fetch outcome.",
+               [('', [f'dataset="{_label(dataset)}"', f'outcome="{_label(outcome)}"'], count)
+                for dataset, totals in report['coin_outcomes'].items() for outcome, count in totals.items()])
+        metric('counter_total', 'counter', "Run counters (rows appended, files written, ...).",
+               [('', [f'name="{_label(name)}"'], value) for name, value in report['counters'].items()])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, out_dir=None):
+        """
+        Write the JSON report and the Prometheus textfile as
+        <out_dir>/<run>.json and <out_dir>/<run>.prom.
+
+        Returns:
+            Tuple of (report path, textfile path)
+        """
+        out_dir = out_dir or self.out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        report = self.report()
+        paths = []
+        for extension, content in (('json', json.dumps(report, indent=1)), ('prom', self.prometheus(report))):
+            path = os.path.join(out_dir, f"{self.name}.{extension}")
+            # Written to a temporary file first so a scraper never sees half a file
+            with open(path + '.tmp', 'w') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+            paths.append(path)
+        return tuple(paths)
+
+
+_current_run = RunTelemetry('default')
+
+
+def start_run(name, out_dir=TELEMETRY_DIR, profile_stage=None, profile_mode='cprofile'):
+    """
+    Start collecting telemetry for a new run and make it the process-wide run.
+    """
+    global _current_run
+    _current_run = RunTelemetry(name, out_dir=out_dir, profile_stage=profile_stage, profile_mode=profile_mode)
+    return _current_run
+
+
+def current_run():
+    """
+    Return the process-wide run. Before start_run() it is a run that is never written.
+    """
+    return _current_run
+
+
+def span(name):
+    """
+    Time a block as a span of the current run.
+    """
+    return _current_run.span(name)
+
+
+def timed(name):
+    """
+    Decorator running the function inside a span of the current run.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def add_arguments(parser):
+    """
+    Add the telemetry command line options to an argparse parser.
+    """
+    parser.add_argument('--telemetry-dir', default=TELEMETRY_DIR,
+                        help=f"Directory for the run report and Prometheus textfile (default: {TELEMETRY_DIR})")
+    parser.add_argument('--profile', metavar='STAGE',
+                        help="Profile one stage (span name or path, e.g. gap_check)")
+    parser.add_argument('--profile-mode', choices=PROFILE_MODES, default='cprofile',
+                        help="Profiler for --profile (default: cprofile)")
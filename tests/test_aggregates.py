@@ -0,0 +1,159 @@
+"""
+WindowIndex running totals and CarryStats moments, checked against values
+computed directly from the rows.
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from aggregates import CarryStats, WindowIndex
+from completeness import HOUR_MS, CompletenessIndex
+
+H = 480000  # An epoch hour to build the cases around
+
+
+def ms(hour):
+    return hour * HOUR_MS
+
+
+def rows(values):
+    """
+    Frame of 'rate' rows from {coin: {hour offset from H: value}}.
+    """
+    records = [{'coin': coin, 'time': ms(H + offset), 'rate': value}
+               for coin, by_hour in values.items() for offset, value in by_hour.items()]
+    return pd.DataFrame(records, columns=['coin', 'time', 'rate'])
+
+
+class WindowIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.index = WindowIndex(os.path.join(tmp.name, 'window_index.npz'), 'rate', max_hours=10)
+        # ETH misses hours 2 and 3
+        self.values = {'BTC': {hour: float(hour + 1) for hour in range(6)},
+                       'ETH': {0: 10.0, 1: 20.0, 4: 50.0, 5: 60.0}}
+        self.assertEqual(self.index.update(rows(self.values), H), 10)
+
+    def test_windows_are_prefix_differences(self):
+        self.assertEqual((self.index.start_hour, self.index.end_hour), (H, H + 6))
+        sums, counts = self.index.window(H + 1, H + 4, coins=['ETH', 'BTC', 'SOL'])
+        self.assertEqual(sums.tolist(), [20.0, 2.0 + 3.0 + 4.0, 0.0])
+        self.assertEqual(counts.tolist(), [1, 3, 0])
+        # Hours outside the index count as missing
+        sums, counts = self.index.window(H - 5, H + 100)
+        self.assertEqual(sums.tolist(), [21.0, 140.0])
+        self.assertEqual(counts.tolist(), [6, 4])
+
+        sums, counts = self.index.windows(H + 6, [1, 4])
+        self.assertEqual(sums.tolist(), [[6.0, 60.0], [3.0 + 4.0 + 5.0 + 6.0, 110.0]])
+        self.assertEqual(counts.tolist(), [[1, 1], [4, 2]])
+        values, valid = self.index.latest()
+        self.assertEqual((values.tolist(), valid.tolist()), ([6.0, 60.0], [True, True]))
+
+    def test_update_recomputes_from_the_first_changed_hour(self):
+        # A repaired hole and a new hour; the update holds every row from hour 3 on
+        self.values['ETH'][3] = 40.0
+        self.values['BTC'][6] = 7.0
+        later = {coin: {hour: value for hour, value in by_hour.items() if hour >= 3}
+                 for coin, by_hour in self.values.items()}
+        self.index.update(rows(later), H + 3)
+        self.assertEqual(self.index.end_hour, H + 7)
+        sums, counts = self.index.window(H, H + 7)
+        self.assertEqual(sums.tolist(), [28.0, 180.0])
+        self.assertEqual(counts.tolist(), [7, 5])
+
+        # Hours falling out of the span are dropped from the front
+        self.index.update(rows({'BTC': {12: 1.0}}), H + 7)
+        self.assertEqual((self.index.start_hour, self.index.end_hour), (H + 3, H + 13))
+        sums, counts = self.index.window(H + 3, H + 13)
+        self.assertEqual(sums.tolist(), [4.0 + 5.0 + 6.0 + 7.0 + 1.0, 150.0])
+        self.assertEqual(counts.tolist(), [5, 3])
+
+    def test_save_and_load(self):
+        self.index.save()
+        loaded = WindowIndex(self.index.path, 'rate', max_hours=10)
+        self.assertTrue(loaded.loaded)
+        self.assertEqual(loaded.coins, ['BTC', 'ETH'])
+        np.testing.assert_array_equal(loaded.sums, self.index.sums)
+        self.assertFalse(WindowIndex(self.index.path, 'rate', max_hours=20).loaded)
+
+    def test_pending_from(self):
+        path = os.path.join(self.tmp, 'completeness.npz')
+        index = CompletenessIndex(path, retention_hours=24)
+        self.assertIsNone(self.index.pending_from(index))
+
+        def completeness(values):
+            df = rows(values)
+            index.mark(df['coin'], df['time'])
+            index.save()
+            return CompletenessIndex(path, retention_hours=24)
+
+        # Nothing new in the store: nothing to read
+        self.assertEqual(self.index.pending_from(completeness(self.values)), H + 6)
+        # A repaired hole is read from its hour on
+        self.assertEqual(self.index.pending_from(completeness({'ETH': {3: 40.0}})), H + 3)
+        # So is an hour of a coin the totals have not seen
+        self.index.update(rows({coin: {hour: 1.0 for hour in range(3, 6)} for coin in self.values}), H + 3)
+        self.assertEqual(self.index.pending_from(completeness({'SOL': {1: 1.0}})), H + 1)
+
+
+class CarryStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.stats = CarryStats(os.path.join(tmp.name, 'carry_stats.npz'), 'rate', window_hours=6)
+
+    def assertMoments(self, coin, values):
+        i = self.stats.coins.index(coin)
+        self.assertEqual(self.stats.counts[0, i], len(values))
+        values = np.array(values)
+        mean = values.mean() if len(values) else 0.0
+        np.testing.assert_allclose([self.stats.means[0, i], self.stats.m2[0, i]],
+                                   [mean, ((values - mean) ** 2).sum()], rtol=1e-9, atol=1e-20)
+
+    def test_moments_follow_the_window(self):
+        rng = np.random.default_rng(0)
+        btc = {hour: float(value) for hour, value in enumerate(rng.normal(1e-4, 5e-5, 4))}
+        self.stats.update(rows({'BTC': btc, 'ETH': {1: 2e-4, 3: -1e-4}}))
+        self.assertMoments('BTC', list(btc.values()))
+        self.assertMoments('ETH', [2e-4, -1e-4])
+
+        # Added in a later batch, one value replacing an earlier one
+        btc.update({3: 3e-4, 4: 1e-4, 5: 2e-4})
+        self.stats.update(rows({'BTC': {hour: btc[hour] for hour in (3, 4, 5)}}))
+        self.assertMoments('BTC', list(btc.values()))
+
+        # Moving forward takes the hours leaving the window out again
+        self.stats.update(rows({'BTC': {8: 5e-5}}))
+        self.assertMoments('BTC', [btc[3], btc[4], btc[5], 5e-5])
+        self.assertMoments('ETH', [-1e-4])
+        self.stats.update(rows({'BTC': {9: 5e-5}}))
+        self.assertMoments('ETH', [])
+
+    def test_stats(self):
+        self.stats.update(rows({
+            'BTC': {0: -1e-4, 1: 1e-4, 2: 2e-4, 3: 1e-4, 4: 3e-4, 5: 1e-4},
+            'ETH': {2: 1e-4, 3: -1e-4, 5: -2e-4},
+            'SOL': {0: 1e-4, 1: -1e-4, 3: -1e-4, 4: -1e-4, 5: -1e-4},
+        }))
+        result = self.stats.stats(min_points=4, quantiles=(0.5,))
+        btc = np.array([-1e-4, 1e-4, 2e-4, 1e-4, 3e-4, 1e-4])
+        self.assertAlmostEqual(result['mean'][0], btc.mean(), places=12)
+        self.assertAlmostEqual(result['std'][0], btc.std(ddof=1), places=12)
+        self.assertAlmostEqual(result['zscore'][0], (1e-4 - btc.mean()) / btc.std(ddof=1), places=9)
+        self.assertAlmostEqual(result['quantiles'][0, 0], 1e-4, places=12)
+        # Too few values for the moments
+        self.assertTrue(np.isnan(result['mean'][1]) and np.isnan(result['quantiles'][0, 1]))
+        # A missing hour ends a run of the same sign
+        self.assertEqual(result['streak'].tolist(), [5, -1, -3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+CompletenessIndex: the sliding hour window, gap ranges and listing hours.
+"""
+import os
+import tempfile
+import unittest
+
+from completeness import HOUR_MS, CompletenessIndex
+
+H = 480000  # An epoch hour to build the cases around
+
+
+def ms(hour):
+    return hour * HOUR_MS
+
+
+class CompletenessIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'completeness.npz')
+        self.index = CompletenessIndex(self.path, retention_hours=24)
+
+    def test_window_slides_with_the_latest_hour(self):
+        self.index.mark(['BTC', 'ETH'], [ms(H), ms(H) + 59 * 60 * 1000])
+        self.assertEqual(self.index.end_hour, H + 1)
+        self.assertTrue(self.index.has('ETH', ms(H)))
+
+        self.index.mark(['BTC'], [ms(H + 10)])
+        self.assertEqual(self.index.end_hour, H + 11)
+        self.assertTrue(self.index.has('BTC', ms(H)))
+        self.assertTrue(self.index.has('BTC', ms(H + 10)))
+        self.assertFalse(self.index.has('BTC', ms(H + 5)))
+
+        # H falls out of the 24-hour window
+        self.index.mark(['BTC'], [ms(H + 24)])
+        self.assertFalse(self.index.has('BTC', ms(H)))
+        self.assertTrue(self.index.has('BTC', ms(H + 10)))
+
+        # A jump longer than the window clears it
+        self.index.mark(['ETH'], [ms(H + 100)])
+        self.assertEqual(self.index.first_hour('BTC'), None)
+        self.assertEqual(self.index.first_hour('ETH'), H + 100)
+
+    def test_rows_older_than_the_window_are_ignored(self):
+        self.index.mark(['BTC'], [ms(H + 30)])
+        self.index.mark(['BTC'], [ms(H)])
+        self.assertEqual(self.index.end_hour, H + 31)
+        self.assertFalse(self.index.has('BTC', ms(H)))
+
+    def test_missing_ranges(self):
+        present = [H, H + 1, H + 4, H + 5, H + 7, H + 11]
+        self.index.mark(['BTC'] * len(present), [ms(hour) for hour in present])
+
+        self.assertEqual(self.index.missing_ranges('BTC', ms(H), ms(H + 12)),
+                         [(ms(H + 2), ms(H + 4)), (ms(H + 6), ms(H + 7)), (ms(H + 8), ms(H + 11))])
+        # Holes merge while the merged range spans at most max_span_hours
+        self.assertEqual(self.index.missing_ranges('BTC', ms(H), ms(H + 12), max_span_hours=5),
+                         [(ms(H + 2), ms(H + 7)), (ms(H + 8), ms(H + 11))])
+        self.assertEqual(self.index.missing_ranges('BTC', ms(H), ms(H + 12), max_span_hours=9),
+                         [(ms(H + 2), ms(H + 11))])
+        # A partial end hour counts as a whole hour; an unknown coin misses everything
+        self.assertEqual(self.index.missing_ranges('BTC', ms(H + 11), ms(H + 12) + 1), [(ms(H + 12), ms(H + 13))])
+        self.assertEqual(self.index.missing_ranges('ETH', ms(H), ms(H + 3)), [(ms(H), ms(H + 3))])
+        # Hours before the window count as missing
+        self.assertEqual(self.index.missing_ranges('BTC', ms(H - 20), ms(H)), [(ms(H - 20), ms(H))])
+
+    def test_listed_from_trims_ranges(self):
+        self.index.mark(['BTC'], [ms(H + 11)])
+        self.index.update_listed_from({'NEW': H + 6})
+        self.assertEqual(self.index.missing_ranges('NEW', ms(H), ms(H + 10)), [(ms(H + 6), ms(H + 10))])
+        self.assertEqual(self.index.missing_ranges('NEW', ms(H), ms(H + 6)), [])
+        self.assertEqual(self.index.plan_repairs(['BTC', 'NEW'], ms(H + 8), ms(H + 12)),
+                         [('BTC', ms(H + 8), ms(H + 11)), ('NEW', ms(H + 8), ms(H + 12))])
+
+    def test_note_range_fetched(self):
+        self.index.mark(['BTC'], [ms(H + 11)])
+        # An empty response tells nothing
+        self.index.note_range_fetched('NEW', ms(H), ms(H + 12), [])
+        self.assertNotIn('NEW', self.index.listed_from)
+        # The first record arrives after the range start: the coin was listed then
+        self.index.note_range_fetched('NEW', ms(H), ms(H + 12), [ms(H + 9), ms(H + 10)])
+        self.assertEqual(self.index.listed_from['NEW'], H + 9)
+        # A coin with data before the range keeps its hole
+        self.index.note_range_fetched('BTC', ms(H + 12), ms(H + 20), [ms(H + 15)])
+        self.assertNotIn('BTC', self.index.listed_from)
+        # A response that starts at the range start says nothing about the listing
+        self.index.note_range_fetched('ETH', ms(H), ms(H + 12), [ms(H)])
+        self.assertNotIn('ETH', self.index.listed_from)
+
+    def test_save_and_load(self):
+        self.index.mark(['BTC', 'ETH'], [ms(H), ms(H + 3)])
+        self.index.update_listed_from({'ETH': H + 3})
+        self.index.save()
+
+        loaded = CompletenessIndex(self.path, retention_hours=24)
+        self.assertTrue(loaded.loaded)
+        self.assertEqual(loaded.end_hour, H + 4)
+        self.assertEqual(loaded.listed_from, {'ETH': H + 3})
+        self.assertEqual(loaded.present('BTC', H, H + 4).tolist(), [True, False, False, False])
+        # A different retention is rebuilt from the store instead of loaded
+        self.assertFalse(CompletenessIndex(self.path, retention_hours=48).loaded)
+
+
+if __name__ == '__main__':
+    unittest.main()
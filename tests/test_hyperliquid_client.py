@@ -0,0 +1,136 @@
+"""
+Circuit breaker and error handling of HyperliquidInfoClient, with the HTTP
+session replaced by a scripted one.
+"""
+import threading
+import time
+import unittest
+
+import requests
+
+from hyperliquid_client import CircuitOpenError, HyperliquidAPIError, HyperliquidInfoClient
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+    content = b'{}'
+    text = '{}'
+
+    def json(self):
+        return {}
+
+
+class FakeSession:
+    """
+    Stand-in for requests.Session whose post() runs `behaviour` (raise or return).
+    """
+
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, json=None, timeout=None):
+        with self.lock:
+            self.calls += 1
+        return self.behaviour()
+
+
+def fail():
+    raise requests.ConnectionError("refused")
+
+
+def client(behaviour, **kwargs):
+    kwargs = dict(dict(limiter=None, max_retries=0, backoff_base=0.001, breaker_threshold=2,
+                       breaker_cooldown=0.1), **kwargs)
+    c = HyperliquidInfoClient('http://127.0.0.1:1', **kwargs)
+    c.session = FakeSession(behaviour)
+    return c
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def open_circuit(self, c):
+        for _ in range(c.breaker_threshold):
+            with self.assertRaises(HyperliquidAPIError):
+                c.meta()
+        self.assertTrue(c.circuit_open)
+
+    def test_open_circuit_fails_fast(self):
+        c = client(fail)
+        self.open_circuit(c)
+        calls = c.session.calls
+        with self.assertRaises(CircuitOpenError):
+            c.meta()
+        self.assertEqual(c.session.calls, calls)
+
+    def test_half_open_lets_one_trial_through(self):
+        c = client(fail)
+        self.open_circuit(c)
+        time.sleep(c.breaker_cooldown)
+
+        calls = c.session.calls
+        release = threading.Event()
+        c.session.behaviour = lambda: release.wait(5) and FakeResponse()
+        outcomes = []
+
+        def call():
+            try:
+                c.meta()
+                outcomes.append('ok')
+            except CircuitOpenError:
+                outcomes.append('rejected')
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        # Every caller but the trial is turned away while it is in flight
+        deadline = time.monotonic() + 5
+        while outcomes.count('rejected') < 7 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(c.session.calls, calls + 1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(outcomes), ['ok'] + ['rejected'] * 7)
+        self.assertFalse(c.circuit_open)
+
+    def test_failed_trial_opens_the_circuit_again(self):
+        c = client(fail, max_retries=3)
+        self.open_circuit(c)
+        time.sleep(c.breaker_cooldown)
+        calls = c.session.calls
+        with self.assertRaises(HyperliquidAPIError):
+            c.meta()
+        # One attempt, no retries
+        self.assertEqual(c.session.calls, calls + 1)
+        self.assertTrue(c.circuit_open)
+        with self.assertRaises(CircuitOpenError):
+            c.meta()
+
+    def test_retries_stop_once_another_request_opens_the_circuit(self):
+        def fail_and_open():
+            # Meanwhile, other requests push the breaker over its threshold
+            for _ in range(c.breaker_threshold):
+                c._record_outcome(False)
+            fail()
+
+        c = client(fail_and_open, max_retries=5)
+        with self.assertRaises(CircuitOpenError):
+            c.meta()
+        self.assertEqual(c.session.calls, 1)
+
+    def test_transport_errors_become_api_errors(self):
+        for error in (requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError):
+            def broken():
+                raise error("broken body")
+            c = client(broken, max_retries=1, breaker_threshold=10)
+            with self.assertRaises(HyperliquidAPIError) as caught:
+                c.meta()
+            self.assertIn(error.__name__, str(caught.exception))
+            self.assertEqual(c.session.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
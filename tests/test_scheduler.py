@@ -0,0 +1,139 @@
+"""
+FetchScheduler priorities and the FetchQueue's deferral and backoff, on a
+small funding store with scripted range fetchers.
+"""
+import os
+import tempfile
+import time
+import unittest
+
+import pandas as pd
+
+import clock
+from completeness import HOUR_MS, CompletenessIndex
+from scheduler import (EMPTY_RETRY_MAX_HOURS, PRIORITY_BACKFILL, PRIORITY_LATEST, PRIORITY_RECENT, Dataset,
+                       FetchQueue, FetchScheduler, WorkItem)
+from schema import FUNDING_SCHEMA
+from storage import PartitionedStore
+
+H = 480000  # Exclusive end of the hours to collect, in epoch hours
+RETENTION_HOURS = 48
+
+
+def ms(hour):
+    return hour * HOUR_MS
+
+
+def funding_rows(coin, hours):
+    return [{'coin': coin, 'fundingRate': 1e-5, 'premium': 0.0, 'time': ms(hour)} for hour in hours]
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = os.path.join(tmp.name, 'data', 'funding')
+        self.store = PartitionedStore(root, FUNDING_SCHEMA,
+                                      index=CompletenessIndex(os.path.join(root, 'completeness.npz'), RETENTION_HOURS))
+        self.queue_path = os.path.join(tmp.name, 'data', 'fetch_queue.json')
+        clock.freeze(ms(H) / 1000 + 60)
+        self.addCleanup(clock.freeze, None)
+        self.requests = []
+
+        # The window is [H - 49, H - 1). BTC misses one recent and one old hour; ETH has nothing before H - 10
+        hours = [hour for hour in range(H - RETENTION_HOURS - 1, H - 1) if hour not in (H - 5, H - 40)]
+        self.store.append(pd.DataFrame(funding_rows('BTC', hours) + funding_rows('ETH', range(H - 10, H - 1))))
+
+    def fetch(self, coin, start_ms, end_ms):
+        self.requests.append((coin, start_ms, end_ms))
+        if coin == 'EMPTY':
+            return []
+        return funding_rows(coin, range(start_ms // HOUR_MS, end_ms // HOUR_MS))
+
+    def scheduler(self, **kwargs):
+        dataset = Dataset('funding', self.store, self.fetch, page_hours=4, end_ms=ms(H))
+        return FetchScheduler([dataset], queue=FetchQueue(self.queue_path), max_workers=2, **kwargs)
+
+    def test_plan_orders_by_priority(self):
+        items = self.scheduler().plan(['BTC', 'ETH'], recent_hours=24)
+        self.assertEqual([item.priority for item in items], sorted(item.priority for item in items))
+        btc = [(item.start_ms, item.end_ms, item.priority) for item in items if item.coin == 'BTC']
+        self.assertEqual(sorted(btc), [
+            (ms(H - 40), ms(H - 39), PRIORITY_BACKFILL),
+            (ms(H - 5), ms(H - 4), PRIORITY_RECENT),
+            (ms(H - 1), ms(H), PRIORITY_LATEST),
+        ])
+        eth = [item for item in items if item.coin == 'ETH']
+        self.assertEqual(eth[0], WorkItem('funding', 'ETH', ms(H - 1), ms(H), PRIORITY_LATEST))
+        self.assertEqual([item[2:] for item in eth[1:]], [(ms(H - 24), ms(H - 10), PRIORITY_RECENT),
+                                                          (ms(H - 49), ms(H - 24), PRIORITY_BACKFILL)])
+        # Newest hours first within a priority
+        recent = [item.coin for item in items if item.priority == PRIORITY_RECENT]
+        self.assertEqual(recent, ['BTC', 'ETH'])
+
+        self.assertEqual([item.priority for item in self.scheduler().plan(['BTC'], backfill=False)],
+                         [PRIORITY_LATEST, PRIORITY_RECENT])
+
+    def test_run_fills_the_holes(self):
+        scheduler = self.scheduler()
+        summary = scheduler.run(scheduler.plan(['BTC', 'ETH']))
+        self.assertEqual(summary['failed'] + summary['deferred'] + summary['skipped'], 0)
+        self.assertEqual(summary['fetched']['latest'], 2)
+        self.assertEqual(self.store.index.plan_repairs(['BTC', 'ETH'], ms(H - RETENTION_HOURS), ms(H)), [])
+        self.assertEqual(self.scheduler().plan(['BTC', 'ETH']), [])
+
+    def test_deadline_defers_work_to_the_next_run(self):
+        scheduler = self.scheduler(deadline=time.monotonic() - 1)
+        items = scheduler.plan(['ETH'], recent_hours=24)
+        summary = scheduler.run(items)
+        self.assertEqual(summary['deferred'], len(items))
+        self.assertEqual(self.requests, [])
+
+        # The next run loads the deferred work and puts it ahead of newer work of its priority
+        clock.freeze(ms(H) / 1000 + 120)
+        self.assertEqual(set(FetchQueue(self.queue_path).deferred), {item[:4] for item in items})
+        later = self.scheduler()
+        planned = later.plan(['BTC', 'ETH'], recent_hours=24)
+        self.assertEqual([(item.coin, item.priority) for item in planned], [
+            ('ETH', PRIORITY_LATEST), ('BTC', PRIORITY_LATEST),
+            ('ETH', PRIORITY_RECENT), ('BTC', PRIORITY_RECENT),
+            ('ETH', PRIORITY_BACKFILL), ('BTC', PRIORITY_BACKFILL),
+        ])
+
+        later.run(planned)
+        self.assertEqual(FetchQueue(self.queue_path).deferred, {})
+
+    def test_unfilled_ranges_back_off(self):
+        scheduler = self.scheduler()
+        latest = WorkItem('funding', 'EMPTY', ms(H - 1), ms(H), PRIORITY_LATEST)
+        recent = WorkItem('funding', 'EMPTY', ms(H - 3), ms(H - 1), PRIORITY_RECENT)
+        scheduler.run([latest, recent])
+        self.assertEqual(len(self.requests), 2)
+        queue = FetchQueue(self.queue_path)
+        self.assertEqual(queue.backoff[recent[:4]], (1, ms(H) + 60 * 1000 + HOUR_MS))
+
+        # Within the backoff only the latest hour is asked for again
+        summary = self.scheduler().run([latest, recent])
+        self.assertEqual(summary['skipped'], 1)
+        self.assertEqual(len(self.requests), 3)
+
+        # The delay doubles with every attempt, up to the cap
+        for _ in range(12):
+            queue.note_unfilled(recent, 0)
+        attempts, not_before = queue.backoff[recent[:4]]
+        self.assertEqual((attempts, not_before), (13, EMPTY_RETRY_MAX_HOURS * HOUR_MS))
+
+    def test_prune_forgets_ranges_outside_every_window(self):
+        queue = FetchQueue(self.queue_path)
+        old = ('funding', 'BTC', ms(H - 100), ms(H - 99))
+        new = ('funding', 'BTC', ms(H - 2), ms(H - 1))
+        queue.deferred = {old: 1, new: 2}
+        queue.backoff = {old: (1, 0), new: (1, 0)}
+        queue.prune(ms(H - 50))
+        self.assertEqual(list(queue.deferred), [new])
+        self.assertEqual(list(queue.backoff), [new])
+
+
+if __name__ == '__main__':
+    unittest.main()
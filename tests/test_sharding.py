@@ -0,0 +1,111 @@
+"""
+Runs several `--shard i/N` collectors at once against one data directory and
+the local stand-in, then merges them and compares the result with a single
+collection run.
+"""
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from conftest import ROOT
+from registry import CoinRegistry
+from schema import CoinDictionary
+from sharding import SHARDS_DIR
+from standin import StandinConfig, serve
+from storage import FUNDING_DIR, OHLCV_DIR, funding_store, ohlcv_store
+from synthetic import HOUR_MS, SyntheticMarket
+
+SHARDS = 3
+COINS = 12
+DAYS = 3
+
+
+def file_digest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def read_rows(store):
+    df = store.read()
+    df['coin'] = df['coin'].astype(str)
+    return df.sort_values(list(store.key)).reset_index(drop=True)
+
+
+class ConcurrentShardsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.hour = int(time.time() * 1000) // HOUR_MS
+        self.server = serve(SyntheticMarket(COINS, DAYS, self.hour), StandinConfig())
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def collector(self, data_root, *args):
+        env = dict(os.environ, HYPERLIQUID_API_URL=self.server.url)
+        return subprocess.Popen([sys.executable, os.path.join(ROOT, 'market_data_collector.py'), *args],
+                                cwd=data_root, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    def run_collector(self, data_root, *args):
+        self.finish(self.collector(data_root, *args))
+
+    def finish(self, process):
+        output, _ = process.communicate(timeout=300)
+        self.assertEqual(process.returncode, 0, output)
+
+    def test_shards_leave_shared_files_to_the_merge(self):
+        sharded = os.path.join(self.tmp.name, 'sharded')
+        single = os.path.join(self.tmp.name, 'single')
+        os.makedirs(sharded)
+        os.makedirs(single)
+        shared = [os.path.join(sharded, 'data', name) for name in ('universe.json', 'coins.json')]
+
+        # A first run gives the shared files something to protect
+        self.run_collector(sharded, 'volume')
+        self.run_collector(single, 'volume')
+        before = [file_digest(path) for path in shared]
+        self.assertNotIn(None, before)
+
+        for process in [self.collector(sharded, '--shard', f"{index}/{SHARDS}") for index in range(SHARDS)]:
+            self.finish(process)
+        self.assertEqual([file_digest(path) for path in shared], before)
+        for index in range(SHARDS):
+            out = os.path.join(sharded, SHARDS_DIR, f"{index}-of-{SHARDS}")
+            self.assertTrue(os.path.exists(os.path.join(out, 'shard.json')))
+            self.assertTrue(os.path.exists(os.path.join(out, 'universe.json')))
+
+        self.run_collector(sharded, 'merge')
+        self.run_collector(single)
+        if int(time.time() * 1000) // HOUR_MS != self.hour:
+            self.skipTest("the hour changed between the sharded and the single run")
+
+        self.assertEqual(os.listdir(os.path.join(sharded, SHARDS_DIR)), [])
+        first_rows = {}
+        for make_store, root in ((funding_store, FUNDING_DIR), (ohlcv_store, OHLCV_DIR)):
+            store = make_store(os.path.join(sharded, root))
+            merged = read_rows(store)
+            expected = read_rows(make_store(os.path.join(single, root)))
+            self.assertGreater(len(expected), 0)
+            self.assertTrue(merged.equals(expected), root)
+            for coin, time_ms in merged.groupby('coin')[store.time_column].min().items():
+                first_rows[coin] = min(first_rows.get(coin, time_ms), time_ms)
+
+        registries = [CoinRegistry(os.path.join(root, 'data', 'universe.json'),
+                                   dictionary=CoinDictionary(os.path.join(root, 'data', 'coins.json')))
+                      for root in (sharded, single)]
+        self.assertEqual(sorted(registries[0].active_coins()), sorted(registries[1].active_coins()))
+        self.assertEqual(len(registries[0].active_coins()), COINS)
+        # The merge dates every merged coin from its first row
+        self.assertEqual({coin: entry['first_seen'] for coin, entry in registries[0].coins.items()},
+                         {coin: int(time_ms) // HOUR_MS for coin, time_ms in first_rows.items()})
+        self.assertEqual(sorted(registries[0].dictionary.coins), sorted(registries[1].dictionary.coins))
+
+
+if __name__ == '__main__':
+    unittest.main()
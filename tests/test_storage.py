@@ -0,0 +1,82 @@
+"""
+PartitionedStore's journal: upserts across segments, compaction and
+retention, with the clock frozen.
+"""
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+import pandas as pd
+
+import clock
+from completeness import HOUR_MS
+from storage import DAY_MS, funding_store
+
+D = 20000  # An epoch day to build the cases around
+
+
+def rows(coin, hours, rate):
+    return pd.DataFrame({'coin': coin, 'fundingRate': rate, 'premium': 0.0,
+                         'time': [D * DAY_MS + hour * HOUR_MS for hour in hours]})
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = funding_store(os.path.join(tmp.name, 'data', 'funding'))
+        self.now = D * DAY_MS / 1000 + 3 * 86400
+        clock.freeze(self.now)
+        self.addCleanup(clock.freeze, None)
+
+    def rates(self):
+        df = self.store.read()
+        return {(coin, int(t) // HOUR_MS - D * 24): float(rate)
+                for coin, t, rate in zip(df['coin'].astype(str), df['time'], df['fundingRate'])}
+
+    def test_later_segment_wins(self):
+        self.store.write(rows('BTC', [0, 1, 2], 1.0))
+        self.store.append(rows('BTC', [1, 2], 2.0))
+        self.store.append(rows('BTC', [2, 30], 3.0))
+        expected = {('BTC', 0): 1.0, ('BTC', 1): 2.0, ('BTC', 2): 3.0, ('BTC', 30): 3.0}
+        self.assertEqual(self.rates(), expected)
+
+        self.assertEqual(self.store.compact(), 2)
+        self.assertEqual(self.store.segments(), [])
+        self.assertEqual(len(self.store.partitions()), 2)
+        self.assertEqual(self.rates(), expected)
+
+    def test_segments_sort_in_write_order_when_the_clock_goes_back(self):
+        self.store.append(rows('BTC', [0], 1.0))
+        clock.freeze(self.now - 3600)
+        self.store.append(rows('BTC', [0], 2.0))
+        self.assertEqual(self.rates(), {('BTC', 0): 2.0})
+        self.store.compact()
+        self.assertEqual(self.rates(), {('BTC', 0): 2.0})
+
+    def test_compaction_due_follows_the_clock(self):
+        self.store.append(rows('BTC', [0], 1.0))
+        self.assertFalse(self.store.compaction_due(max_age=timedelta(hours=1)))
+        clock.freeze(self.now + 3600)
+        self.assertTrue(self.store.compaction_due(max_age=timedelta(hours=1)))
+
+    def test_drop_before_drops_journal_rows_of_dropped_partitions(self):
+        self.store.write(rows('BTC', [0, 24], 1.0))
+        self.store.append(rows('BTC', [1, 23], 2.0))
+        self.store.append(rows('ETH', [5, 25, 49], 3.0))
+        self.store.append(rows('ETH', [30], 4.0))
+
+        self.assertEqual(len(self.store.drop_before(D * DAY_MS + 36 * HOUR_MS)), 1)
+        self.assertEqual(len(self.store.segments()), 2)
+        expected = {('BTC', 24): 1.0, ('ETH', 25): 3.0, ('ETH', 30): 4.0, ('ETH', 49): 3.0}
+        self.assertEqual(self.rates(), expected)
+        # Compaction does not bring the dropped day back
+        self.store.compact()
+        self.assertEqual(self.store.partitions(), [date(1970, 1, 1) + timedelta(days=D + n) for n in (1, 2)])
+        self.assertEqual(self.rates(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Runs the streaming collector against the local WebSocket stand-in, with both
+clocks shifted to just before an hour boundary.
+"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from storage import FUNDING_DIR, OHLCV_DIR, candle_to_ohlcv_row, funding_store, ohlcv_store
+from streaming import StreamingCollector
+from synthetic import HOUR_MS, SyntheticMarket
+from ws_standin import serve
+
+COINS = 4
+# Seconds of streaming before the hour boundary
+LEAD = 1.5
+
+
+def recording(append, calls):
+    def wrapper(df):
+        calls.append((len(df), threading.current_thread().name))
+        return append(df)
+    return wrapper
+
+
+class StreamingCollectorTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.hour = int(time.time() * 1000) // HOUR_MS + 1
+        offset = self.hour * HOUR_MS / 1000 - LEAD - time.time()
+        self.clock = lambda: time.time() + offset
+        self.market = SyntheticMarket(COINS, 2, self.hour + 1)
+        self.server = serve(self.market, interval=0.1, clock=self.clock)
+        self.addCleanup(self.server.shutdown)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.funding = funding_store(os.path.join(tmp.name, FUNDING_DIR))
+        self.ohlcv = ohlcv_store(os.path.join(tmp.name, OHLCV_DIR))
+        self.appends = {'funding': [], 'ohlcv': []}
+        self.funding.append = recording(self.funding.append, self.appends['funding'])
+        self.ohlcv.append = recording(self.ohlcv.append, self.appends['ohlcv'])
+
+    async def test_bars_and_prints_are_flushed_once_per_hour_off_the_loop(self):
+        collector = StreamingCollector(self.market.coins, self.funding, self.ohlcv, url=self.server.url,
+                                       flush_grace=0.2, clock=self.clock)
+        stop = asyncio.Event()
+        run = asyncio.create_task(collector.run(stop))
+
+        # Candles of the hour before the boundary arrive, but nothing is stored yet
+        await asyncio.sleep(LEAD - 0.5)
+        self.assertEqual(len(collector.book.bars), COINS)
+        self.assertEqual(self.appends, {'funding': [], 'ohlcv': []})
+
+        # The first candle of the new hour closes each bar; the hour timer stores them in one go
+        deadline = time.monotonic() + 10
+        while not (self.appends['ohlcv'] and self.appends['funding']) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        stop.set()
+        await run
+
+        self.assertEqual([rows for rows, _ in self.appends['ohlcv']], [COINS])
+        self.assertEqual([rows for rows, _ in self.appends['funding']], [COINS])
+        threads = {thread for calls in self.appends.values() for _, thread in calls}
+        self.assertTrue(all(thread.startswith('stream-store') for thread in threads), threads)
+
+        bars = self.ohlcv.read()
+        previous_ms = (self.hour - 1) * HOUR_MS
+        for coin in self.market.coins:
+            expected = candle_to_ohlcv_row(coin, self.market.candle_records(coin, previous_ms, previous_ms, 1)[0])
+            row = bars[bars['coin'] == coin].iloc[0]
+            self.assertEqual(int(row['time']), previous_ms)
+            self.assertAlmostEqual(row['close_price'], expected['close_price'], places=4)
+            self.assertAlmostEqual(row['volume_usd'] / expected['volume_usd'], 1, places=5)
+
+        prints = self.funding.read()
+        self.assertEqual(sorted(prints['time'].astype('int64').unique()), [self.hour * HOUR_MS])
+        _, ctxs = self.market.meta_and_asset_ctxs(previous_ms)
+        expected = {coin: float(ctx['funding']) for coin, ctx in zip(self.market.coins, ctxs)}
+        for coin, rate in zip(prints['coin'].astype(str), prints['fundingRate']):
+            self.assertAlmostEqual(rate, expected[coin], places=9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import numpy as np
+
+from completeness import HOUR_MS
+
+# Rows are keyed by (coin_id << TIME_BITS) | time, which sorts like (coin_id, time).
+# 43 bits of milliseconds reach the year 2248; coin ids get the remaining 20 bits.
+TIME_BITS = 43
+TIME_LIMIT = 1 << TIME_BITS
+
+
+def row_keys(coin_ids, times):
+    """
+    Combine coin ids and times (ms) into int64 keys that sort like (coin_id, time).
+    """
+    return (np.asarray(coin_ids, dtype=np.int64) << TIME_BITS) | np.asarray(times, dtype=np.int64)
+
+
+class TimeSeriesStore:
+    """
+    In-memory rows sorted by (coin id, time) with one row per key.
+
+    Times are in ms, so rows are also in (coin id, hour) order and every
+    coin's rows form one contiguous block located by the offset table.
+    Reading one coin, or one coin over a time window, is a binary search
+    that returns a slice (array views, no copy); a window over several coins
+    is one binary search per coin. Upserting a batch of rows is a sorted
+    merge: rows with an existing key are replaced in place and the others
+    are inserted at their positions in one pass.
+
+    Args:
+        coins: int32 coin ids, sorted together with times
+        times: int64 times in ms
+        columns: Column name -> array of values aligned with the rows
+    """
+
+    def __init__(self, coins, times, columns=None):
+        self.coins = np.asarray(coins, dtype=np.int32)
+        self.times = np.asarray(times, dtype=np.int64)
+        self.columns = dict(columns or {})
+        self.keys = row_keys(self.coins, self.times)
+        self._offsets = None
+
+    @classmethod
+    def from_arrays(cls, coins, times, columns=None):
+        """
+        Build a store from rows in any order. Of several rows with the same
+        (coin, time), the last one wins.
+        """
+        keys = row_keys(coins, times)
+        if len(keys) > 1 and not np.all(keys[1:] > keys[:-1]):
+            # Stable, so equal keys keep their input order; runs of already
+            # sorted rows (e.g. day partitions) are merged rather than re-sorted
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            last = np.flatnonzero(np.r_[keys[1:] != keys[:-1], True])
+            order = order[last]
+            coins = np.asarray(coins)[order]
+            times = np.asarray(times)[order]
+            columns = {name: np.asarray(values)[order] for name, values in (columns or {}).items()}
+        return cls(coins, times, columns)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def offsets(self):
+        """
+        Offset table: rows of coin id i are [offsets[i], offsets[i + 1]).
+        """
+        if self._offsets is None:
+            n_ids = int(self.coins[-1]) + 1 if len(self.coins) else 0
+            self._offsets = np.searchsorted(self.coins, np.arange(n_ids + 1, dtype=np.int32))
+        return self._offsets
+
+    def coin_ids(self):
+        """
+        Return the ids of the coins that have rows.
+        """
+        return np.flatnonzero(np.diff(self.offsets))
+
+    # ---------------- reads ----------------
+
+    def coin_slice(self, coin_id, start_ms=None, end_ms=None):
+        """
+        Return the slice of a coin's rows with start_ms <= time < end_ms.
+        """
+        offsets = self.offsets
+        if not 0 <= coin_id < len(offsets) - 1:
+            return slice(0, 0)
+        lo, hi = int(offsets[coin_id]), int(offsets[coin_id + 1])
+        times = self.times[lo:hi]
+        if start_ms is not None:
+            lo += int(np.searchsorted(times, start_ms))
+        if end_ms is not None:
+            hi = lo + int(np.searchsorted(self.times[lo:hi], end_ms))
+        return slice(lo, hi)
+
+    def select(self, start_ms=None, end_ms=None, coin_ids=None):
+        """
+        Locate the rows with start_ms <= time < end_ms, optionally only for some coins.
+
+        Returns:
+            A slice when the rows are contiguous (no restriction, or one coin),
+            otherwise an int64 array of row positions in (coin, time) order
+        """
+        if start_ms is None and end_ms is None and coin_ids is None:
+            return slice(0, len(self))
+        ids = self.coin_ids() if coin_ids is None else np.unique(np.asarray(coin_ids, dtype=np.int64))
+        if len(ids) == 1:
+            return self.coin_slice(int(ids[0]), start_ms, end_ms)
+        lo = np.searchsorted(self.keys, row_keys(ids, 0 if start_ms is None else max(start_ms, 0)))
+        hi = np.searchsorted(self.keys, row_keys(ids + 1, 0) if end_ms is None else row_keys(ids, max(end_ms, 0)))
+        lengths = np.maximum(hi - lo, 0)
+        # Concatenated ranges [lo, hi) without a Python loop
+        starts = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+        return starts + np.arange(int(lengths.sum()), dtype=np.int64)
+
+    def view(self, rows=slice(None), columns=None):
+        """
+        Return the selected rows as a dict of arrays: 'coin', 'time' and the
+        value columns. A slice gives views into the store.
+        """
+        names = list(self.columns) if columns is None else [name for name in columns if name in self.columns]
+        arrays = {'coin': self.coins[rows], 'time': self.times[rows]}
+        arrays.update({name: self.columns[name][rows] for name in names})
+        return arrays
+
+    def take(self, rows):
+        """
+        Return a store of the selected rows (positions in ascending order).
+        """
+        return TimeSeriesStore(self.coins[rows], self.times[rows],
+                               {name: values[rows] for name, values in self.columns.items()})
+
+    def last_per_hour(self):
+        """
+        Return the positions of the last row of every (coin, hour): exchange
+        timestamp jitter can put several rows in one hour, and the latest wins.
+        """
+        if not len(self):
+            return np.zeros(0, dtype=np.int64)
+        hours = self.times // HOUR_MS
+        return np.flatnonzero(np.r_[(self.coins[1:] != self.coins[:-1]) | (hours[1:] != hours[:-1]), True])
+
+    # ---------------- writes ----------------
+
+    def upsert(self, other):
+        """
+        Merge another store's rows into this one; rows with a key already
+        present replace it.
+
+        Returns:
+            Tuple of (rows inserted, rows replaced)
+        """
+        if not len(other):
+            return 0, 0
+        positions = np.searchsorted(self.keys, other.keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == other.keys[found]
+        for name, values in self.columns.items():
+            values[positions[found]] = other.columns[name][found]
+        new = ~found
+        if new.any():
+            at = positions[new]
+            self.keys = np.insert(self.keys, at, other.keys[new])
+            self.coins = np.insert(self.coins, at, other.coins[new])
+            self.times = np.insert(self.times, at, other.times[new])
+            self.columns = {name: np.insert(values, at, other.columns[name][new])
+                            for name, values in self.columns.items()}
+            self._offsets = None
+        return int(new.sum()), int(found.sum())